@@ -91,6 +91,43 @@ def get_attention_mask(encoder: Attendable) -> Optional[tf.Tensor]:
         raise AssertionError("Unknown encoder type")
 
 
+def tile_to_query_batch(attendable: tf.Tensor,
+                        query: tf.Tensor) -> tf.Tensor:
+    """Tile an encoder-side tensor to match the batch size of the query.
+
+    During beam search, the decoder runs on ``beam_size`` hypotheses for each
+    sentence. The hypotheses are stored beam-major, i.e. the hypothesis ``k``
+    of the sentence ``b`` is on the row ``k * batch_size + b``. This function
+    repeats the (batch-sized) encoder states so they are aligned with the
+    rows of the query. When the batch sizes already match, the tensor is
+    returned unchanged.
+
+    Arguments:
+        attendable: A tensor whose first dimension is the encoder batch.
+        query: A tensor whose first dimension is the decoder batch.
+
+    Returns:
+        The attendable tensor tiled along the first dimension.
+    """
+    query_batch_size = tf.shape(query)[0]
+    attendable_batch_size = tf.shape(attendable)[0]
+
+    modulo = tf.mod(query_batch_size, attendable_batch_size)
+    with tf.control_dependencies([tf.assert_equal(modulo, 0)]):
+        multiple = tf.div(query_batch_size, attendable_batch_size)
+
+    # pylint: disable=no-member
+    static_shape = attendable.get_shape()
+    # pylint: enable=no-member
+    multiples = tf.concat([tf.expand_dims(multiple, 0),
+                           tf.ones([static_shape.ndims - 1], dtype=tf.int32)],
+                          0)
+
+    tiled = tf.tile(attendable, multiples)
+    tiled.set_shape(tf.TensorShape([None]).concatenate(static_shape[1:]))
+    return tiled
+
+
 class BaseAttention(ModelPart):
     def __init__(self,
                  name: str,
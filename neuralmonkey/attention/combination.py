@@ -20,7 +20,8 @@ import tensorflow as tf
 
 from neuralmonkey.attention.base_attention import (
     BaseAttention, AttentionLoopStateTA, empty_attention_loop_state,
-    get_attention_states, get_attention_mask, Attendable)
+    get_attention_states, get_attention_mask, tile_to_query_batch,
+    Attendable)
 from neuralmonkey.checking import assert_shape
 
 
@@ -217,7 +218,7 @@ class FlatMultiAttention(MultiAttention):
 
             for proj, bias in zip(self.encoder_projections_for_logits,
                                   self.encoder_attn_biases):
-
+                proj = tile_to_query_batch(proj, query)
                 logits.append(tf.reduce_sum(
                     self.attn_v * tf.tanh(projected_state + proj), [2]) + bias)
 
@@ -229,20 +230,19 @@ class FlatMultiAttention(MultiAttention):
                     projected_state, sentinel_value, scope="sentinel")
                 logits.append(sentinel_logit)
 
-            attentions = self._renorm_softmax(tf.concat(logits, 1))
+            attentions = self._renorm_softmax(tf.concat(logits, 1), query)
 
             self.attentions_in_time.append(attentions)
 
-            if self._use_sentinels:
-                tiled_encoder_projections = self._tile_encoders_for_beamsearch(
-                    projected_sentinel)
+            tiled_encoder_projections = [
+                tile_to_query_batch(proj, query)
+                for proj in self.encoder_projections_for_ctx]
 
+            if self._use_sentinels:
                 projections_concat = tf.concat(
                     tiled_encoder_projections + [projected_sentinel], 1)
-
             else:
-                projections_concat = tf.concat(
-                    self.encoder_projections_for_ctx, 1)
+                projections_concat = tf.concat(tiled_encoder_projections, 1)
 
             contexts = tf.reduce_sum(
                 tf.expand_dims(attentions, 2) * projections_concat, [1])
@@ -254,23 +254,10 @@ class FlatMultiAttention(MultiAttention):
             return contexts, next_loop_state
     # pylint: enable=too-many-locals
 
-    def _tile_encoders_for_beamsearch(self, projected_sentinel):
-        sentinel_batch_size = tf.shape(projected_sentinel)[0]
-        encoders_batch_size = tf.shape(
-            self.encoder_projections_for_ctx[0])[0]
-
-        modulo = tf.mod(sentinel_batch_size, encoders_batch_size)
-
-        with tf.control_dependencies([tf.assert_equal(modulo, 0)]):
-            beam_size = tf.div(sentinel_batch_size,
-                               encoders_batch_size)
-
-        return [tf.tile(proj, [beam_size, 1, 1])
-                for proj in self.encoder_projections_for_ctx]
-
-    def _renorm_softmax(self, logits):
+    def _renorm_softmax(self, logits, query):
         """Renormalized softmax wrt. attention mask."""
-        softmax_concat = tf.nn.softmax(logits) * self.masks_concat
+        masks_concat = tile_to_query_batch(self.masks_concat, query)
+        softmax_concat = tf.nn.softmax(logits) * masks_concat
         norm = tf.reduce_sum(softmax_concat, 1, keep_dims=True) + 1e-8
         attentions = softmax_concat / norm
 
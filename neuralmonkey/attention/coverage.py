@@ -8,7 +8,8 @@ introduced by Bahdanau et al. (2015)
 import tensorflow as tf
 from typeguard import check_argument_types
 
-from neuralmonkey.attention.base_attention import Attendable
+from neuralmonkey.attention.base_attention import (
+    Attendable, tile_to_query_batch)
 from neuralmonkey.attention.feed_forward import Attention
 
 
@@ -41,10 +42,14 @@ class CoverageAttention(Attention):
             lambda: tf.reduce_sum(weights_in_time.stack(), axis=0),
             lambda: 0.0)
 
-        coverage = weight_sum / self.fertility * self.attention_mask
+        fertility = tile_to_query_batch(self.fertility, y)
+        attention_mask = tile_to_query_batch(self.attention_mask, y)
+        hidden_features = tile_to_query_batch(self.hidden_features, y)
+
+        coverage = weight_sum / fertility * attention_mask
         logits = tf.reduce_sum(
             self.similarity_bias_vector * tf.tanh(
-                self.hidden_features + y + self.coverage_weights *
+                hidden_features + y + self.coverage_weights *
                 tf.expand_dims(tf.expand_dims(coverage, -1), -1)),
             [2, 3])
 
@@ -11,7 +11,8 @@ from typeguard import check_argument_types
 
 from neuralmonkey.attention.base_attention import (
     BaseAttention, AttentionLoopStateTA, empty_attention_loop_state,
-    get_attention_states, get_attention_mask, Attendable)
+    get_attention_states, get_attention_mask, tile_to_query_batch,
+    Attendable)
 from neuralmonkey.decorators import tensor
 from neuralmonkey.nn.utils import dropout
 from neuralmonkey.logging import log
@@ -113,8 +114,9 @@ class Attention(BaseAttention):
             self._att_states_reshaped, key_proj_reshaped, [1, 1, 1, 1], "SAME")
 
     def get_energies(self, y, _):
+        hidden_features = tile_to_query_batch(self.hidden_features, y)
         return tf.reduce_sum(
-            self.similarity_bias_vector * tf.tanh(self.hidden_features + y),
+            self.similarity_bias_vector * tf.tanh(hidden_features + y),
             [2, 3]) + self.bias_term
 
     def attention(self,
@@ -134,7 +136,8 @@ class Attention(BaseAttention):
         if self.attention_mask is None:
             weights = tf.nn.softmax(energies)
         else:
-            weights_all = tf.nn.softmax(energies) * self.attention_mask
+            attention_mask = tile_to_query_batch(self.attention_mask, query)
+            weights_all = tf.nn.softmax(energies) * attention_mask
             norm = tf.reduce_sum(weights_all, 1, keep_dims=True) + 1e-8
             weights = weights_all / norm
 
@@ -147,7 +150,7 @@ class Attention(BaseAttention):
         # Now calculate the attention-weighted vector d.
         context = tf.reduce_sum(
             tf.expand_dims(tf.expand_dims(weights, -1), -1)
-            * self._att_states_reshaped, [1, 2])
+            * tile_to_query_batch(self._att_states_reshaped, query), [1, 2])
         context = tf.reshape(context, [-1, self.context_vector_size])
 
         next_loop_state = AttentionLoopStateTA(
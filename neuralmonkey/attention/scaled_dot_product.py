@@ -14,7 +14,8 @@ from typeguard import check_argument_types
 
 from neuralmonkey.nn.utils import dropout
 from neuralmonkey.attention.base_attention import (
-    BaseAttention, Attendable, get_attention_states, get_attention_mask)
+    BaseAttention, Attendable, get_attention_states, get_attention_mask,
+    tile_to_query_batch)
 
 # pylint: disable=invalid-name
 MultiHeadLoopStateTA = NamedTuple("MultiHeadLoopStateTA",
@@ -104,6 +105,10 @@ class MultiHeadAttention(BaseAttention):
                               keys: tf.Tensor,
                               values: tf.Tensor) -> Tuple[tf.Tensor,
                                                           tf.Tensor]:
+        # During beam search, the queries are beam-times more than the keys
+        keys = tile_to_query_batch(keys, query)
+        values = tile_to_query_batch(values, query)
+
         # shape: batch, time (similarities of attention keys in batch and time
         # to the queries in the batch)
         dot_product = tf.reduce_sum(
@@ -113,7 +118,8 @@ class MultiHeadAttention(BaseAttention):
         weights = tf.nn.softmax(energies)
 
         if self.attention_mask is not None:
-            weights_all = weights * self.attention_mask
+            weights_all = weights * tile_to_query_batch(self.attention_mask,
+                                                        query)
             norm = tf.reduce_sum(weights_all, 1, keep_dims=True) + 1e-8
             weights = weights_all / norm
 
@@ -0,0 +1,457 @@
+"""Implementation of the base dataset class.
+
+The base dataset keeps all its series in the memory. It is also used for the
+batches of the other datasets, so the batching of datasets by the lengths of
+their examples is implemented here as well.
+"""
+
+import itertools
+import random
+import collections
+
+from typing import Any, List, Callable, Iterable, Dict, Optional, Tuple
+
+import numpy as np
+
+from neuralmonkey.readers.numpy_reader import ConcatenatedArray
+
+# pylint: disable=invalid-name
+Reader = Callable[[List[str]], Any]
+# pylint: enable=invalid-name
+
+# The default number of examples sorted together by the bucketing
+BUCKET_BUFFER_SIZE = 10000
+
+
+class Dataset(collections.Sized):
+    """Base Dataset class.
+
+    This class serves as collection for data series for particular
+    encoders and decoders in the model. If it is not provided a parent
+    dataset, it also manages the vocabularies inferred from the data.
+
+    A data series is either a list of strings or a numpy array.
+
+    The series are stored only once. Shuffled datasets, their batches and
+    subsets are views which share the series and keep only an array of
+    indices of their examples. The series of a view are gathered when
+    requested by ``get_series``. The text series converted to vocabulary
+    indices (see ``get_indexed_series``) are shared by the views as well.
+    """
+
+    def __init__(self, name: str, series: Dict[str, List],
+                 series_outputs: Dict[str, str],
+                 indices: np.ndarray = None,
+                 indexed_series: Dict[Tuple[str, int], Tuple] = None
+                 ) -> None:
+        """Create a dataset from the provided series of data.
+
+        The data is already preprocessed.
+
+        Arguments:
+            name: The name for the dataset
+            series: Dictionary from the series name to the actual data.
+            series_outputs: Output files for target series.
+            indices: Indices of the examples of the series that form the
+                dataset. If None, the dataset consists of all the examples
+                in their order.
+            indexed_series: The series converted to vocabulary indices,
+                shared with the dataset this one is a view of.
+        """
+        self.name = name
+        self._series = series
+        self.series_outputs = series_outputs
+        self._indices = indices
+        self._indexed_series = (
+            indexed_series if indexed_series is not None
+            else {})  # type: Dict[Tuple[str, int], Tuple]
+
+        self._check_series_lengths()
+
+    def _check_series_lengths(self) -> None:
+        """Check lenghts of series in the dataset.
+
+        Raises:
+            Exception when the lengths in the dataset do not match.
+        """
+        lengths = {s: len(v) for s, v in self._series.items()
+                   if isinstance(v, collections.Sized)}
+
+        if len(set(lengths.values())) > 1:
+            err_str = ["{}: {}".format(s, l) for s, l in lengths.items()]
+            raise Exception("Lengths of data series must be equal. Instead: {}"
+                            .format(", ".join(err_str)))
+
+    def __len__(self) -> int:
+        """Get the length of the dataset.
+
+        Returns:
+            The length of the dataset.
+        """
+        if self._indices is not None:
+            return len(self._indices)
+
+        if not self._series:
+            return 0
+
+        return len(next(iter(self._series.values())))
+
+    def has_series(self, name: str) -> bool:
+        """Check if the dataset contains a series of a given name.
+
+        Arguments:
+            name: Series name
+
+        Returns:
+            True if the dataset contains the series, False otherwise.
+        """
+        return name in self._series
+
+    def get_series(self, name: str, allow_none: bool = False) -> Iterable:
+        """Get the data series with a given name.
+
+        Arguments:
+            name: The name of the series to fetch.
+            allow_none: If True, return None if the series does not exist.
+
+        Returns:
+            The data series.
+
+        Raises:
+            KeyError if the series does not exists and allow_none is False
+        """
+        if allow_none and name not in self._series:
+            return None
+
+        series = self._series[name]
+        if self._indices is None:
+            return series
+
+        # memory-mapped arrays read only the rows of the view
+        if isinstance(series, (np.ndarray, ConcatenatedArray)):
+            return series[self._indices]
+        return [series[i] for i in self._indices]
+
+    def get_indexed_series(
+            self, name: str,
+            vocabulary: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get a text series converted to indices of a vocabulary.
+
+        The whole series is converted (using ``Vocabulary.index_series``)
+        when it is first requested from the dataset or any of its views and
+        the indices are reused afterwards, so the words of the examples are
+        looked up only once during the whole training. The vocabulary must
+        not change after the series is indexed.
+
+        Arguments:
+            name: The name of the series.
+            vocabulary: The vocabulary to index the series with.
+
+        Returns:
+            A tuple of a flat array of vocabulary indices, an array of the
+            start positions of the examples of the dataset in it and an
+            array of their lengths (see ``Vocabulary.indices_to_tensor``).
+        """
+        key = (name, id(vocabulary))
+        indexed = self._indexed_series.get(key)
+        # the identifier of a deleted vocabulary can be reused
+        if indexed is None or indexed[0] is not vocabulary:
+            indexed = (vocabulary,) + vocabulary.index_series(
+                self._series[name])
+            self._indexed_series[key] = indexed
+
+        _, indices, offsets = indexed
+        if self._indices is None:
+            starts, ends = offsets[:-1], offsets[1:]
+        else:
+            starts, ends = offsets[self._indices], offsets[self._indices + 1]
+        return indices, starts, ends - starts
+
+    @property
+    def series_ids(self) -> Iterable[str]:
+        return self._series.keys()
+
+    def _view(self, name: str, indices: np.ndarray,
+              series_outputs: Dict[str, str] = None) -> "Dataset":
+        """Create a dataset sharing the series with this one.
+
+        Arguments:
+            name: The name of the new dataset.
+            indices: Positions of the examples of this dataset that form the
+                new dataset.
+            series_outputs: Output files of the new dataset.
+
+        Returns:
+            The new dataset.
+        """
+        if self._indices is not None:
+            indices = self._indices[indices]
+
+        return Dataset(name, self._series,
+                       series_outputs if series_outputs is not None else {},
+                       indices, self._indexed_series)
+
+    def shuffle(self) -> None:
+        """Shuffle the dataset randomly.
+
+        Only the indices of the examples are permuted, the series stay in
+        place.
+        """
+        order = np.random.permutation(len(self))
+        if self._indices is not None:
+            order = self._indices[order]
+        self._indices = order
+
+    def batch_serie(self, serie_name: str,
+                    batch_size: int) -> Iterable[Iterable]:
+        """Split a data serie into batches.
+
+        Arguments:
+            serie_name: The name of the series
+            batch_size: The size of a batch
+
+        Returns:
+            Generator yielding batches of the data from the serie.
+        """
+        buf = []
+        for item in self.get_series(serie_name):
+            buf.append(item)
+            if len(buf) >= batch_size:
+                yield buf
+                buf = []
+        if buf:
+            yield buf
+
+    def batch_dataset(self, batch_size: int) -> Iterable["Dataset"]:
+        """Split the dataset into a list of batched datasets.
+
+        Arguments:
+            batch_size: The size of a batch.
+
+        Returns:
+            Generator yielding batched datasets.
+        """
+        for batch_index, start in enumerate(
+                range(0, len(self), batch_size)):
+            yield self._view(
+                self.name + "-batch-{}".format(batch_index),
+                np.arange(start, min(start + batch_size, len(self))))
+
+    def bucket_batch_dataset(
+            self, max_tokens: int,
+            buffer_size: Optional[int] = None) -> Iterable["Dataset"]:
+        """Split the dataset into batches of examples of similar lengths.
+
+        The examples are read in chunks of ``buffer_size`` examples. Each
+        chunk is sorted by the example lengths and cut into batches so that
+        the number of tokens in a batch, including padding, does not exceed
+        ``max_tokens``. The batches of a chunk are yielded in a random order.
+        The chunks are bounded, so the batches of a shuffled dataset are
+        composed differently in every epoch.
+
+        The length of an example is the length of its longest sequence (i.e.
+        list or tuple) item. If no series contains sequences, all examples
+        have length 1 and ``max_tokens`` is the number of examples in
+        a batch.
+
+        Arguments:
+            max_tokens: The maximum number of tokens (padded length times the
+                number of examples) in a batch. An example longer than this
+                forms a batch on its own.
+            buffer_size: The number of examples sorted together. If None,
+                ``BUCKET_BUFFER_SIZE`` examples are sorted together.
+
+        Returns:
+            Generator yielding batched datasets.
+        """
+        if buffer_size is None:
+            buffer_size = BUCKET_BUFFER_SIZE
+
+        # the examples are prefixed with their positions, which do not
+        # count in the example lengths
+        examples = zip(itertools.count(),
+                       *[self._iterate_series(key) for key in self._series])
+
+        batches = bucket_batches(examples, max_tokens, buffer_size)
+        for batch_index, batch in enumerate(batches):
+            yield self._view(self.name + "-batch-{}".format(batch_index),
+                             np.array([example[0] for example in batch]))
+
+    def _iterate_series(self, name: str) -> Iterable:
+        """Iterate over a series without gathering it to a new list."""
+        series = self._series[name]
+        if self._indices is None:
+            return iter(series)
+        return (series[i] for i in self._indices)
+
+    def add_series(self, name: str, series: List[Any]) -> None:
+        if name in self._series:
+            raise ValueError(
+                "Can't series that already exist: {}".format(name))
+
+        # the new series is aligned with the view, so the other series
+        # need to be gathered the same way
+        if self._indices is not None:
+            self._series = {key: self.get_series(key)
+                            for key in self._series}
+            self._indices = None
+            self._indexed_series = {}
+
+        self._series[name] = series
+
+    def subset(self, start: int, length: int) -> "Dataset":
+
+        # new name
+        subset_name = "{}.{}.{}".format(self.name, start, length)
+
+        # new outputs
+        subset_outputs = {k: "{}.{:010}".format(v, start)
+                          for k, v in self.series_outputs.items()}
+
+        # new series
+        end = min(start + length, len(self))
+        return self._view(subset_name, np.arange(start, max(start, end)),
+                          subset_outputs)
+
+
+def bucket_batches(examples: Iterable[Tuple], max_tokens: int,
+                   buffer_size: int) -> Iterable[List[Tuple]]:
+    """Read examples in buffers and split them into batches by length.
+
+    Arguments:
+        examples: The dataset examples (tuples of series items).
+        max_tokens: The maximum number of tokens in a batch including the
+            padding.
+        buffer_size: The number of examples sorted together.
+
+    Returns:
+        Generator yielding batches of the examples. The batches of
+        a buffer are yielded in a random order.
+    """
+    if max_tokens <= 0:
+        raise ValueError("The maximum number of tokens in a batch must "
+                         "be positive, was {}".format(max_tokens))
+
+    if buffer_size <= 0:
+        raise ValueError("The bucketing buffer size must be positive, was {}"
+                         .format(buffer_size))
+
+    examples = iter(examples)
+    while True:
+        buffer = list(itertools.islice(examples, buffer_size))
+        if not buffer:
+            break
+
+        batches = _bucket_examples(buffer, max_tokens)
+        random.shuffle(batches)
+        yield from batches
+
+
+def _example_length(example: Tuple) -> int:
+    """Get the length of the longest sequence item of a dataset example."""
+    lengths = [len(item) for item in example
+               if isinstance(item, (list, tuple))]
+    return max(lengths) if lengths else 1
+
+
+def _bucket_examples(examples: List[Tuple],
+                     max_tokens: int) -> List[List[Tuple]]:
+    """Group examples of similar lengths to batches limited by token count.
+
+    Arguments:
+        examples: List of dataset examples (tuples of series items).
+        max_tokens: The maximum number of tokens in a batch including the
+            padding.
+
+    Returns:
+        List of batches, each of them a list of examples.
+    """
+    lengths = [_example_length(ex) for ex in examples]
+    return [[examples[i] for i in batch]
+            for batch in bucket_lengths(lengths, max_tokens)]
+
+
+def bucket_lengths(lengths: List[int], max_tokens: int) -> List[List[int]]:
+    """Group examples of given lengths to batches limited by token count.
+
+    Arguments:
+        lengths: The lengths of the examples.
+        max_tokens: The maximum number of tokens in a batch including the
+            padding.
+
+    Returns:
+        List of batches, each of them a list of example indices.
+    """
+    # the sort is stable, so the examples of the same length stay in the
+    # (possibly shuffled) order of the dataset
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+    batches = []  # type: List[List[int]]
+    batch = []  # type: List[int]
+    for i in order:
+        # the examples are sorted, so the current one is the longest
+        if batch and (len(batch) + 1) * lengths[i] > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def shuffle_buffer(items: Iterable[Any], buffer_size: int,
+                   rng: random.Random) -> Iterable[Any]:
+    """Shuffle a stream of items using a buffer of a limited size.
+
+    The buffer is filled with the first items. Then, every further item
+    replaces a randomly chosen item in the buffer which is yielded.
+
+    Arguments:
+        items: The items to shuffle.
+        buffer_size: The number of items in the buffer.
+        rng: The random generator used for the shuffling.
+
+    Returns:
+        Generator yielding the shuffled items.
+    """
+    buffer = []  # type: List[Any]
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+
+        position = rng.randrange(buffer_size)
+        yield buffer[position]
+        buffer[position] = item
+
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def index_whole_series(
+        series: Iterable, vocabulary: Any) -> Tuple[np.ndarray, np.ndarray,
+                                                    np.ndarray]:
+    """Index a series without keeping the indices."""
+    indices, offsets = vocabulary.index_series(series)
+    return indices, offsets[:-1], offsets[1:] - offsets[:-1]
+
+
+def get_preprocess_series(
+        series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
+        preprocessors: Optional[List[Tuple[str, str, Callable]]]
+) -> Dict[str, Tuple[str, Callable]]:
+    """Map the series created by preprocessors to their sources."""
+    preprocess_series = {}  # type: Dict[str, Tuple[str, Callable]]
+    for src_id, tgt_id, func in preprocessors or []:
+        if src_id == tgt_id:
+            raise Exception(
+                "Attempt to rewrite series '{}'".format(src_id))
+        if src_id not in series_paths_and_readers:
+            raise Exception(
+                ("The source series ({}) of the '{}' preprocessor "
+                 "is not defined in the dataset.").format(
+                     src_id, str(func)))
+        preprocess_series[tgt_id] = (src_id, func)
+    return preprocess_series
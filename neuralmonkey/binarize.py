@@ -0,0 +1,47 @@
+"""Convert a dataset to the memory-mapped binary format.
+
+The dataset is described by a section of an INI file in the same way as in
+the experiment configuration, usually with the
+``dataset.load_dataset_from_files`` class. The converted dataset can be
+loaded using the ``dataset.load_binary_dataset`` class.
+"""
+
+import argparse
+import collections
+
+from neuralmonkey.logging import log
+from neuralmonkey.config.builder import instantiate_class
+from neuralmonkey.config.parsing import parse_file
+from neuralmonkey.binary_dataset import save_binary_dataset
+from neuralmonkey.dataset import Dataset
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("config", metavar="INI-FILE",
+                        help="the configuration file with the dataset")
+    parser.add_argument("section", metavar="SECTION",
+                        help="name of the section describing the dataset")
+    parser.add_argument("output", metavar="OUTPUT-DIR",
+                        help="directory to store the binary dataset to")
+    parser.add_argument("-s", "--set", type=str, metavar="SETTING",
+                        action="append", dest="config_changes", default=[],
+                        help="override an option in the configuration; the "
+                        "syntax is [section.]option=value")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f_config:
+        _, config_dict = parse_file(f_config, args.config_changes)
+
+    dataset = instantiate_class(args.section, config_dict,
+                                collections.OrderedDict(), 0)
+    if not isinstance(dataset, Dataset):
+        raise ValueError("Section '{}' does not describe a dataset"
+                         .format(args.section))
+
+    save_binary_dataset(dataset, args.output)
+    log("Dataset '{}' converted to '{}'".format(dataset.name, args.output))
+
+
+if __name__ == "__main__":
+    main()
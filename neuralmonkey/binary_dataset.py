@@ -0,0 +1,83 @@
+"""Storage of datasets in the binary format.
+
+The tokenized text series of a dataset are stored in the binary format of
+``readers.binary_reader`` in a directory, together with a JSON file with the
+name of the dataset and the list of its series. The binary datasets are
+created from the text ones using the ``neuralmonkey-binarize`` command and
+loaded using the ``dataset.load_binary_dataset`` class.
+"""
+
+import json
+import os
+
+from typing import Dict, Sequence, Tuple
+
+from typeguard import check_argument_types
+
+from neuralmonkey.base_dataset import Dataset
+from neuralmonkey.logging import log
+from neuralmonkey.readers.binary_reader import (load_binary_series,
+                                                save_binary_series)
+
+BINARY_DATASET_INFO = "dataset.json"
+
+
+def save_binary_dataset(dataset: Dataset, directory: str,
+                        chunk_size: int = 10000) -> None:
+    """Convert the tokenized text series of a dataset to the binary format.
+
+    The dataset is read series by series in a streaming fashion, so it can
+    also be a lazy dataset which does not fit in the memory.
+
+    Arguments:
+        dataset: The dataset to convert. All its series must contain
+            sentences as lists of string tokens.
+        directory: The directory to store the binary files to. It is created
+            if it does not exist.
+        chunk_size: Number of sentences written to the disk at once.
+
+    Raises:
+        ValueError if a series does not contain tokenized text.
+    """
+    check_argument_types()
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    series_ids = list(dataset.series_ids)
+    length = None
+    for series_id in series_ids:
+        series_length = save_binary_series(
+            dataset.get_series(series_id), directory, series_id, chunk_size)
+        log("Series '{}' with {} sentences saved to '{}'".format(
+            series_id, series_length, directory))
+
+        if length is not None and length != series_length:
+            raise ValueError("Lengths of data series must be equal.")
+        length = series_length
+
+    with open(os.path.join(directory, BINARY_DATASET_INFO), "w",
+              encoding="utf-8") as f_info:
+        json.dump({"name": dataset.name, "length": length,
+                   "series": series_ids}, f_info, indent=2)
+
+
+def read_binary_dataset(directory: str) -> Tuple[str, Dict[str, Sequence]]:
+    """Read a dataset stored in the binary format.
+
+    Arguments:
+        directory: The directory with the binary dataset.
+
+    Returns:
+        The name stored with the dataset and its memory-mapped series.
+    """
+    info_path = os.path.join(directory, BINARY_DATASET_INFO)
+    if not os.path.isfile(info_path):
+        raise FileNotFoundError(
+            "Binary dataset info not found: {}".format(info_path))
+
+    with open(info_path, encoding="utf-8") as f_info:
+        info = json.load(f_info)
+
+    return info["name"], {series_id: load_binary_series(directory, series_id)
+                          for series_id in info["series"]}
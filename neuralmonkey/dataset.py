@@ -1,310 +1,85 @@
-"""Implementation of the dataset class."""
+"""Implementation of loading the datasets.
 
-import os
-import random
+The datasets are loaded from the files by ``load_dataset_from_files`` (or
+from their binary form by ``load_binary_dataset``), which are used as the
+dataset classes in the configuration files. The dataset classes themselves
+are implemented in separate modules, ``base_dataset``, ``lazy_dataset`` and
+``mixture_dataset``, and they are imported here, so they can be referred to
+from the configuration files as ``dataset.MixtureDataset`` etc.
+"""
+
+import itertools
 import re
 import collections
 
-from typing import cast, Any, List, Callable, Iterable, Dict, Tuple, Union
+from typing import (cast, Any, List, Callable, Iterable, Dict,
+                    Optional, Tuple, Union)
 
-import numpy as np
 from typeguard import check_argument_types
 
+from neuralmonkey.base_dataset import Dataset, Reader
+# pylint: disable=unused-import
+from neuralmonkey.binary_dataset import (read_binary_dataset,
+                                         save_binary_dataset)
+from neuralmonkey.lazy_dataset import LazyDataset
+from neuralmonkey.mixture_dataset import MixtureDataset
+# pylint: enable=unused-import
+from neuralmonkey.length_filter import LengthFilter, get_length_filter
 from neuralmonkey.logging import log
-from neuralmonkey.readers.plain_text_reader import UtfPlainTextReader
-
-# pylint: disable=invalid-name
-Reader = Callable[[List[str]], Any]
-# pylint: enable=invalid-name
-
-
-class Dataset(collections.Sized):
-    """Base Dataset class.
-
-    This class serves as collection for data series for particular
-    encoders and decoders in the model. If it is not provided a parent
-    dataset, it also manages the vocabularies inferred from the data.
-
-    A data series is either a list of strings or a numpy array.
-    """
-
-    def __init__(self, name: str, series: Dict[str, List],
-                 series_outputs: Dict[str, str]) -> None:
-        """Create a dataset from the provided series of data.
-
-        The data is already preprocessed.
-
-        Arguments:
-            name: The name for the dataset
-            series: Dictionary from the series name to the actual data.
-            series_outputs: Output files for target series.
-        """
-        self.name = name
-        self._series = series
-        self.series_outputs = series_outputs
-
-        self._check_series_lengths()
-
-    def _check_series_lengths(self) -> None:
-        """Check lenghts of series in the dataset.
-
-        Raises:
-            Exception when the lengths in the dataset do not match.
-        """
-        lengths = [len(list(v)) for v in self._series.values()
-                   if isinstance(v, (list, np.ndarray))]
-
-        if len(set(lengths)) > 1:
-            err_str = ["{}: {}".format(s, len(list(self._series[s])))
-                       for s in self._series]
-            raise Exception("Lengths of data series must be equal. Instead: {}"
-                            .format(", ".join(err_str)))
-
-    def __len__(self) -> int:
-        """Get the length of the dataset.
-
-        Returns:
-            The length of the dataset.
-        """
-        if not list(self._series.values()):
-            return 0
-
-        first_series = next(iter(self._series.values()))
-        return len(list(first_series))
-
-    def has_series(self, name: str) -> bool:
-        """Check if the dataset contains a series of a given name.
-
-        Arguments:
-            name: Series name
-
-        Returns:
-            True if the dataset contains the series, False otherwise.
-        """
-        return name in self._series
-
-    def get_series(self, name: str, allow_none: bool = False) -> Iterable:
-        """Get the data series with a given name.
-
-        Arguments:
-            name: The name of the series to fetch.
-            allow_none: If True, return None if the series does not exist.
-
-        Returns:
-            The data series.
-
-        Raises:
-            KeyError if the series does not exists and allow_none is False
-        """
-        if allow_none:
-            return self._series.get(name)
-
-        return self._series[name]
-
-    @property
-    def series_ids(self) -> Iterable[str]:
-        return self._series.keys()
-
-    def shuffle(self) -> None:
-        """Shuffle the dataset randomly."""
-        keys = list(self._series.keys())
-        zipped = list(zip(*[self._series[k] for k in keys]))
-        random.shuffle(zipped)
-        for key, serie in zip(keys, list(zip(*zipped))):
-            self._series[key] = serie
-
-    def batch_serie(self, serie_name: str,
-                    batch_size: int) -> Iterable[Iterable]:
-        """Split a data serie into batches.
-
-        Arguments:
-            serie_name: The name of the series
-            batch_size: The size of a batch
-
-        Returns:
-            Generator yielding batches of the data from the serie.
-        """
-        buf = []
-        for item in self.get_series(serie_name):
-            buf.append(item)
-            if len(buf) >= batch_size:
-                yield buf
-                buf = []
-        if buf:
-            yield buf
-
-    def batch_dataset(self, batch_size: int) -> Iterable["Dataset"]:
-        """Split the dataset into a list of batched datasets.
-
-        Arguments:
-            batch_size: The size of a batch.
-
-        Returns:
-            Generator yielding batched datasets.
-        """
-        keys = list(self._series.keys())
-        batched_series = [self.batch_serie(key, batch_size) for key in keys]
-
-        batch_index = 0
-        for next_batches in zip(*batched_series):
-            batch_dict = {key: data for key, data in zip(keys, next_batches)}
-            dataset = Dataset(self.name + "-batch-{}".format(batch_index),
-                              batch_dict, {})
-            batch_index += 1
-            yield dataset
-
-    def add_series(self, name: str, series: List[Any]) -> None:
-        if name in self._series:
-            raise ValueError(
-                "Can't series that already exist: {}".format(name))
-        self._series[name] = series
+from neuralmonkey.parallel import is_picklable, parallel_map
+from neuralmonkey.readers.binary_reader import compact_token_series
+from neuralmonkey.readers.plain_text_reader import (MultiColumnReader,
+                                                    UtfPlainTextReader,
+                                                    column_groups)
+from neuralmonkey.series_cache import (SeriesCache, dataset_series_key,
+                                       describe_series, filtered_series_key)
 
-    def subset(self, start: int, length: int) -> "Dataset":
 
-        # new name
-        subset_name = "{}.{}.{}".format(self.name, start, length)
+def _read_group(group: Tuple[List[str], Any, List[Tuple[str, int]]]
+               ) -> Dict[str, collections.Sequence]:
+    """Read the series stored in a file (or in columns of a file)."""
+    paths, reader, columns = group
+    if not isinstance(reader, MultiColumnReader):
+        return {columns[0][0]: compact_token_series(reader(paths))}
 
-        # new outputs
-        subset_outputs = {k: "{}.{:010}".format(v, start)
-                          for k, v in self.series_outputs.items()}
+    # the columns of the file are parsed at once
+    rows = list(reader.rows(paths))
+    return {key: compact_token_series(
+        reader.select(row, column) for row in rows)
+            for key, column in columns}
 
-        # new series
-        subset_series = {k: v[start:start + length]
-                         for k, v in self._series.items()}
 
-        return Dataset(subset_name, subset_series, subset_outputs)
+def load_binary_dataset(directory: str, name: str = None,
+                        **kwargs) -> Dataset:
+    """Load a dataset stored in the binary format.
 
+    The binary datasets are created from the text ones using the
+    ``neuralmonkey-binarize`` command.
 
-class LazyDataset(Dataset):
-    """Implements the lazy dataset.
+    Arguments:
+        directory: The directory with the binary dataset.
+        name: The name of the dataset. If None (default), the name stored
+            with the dataset is used.
+        kwargs: Outputs of the series ('s_' prefix, '_out' suffix) and
+            dataset-level preprocessors ('pre_' prefix) as in
+            ``load_dataset_from_files``.
 
-    The main difference between this implementation and the default one is
-    that the contents of the file are not fully loaded to the memory.
-    Instead, everytime the function ``get_series`` is called, a new file handle
-    is created and a generator which yields lines from the file is returned.
+    Returns:
+        The memory-mapped dataset.
     """
+    check_argument_types()
 
-    def __init__(self, name: str,
-                 series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
-                 series_outputs: Dict[str, str],
-                 preprocessors: List[Tuple[str, str, Callable]] = None
-                ) -> None:
-        """Create a new instance of the lazy dataset.
-
-        Arguments:
-            name: The name of the dataset series_paths_and_readers: The mapping
-            of series name to its file series_outputs: Dictionary mapping
-            series names to their output file preprocess: The preprocessor to
-            apply to the read lines
-        """
-        parent_series = dict()  # type: Dict[str, Any]
-        parent_series.update({s: None for s in series_paths_and_readers})
-        if preprocessors:
-            parent_series.update({s[1]: None for s in preprocessors})
-        super().__init__(name, parent_series, series_outputs)
-        self.series_paths_and_readers = series_paths_and_readers
-
-        for series_name, (paths, _) in series_paths_and_readers.items():
-            for path in paths:
-                if not os.path.isfile(path):
-                    raise FileNotFoundError(
-                        "File not found. Series: {}, Path: {}"
-                        .format(series_name, path))
-
-        self.preprocess_series = {}  # type: Dict[str, Tuple[str, Callable]]
-        if preprocessors is not None:
-            for src_id, tgt_id, func in preprocessors:
-                if src_id == tgt_id:
-                    raise Exception(
-                        "Attempt to rewrite series '{}'".format(src_id))
-                if src_id not in series_paths_and_readers:
-                    raise Exception(
-                        ("The source series ({}) of the '{}' preprocessor "
-                         "is not defined in the dataset.").format(
-                             src_id, str(func)))
-                self.preprocess_series[tgt_id] = (src_id, func)
-
-    def has_series(self, name: str) -> bool:
-        """Check if the dataset contains a series of a given name.
-
-        Arguments:
-            name: Series name
-
-        Returns:
-            True if the dataset contains the series, False otherwise.
-        """
-        return (name in self.series_paths_and_readers
-                or name in self.preprocess_series)
-
-    def get_series(self, name: str, allow_none: bool = False) -> Iterable:
-        """Get the data series with a given name.
-
-        This function opens a new file handle and returns a generator which
-        yields preprocessed lines from the file.
-
-        Arguments:
-            name: The name of the series to fetch.
-            allow_none: If True, return None if the series does not exist.
-
-        Returns:
-            The data series.
-
-        Raises:
-            KeyError if the series does not exists and allow_none is False
-        """
-
-        if (allow_none and
-                name not in self.series_paths_and_readers and
-                name not in self.preprocess_series):
-            return None
-
-        if name in self.series_paths_and_readers:
-            paths, reader = self.series_paths_and_readers[name]
-            return reader(paths)
-        elif name in self.preprocess_series:
-            src_id, func = self.preprocess_series[name]
-            paths, reader = self.series_paths_and_readers[src_id]
-            src_series = reader(paths)
-            return map(func, src_series)
-        else:
-            raise Exception("Series '{}' is not in the dataset.".format(name))
-
-    def shuffle(self) -> None:
-        """Do nothing, not in-memory shuffle is impossible.
-
-        TODO: this is related to the ``__len__`` method.
-        """
-        pass
-
-    @property
-    def series_ids(self) -> Iterable[str]:
-        return (list(self.series_paths_and_readers.keys()) +
-                list(self.preprocess_series.keys()))
-
-    def add_series(self, name: str, series: Iterable[Any]) -> None:
-        raise NotImplementedError(
-            "Lazy dataset does not support adding series.")
-
-    def subset(self, start: int, length: int) -> "Dataset":
-        # new name
-        subset_name = "{}.{}.{}".format(self.name, start, length)
-
-        # new outputs
-        subset_outputs = {k: "{}.{:010}".format(v, start)
-                          for k, v in self.series_outputs.items()}
-
-        # new series
-        # TODO make this more efficient with large datasets
-        subset_series = {}
+    stored_name, series = read_binary_dataset(directory)
+    if name is None:
+        name = stored_name
 
-        for s_id, (paths, reader) in self.series_paths_and_readers.items():
-            generator = reader(paths)
-            for _ in range(start):
-                next(generator)
+    dataset = Dataset(name, series, _get_series_outputs(kwargs))
+    log("Binary dataset '{}' loaded from '{}', length: {}".format(
+        name, directory, len(dataset)))
 
-            subset_series[s_id] = [next(generator) for _ in range(length)]
+    _preprocessed_datasets(dataset, kwargs)
 
-        return Dataset(subset_name, subset_series, subset_outputs)
+    return dataset
 
 
 # pylint: disable=invalid-name
@@ -321,21 +96,53 @@ SERIES_OUTPUT = re.compile("s_(.*)_out")
 PREPROCESSED_SERIES = re.compile("pre_([^_]*)$")
 
 
+# pylint: disable=too-many-arguments
+# the options are set directly in the configuration files
 def load_dataset_from_files(
         name: str = None, lazy: bool = False,
         preprocessors: List[Tuple[str, str, Callable]] = None,
+        shuffle_buffer_size: int = None,
+        shuffle_chunk_size: int = 10000,
+        num_workers: int = 1,
+        cache: SeriesCache = None,
+        max_length_ratio: float = None,
+        truncate_long: bool = False,
         **kwargs) -> Dataset:
     """Load a dataset from the files specified by the provided arguments.
 
     Paths to the data are provided in a form of dictionary.
 
+    The tokenized text series of the in-memory dataset are stored compactly
+    as arrays of ids of interned tokens (see
+    ``readers.binary_reader.compact_token_series``).
+
     Keyword arguments:
         name: The name of the dataset to use. If None (default), the name will
               be inferred from the file names.
         lazy: Boolean flag specifying whether to use lazy loading (useful for
-              large files). Note that the lazy dataset cannot be shuffled.
-              Defaults to False.
+              large files). Note that the lazy dataset can be shuffled only
+              approximately using the shuffle buffer. Defaults to False.
         preprocessor: A callable used for preprocessing of the input sentences.
+        shuffle_buffer_size: The number of examples shuffled together in the
+              lazy dataset. If None (default), the lazy dataset is not
+              shuffled.
+        shuffle_chunk_size: The number of lines in the chunks of the files
+              which the shuffled lazy dataset reads in a random order.
+        num_workers: The number of processes used for loading the data.
+              The series of the in-memory dataset are read in parallel and
+              the preprocessors are applied to chunks of the data in
+              parallel, keeping the order of the examples. The workers are
+              shared by all datasets (see ``neuralmonkey.parallel``).
+              Defaults to 1, i.e. no parallelism.
+        cache: The cache of the preprocessed series. The series created by
+              the preprocessors and the dataset-level preprocessors are
+              stored in it, so they are computed only once for the same
+              data. Defaults to None, i.e. no caching.
+        max_length_ratio: The maximum ratio of the lengths of the series
+              with length limits (see below) in an example. The examples
+              exceeding it are removed. Defaults to None, i.e. no limit.
+        truncate_long: If True, the items longer than the maximum length of
+              their series are truncated instead of removing the examples.
         kwargs: Dataset keyword argument specs. These parameters should begin
                 with 's_' prefix and may end with '_out' suffix.  For example,
                 a data series 'source' which specify the source sentences
@@ -348,6 +155,10 @@ def load_dataset_from_files(
                 followed by a new series name. In case of the pre-processed
                 series, a callable taking the dataset and returning a new
                 series is expected as a value.
+                The minimum and maximum lengths of the items of a series
+                'xxx' are set by the 'min_len_xxx' and 'max_len_xxx'
+                parameters. The examples violating them are removed when
+                the dataset is loaded (or read, if it is lazy).
 
     Returns:
         The newly created dataset.
@@ -369,31 +180,121 @@ def load_dataset_from_files(
     if name is None:
         name = _get_name_from_paths(series_paths_and_readers)
 
+    length_filter = get_length_filter(kwargs, max_length_ratio,
+                                      truncate_long)
+    if length_filter is not None:
+        _check_limited_series(length_filter, series_paths_and_readers,
+                              preprocessors)
+
     if lazy:
-        dataset = LazyDataset(name, series_paths_and_readers, series_outputs,
-                              preprocessors)  # type: Dataset
+        dataset = LazyDataset(
+            name, series_paths_and_readers, series_outputs, preprocessors,
+            shuffle_buffer_size, shuffle_chunk_size,
+            num_workers, cache, length_filter)  # type: Dataset
     else:
-        series = {key: list(reader(paths))
-                  for key, (paths, reader) in series_paths_and_readers.items()}
-
-        if preprocessors is not None:
-            for src_id, tgt_id, function in preprocessors:
-                if src_id == tgt_id:
-                    raise Exception(
-                        "Attempt to rewrite series '{}'".format(src_id))
-                if src_id not in series:
-                    raise Exception(
-                        ("The source series ({}) of the '{}' preprocessor "
-                         "is not defined in the dataset.").format(
-                             src_id, str(function)))
-                series[tgt_id] = list(map(function, series[src_id]))
-
+        series = _load_series(name, series_paths_and_readers, preprocessors,
+                              num_workers, cache, length_filter)
         dataset = Dataset(name, series, series_outputs)
         log("Dataset length: {}".format(len(dataset)))
 
-    _preprocessed_datasets(dataset, kwargs)
+    if cache is not None and not lazy:
+        _preprocessed_datasets(
+            dataset, kwargs, cache, series_paths_and_readers, preprocessors,
+            length_filter)
+    else:
+        _preprocessed_datasets(dataset, kwargs)
 
     return dataset
+# pylint: enable=too-many-arguments
+
+
+def _check_limited_series(
+        length_filter: LengthFilter,
+        series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
+        preprocessors: Optional[List[Tuple[str, str, Callable]]]) -> None:
+    """Check that the length filter limits only the series of the dataset."""
+    known_series = set(series_paths_and_readers).union(
+        tgt_id for _, tgt_id, _ in preprocessors or [])
+    for series_id in length_filter.limits:
+        if series_id not in known_series:
+            raise ValueError(
+                "Length of an unknown series '{}' is limited."
+                .format(series_id))
+
+
+def _load_series(
+        name: str,
+        series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
+        preprocessors: Optional[List[Tuple[str, str, Callable]]],
+        num_workers: int, cache: Optional[SeriesCache],
+        length_filter: Optional[LengthFilter]) -> Dict[str, Any]:
+    """Read the series of an in-memory dataset and preprocess them."""
+    series = _read_series(series_paths_and_readers, num_workers)
+
+    # the examples are filtered before they are preprocessed and then
+    # again by the limits of the preprocessed series
+    prefilter = None
+    if length_filter is not None and preprocessors is not None:
+        prefilter = length_filter.restrict(series.keys(),
+                                           check_ratio=False)
+        series = prefilter.filter_series(series, name)
+
+    for src_id, tgt_id, function in preprocessors or []:
+        if src_id == tgt_id:
+            raise Exception(
+                "Attempt to rewrite series '{}'".format(src_id))
+        if src_id not in series:
+            raise Exception(
+                ("The source series ({}) of the '{}' preprocessor "
+                 "is not defined in the dataset.").format(
+                     src_id, str(function)))
+
+        def preprocess(src_id: str = src_id,
+                       function: Callable = function
+                      ) -> collections.Sequence:
+            return compact_token_series(parallel_map(
+                function, series[src_id], num_workers))
+
+        if cache is None:
+            series[tgt_id] = preprocess()
+        else:
+            series[tgt_id] = cache.cached(
+                filtered_series_key(cache, series_paths_and_readers, src_id,
+                                    prefilter, function),
+                preprocess, describe_series(
+                    function, series_paths_and_readers[src_id][0]))
+
+    if length_filter is not None:
+        series = length_filter.filter_series(series, name)
+    return series
+
+
+def _read_series(
+        series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
+        num_workers: int) -> Dict[str, Any]:
+    """Read the series from the files, each file in a single worker.
+
+    The files of readers which cannot be sent to the workers or which return
+    memory-mapped arrays are read in this process.
+    """
+    parallel_groups = []  # type: List[Tuple[List[str], Any, List]]
+    local_groups = []  # type: List[Tuple[List[str], Any, List]]
+    for group in column_groups(series_paths_and_readers,
+                               series_paths_and_readers.keys()):
+        if (not getattr(group[1], "main_process_only", False)
+                and is_picklable(group[1])):
+            parallel_groups.append(group)
+        else:
+            local_groups.append(group)
+
+    series = {}  # type: Dict[str, Any]
+    for group_series in itertools.chain(
+            parallel_map(_read_group, parallel_groups,
+                         min(num_workers, len(parallel_groups)),
+                         chunk_size=1),
+            map(_read_group, local_groups)):
+        series.update(group_series)
+    return series
 
 
 def _get_name_from_paths(series_paths: Dict[str, Tuple[List[str],
@@ -480,8 +381,18 @@ def _get_series_outputs(series_config: SeriesConfig) -> Dict[str, str]:
 
 def _preprocessed_datasets(
         dataset: Dataset,
-        series_config: SeriesConfig) -> None:
-    """Apply dataset-level preprocessing."""
+        series_config: SeriesConfig,
+        cache: SeriesCache = None,
+        series_paths_and_readers: Dict[str, Tuple[List[str], Reader]] = None,
+        preprocessors: List[Tuple[str, str, Callable]] = None,
+        length_filter: LengthFilter = None) -> None:
+    """Apply dataset-level preprocessing.
+
+    If a cache is given, the new series are looked up in it. They are keyed
+    by all the files of the dataset, their readers, the preprocessors and
+    the length filter, because a dataset-level preprocessor can use any of
+    the series of the filtered dataset.
+    """
     keys = [key for key in series_config.keys()
             if PREPROCESSED_SERIES.match(key)]
 
@@ -490,7 +401,18 @@ def _preprocessed_datasets(
         preprocessor = cast(DatasetPreprocess, series_config[key])
 
         if isinstance(dataset, Dataset):
-            new_series = list(preprocessor(dataset))
+            def preprocess(preprocessor: DatasetPreprocess = preprocessor
+                          ) -> List:
+                return list(preprocessor(dataset))
+
+            if cache is None or series_paths_and_readers is None:
+                new_series = preprocess()
+            else:
+                new_series = cache.cached(
+                    dataset_series_key(
+                        cache, series_paths_and_readers, preprocessors,
+                        length_filter, preprocessor),
+                    preprocess, describe_series(preprocessor, [dataset.name]))
             dataset.add_series(name, new_series)
         elif isinstance(dataset, LazyDataset):
             dataset.preprocess_series[name] = (None, preprocessor)
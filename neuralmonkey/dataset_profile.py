@@ -0,0 +1,315 @@
+"""Profile the datasets of an experiment configuration.
+
+The datasets are read once and the report describes the distribution of the
+series lengths, the coverage of the series by the configured vocabularies,
+the ratio of padding in batches of a given size and the number of tokens in
+the batches. This helps to choose the batch size, the maximum lengths and
+the bucketing parameters without trial training runs.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+import argparse
+import array
+import collections
+
+import numpy as np
+
+from neuralmonkey.config.builder import ObjectRef, instantiate_class
+from neuralmonkey.config.parsing import parse_file
+from neuralmonkey.base_dataset import (BUCKET_BUFFER_SIZE, Dataset,
+                                       bucket_lengths)
+from neuralmonkey.logging import log
+from neuralmonkey.vocabulary import Vocabulary
+
+PERCENTILES = [50, 90, 95, 99, 100]
+
+
+class SeriesProfile(object):
+    """Statistics of a single series collected in one pass over a dataset.
+
+    Only the series of sequences (lists, tuples or arrays) are profiled.
+    The tokens are counted only in the series of lists of strings.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.lengths = array.array("i")
+        self.token_counts = collections.Counter()  # type: collections.Counter
+        # only tokenized text counts in the batch lengths during training
+        self.is_text = True
+
+    def add(self, items: Iterable[Any]) -> bool:
+        """Add items of the series.
+
+        Returns:
+            False if the series does not contain sequences.
+        """
+        for item in items:
+            if isinstance(item, (list, tuple)):
+                self.token_counts.update(
+                    token for token in item if isinstance(token, str))
+            elif isinstance(item, np.ndarray) and item.ndim > 0:
+                self.is_text = False
+            else:
+                return False
+            self.lengths.append(len(item))
+        return True
+
+    def coverage(self, vocabulary: Vocabulary) -> Dict[str, float]:
+        """Get the ratios of the tokens and types known to a vocabulary."""
+        known_types = [token for token in self.token_counts
+                       if token in vocabulary]
+        known_tokens = sum(self.token_counts[token] for token in known_types)
+        return {
+            "tokens": known_tokens / max(sum(self.token_counts.values()), 1),
+            "types": len(known_types) / max(len(self.token_counts), 1)}
+
+
+def length_histogram(lengths: np.ndarray, bins: int = 10) -> List[str]:
+    """Format a text histogram of sequence lengths.
+
+    Arguments:
+        lengths: The sequence lengths.
+        bins: The maximum number of histogram bins.
+
+    Returns:
+        The lines of the histogram.
+    """
+    if not lengths.size:
+        return []
+
+    width = max(int(np.ceil((lengths.max() + 1) / bins)), 1)
+    counts = np.bincount(lengths // width)
+    scale = 50 / counts.max()
+
+    lines = []
+    for i, count in enumerate(counts):
+        lines.append("{:>6}-{:<6}{:>10}  {}".format(
+            i * width, (i + 1) * width - 1, count, "#" * int(count * scale)))
+    return lines
+
+
+def padding_stats(lengths: np.ndarray,
+                  batches: List[np.ndarray]) -> Dict[str, float]:
+    """Compute the padding and token counts of batches.
+
+    Arguments:
+        lengths: The lengths of the examples.
+        batches: The batches as arrays of example indices.
+
+    Returns:
+        Dictionary with the number of batches, the mean numbers of examples,
+        real tokens and padded tokens per batch and the ratio of padding.
+    """
+    real = np.array([lengths[batch].sum() for batch in batches])
+    padded = np.array([lengths[batch].max() * len(batch)
+                       for batch in batches])
+    return {
+        "batches": len(batches),
+        "examples": float(np.mean([len(batch) for batch in batches])),
+        "tokens": float(real.mean()),
+        "padded_tokens": float(padded.mean()),
+        "max_padded_tokens": int(padded.max()),
+        "padding": 1 - real.sum() / max(padded.sum(), 1)}
+
+
+def fixed_size_batches(length: int, batch_size: int) -> List[np.ndarray]:
+    """Split examples to batches of a fixed size in the dataset order."""
+    return [np.arange(start, min(start + batch_size, length))
+            for start in range(0, length, batch_size)]
+
+
+def bucketed_batches(lengths: np.ndarray, max_tokens: int,
+                     buffer_size: Optional[int]) -> List[np.ndarray]:
+    """Simulate the bucketing of examples as in ``bucket_batch_dataset``."""
+    if buffer_size is None:
+        buffer_size = BUCKET_BUFFER_SIZE
+
+    batches = []  # type: List[np.ndarray]
+    for start in range(0, len(lengths), buffer_size):
+        chunk = lengths[start:start + buffer_size].tolist()
+        batches.extend(np.array(batch) + start
+                       for batch in bucket_lengths(chunk, max_tokens))
+    return batches
+
+
+def profile_dataset(dataset: Dataset,
+                    batch_size: int) -> Dict[str, SeriesProfile]:
+    """Read a dataset once and collect the statistics of its series.
+
+    Arguments:
+        dataset: The dataset to profile.
+        batch_size: The size of the batches the dataset is read in.
+
+    Returns:
+        The profiles of the sequence series of the dataset.
+    """
+    profiles = {name: SeriesProfile(name) for name in dataset.series_ids}
+
+    for batch in dataset.batch_dataset(batch_size):
+        for name in list(profiles):
+            if not profiles[name].add(batch.get_series(name)):
+                del profiles[name]
+
+    return profiles
+
+
+def print_series_report(name: str, profile: SeriesProfile,
+                        vocabularies: Dict[str, Vocabulary],
+                        batch_size: int) -> np.ndarray:
+    """Print the statistics of a single series.
+
+    Returns:
+        The lengths of the series items.
+    """
+    lengths = np.frombuffer(profile.lengths, dtype=np.int32) \
+        if profile.lengths else np.zeros([0], dtype=np.int32)
+
+    print()
+    print("  Series '{}': {} examples, {} tokens, {} types".format(
+        name, len(lengths), lengths.sum(), len(profile.token_counts)))
+    if not lengths.size:
+        return lengths
+
+    print("  length mean {:.1f}, {}".format(
+        lengths.mean(), ", ".join(
+            "p{} {}".format(p, int(v)) for p, v in zip(
+                PERCENTILES, np.percentile(lengths, PERCENTILES)))))
+    for line in length_histogram(lengths):
+        print("    " + line)
+
+    for vocabulary_name, vocabulary in sorted(vocabularies.items()):
+        if profile.token_counts:
+            coverage = profile.coverage(vocabulary)
+            print("  vocabulary '{}' covers {:.2%} tokens, {:.2%} types"
+                  .format(vocabulary_name, coverage["tokens"],
+                          coverage["types"]))
+
+    stats = padding_stats(lengths, fixed_size_batches(len(lengths),
+                                                      batch_size))
+    print("  batch size {}: {:.2%} padding, {:.0f} tokens per batch "
+          "({:.0f} with padding)".format(
+              batch_size, stats["padding"], stats["tokens"],
+              stats["padded_tokens"]))
+    return lengths
+
+
+def print_report(dataset: Dataset, profiles: Dict[str, SeriesProfile],
+                 vocabularies: Dict[str, Vocabulary], batch_size: int,
+                 max_tokens: Optional[int],
+                 buffer_size: Optional[int]) -> None:
+    print("Dataset '{}'".format(dataset.name))
+    if not profiles:
+        print("  no sequence series")
+        return
+
+    series_lengths = {
+        name: print_series_report(name, profile, vocabularies, batch_size)
+        for name, profile in sorted(profiles.items())}
+
+    # the batch lengths count only the text series, as in the bucketing
+    text_lengths = [series_lengths[name] for name, profile in profiles.items()
+                    if profile.is_text]
+    if not text_lengths or not text_lengths[0].size:
+        return
+    example_lengths = np.max(text_lengths, axis=0)
+
+    print()
+    stats = padding_stats(example_lengths, fixed_size_batches(
+        len(example_lengths), batch_size))
+    print("  Batches of {} examples: {} batches, {:.2%} padding, at most {} "
+          "tokens per batch".format(batch_size, stats["batches"],
+                                    stats["padding"],
+                                    stats["max_padded_tokens"]))
+
+    if max_tokens is not None:
+        stats = padding_stats(example_lengths, bucketed_batches(
+            example_lengths, max_tokens, buffer_size))
+        print("  Buckets of {} tokens: {} batches, {:.1f} examples per "
+              "batch, {:.2%} padding, {:.0f} tokens per batch".format(
+                  max_tokens, stats["batches"], stats["examples"],
+                  stats["padding"], stats["tokens"]))
+    print()
+
+
+def _referenced_sections(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [name for item in value for name in _referenced_sections(item)]
+    if isinstance(value, ObjectRef):
+        return [value.name]
+    return []
+
+
+def _vocabulary_sections(config_dict: Dict[str, Dict[str, Any]]) -> List[str]:
+    sections = []
+    for section, options in config_dict.items():
+        clazz = getattr(options.get("class"), "clazz", "")
+        if clazz.split(".")[-2:-1] == ["vocabulary"]:
+            sections.append(section)
+    return sections
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("config", metavar="INI-FILE",
+                        help="the experiment configuration file")
+    parser.add_argument("-d", "--datasets", metavar="SECTION", nargs="+",
+                        help="sections of the profiled datasets, default are "
+                        "the training and validation datasets")
+    parser.add_argument("-v", "--vocabularies", metavar="SECTION", nargs="+",
+                        help="sections of the vocabularies, default are all "
+                        "vocabularies in the configuration")
+    parser.add_argument("-b", "--batch-size", type=int,
+                        help="the batch size, default is the batch size "
+                        "from the main section or 64")
+    parser.add_argument("-t", "--max-tokens", type=int,
+                        help="estimate the bucketing with this maximum "
+                        "number of tokens in a batch, default is "
+                        "batch_max_tokens from the main section")
+    parser.add_argument("--buffer-size", type=int, default=None,
+                        help="the number of examples sorted together when "
+                        "bucketing, by default {}".format(BUCKET_BUFFER_SIZE))
+    parser.add_argument("--shuffle", action="store_true",
+                        help="shuffle the datasets before reading them as "
+                        "in training; the padding depends on the order")
+    parser.add_argument("-s", "--set", type=str, metavar="SETTING",
+                        action="append", dest="config_changes", default=[],
+                        help="override an option in the configuration; the "
+                        "syntax is [section.]option=value")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f_config:
+        _, config_dict = parse_file(f_config, args.config_changes)
+
+    main_config = config_dict.get("main", {})
+    dataset_sections = args.datasets or _referenced_sections(
+        [main_config.get("train_dataset"), main_config.get("val_dataset")])
+    if not dataset_sections:
+        raise ValueError("No datasets to profile, specify their sections")
+    vocabulary_sections = (args.vocabularies
+                           or _vocabulary_sections(config_dict))
+    batch_size = args.batch_size or main_config.get("batch_size", 64)
+    max_tokens = args.max_tokens or main_config.get("batch_max_tokens")
+
+    existing_objects = collections.OrderedDict()  # type: Dict[str, Any]
+    vocabularies = {}
+    for section in vocabulary_sections:
+        vocabularies[section] = instantiate_class(
+            section, config_dict, existing_objects, 0)
+
+    for section in dataset_sections:
+        dataset = instantiate_class(section, config_dict, existing_objects, 0)
+        if not isinstance(dataset, Dataset):
+            raise ValueError("Section '{}' does not describe a dataset"
+                             .format(section))
+
+        if args.shuffle:
+            dataset.shuffle()
+        log("Profiling dataset '{}'".format(dataset.name))
+        profiles = profile_dataset(dataset, batch_size)
+        print_report(dataset, profiles, vocabularies, batch_size, max_tokens,
+                     args.buffer_size)
+
+
+if __name__ == "__main__":
+    main()
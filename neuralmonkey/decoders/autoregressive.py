@@ -5,7 +5,7 @@ Either for the recurrent decoder, or for the transformer decoder.
 The autoregressive decoder uses the while loop to get the outputs.
 Descendants should only specify the initial state and the while loop body.
 """
-from typing import (NamedTuple, Union, Callable, Tuple, cast, Iterable, Type,
+from typing import (NamedTuple, Union, Callable, Tuple, cast, Type,
                     List, Optional, Any)
 
 import numpy as np
@@ -284,15 +284,12 @@ class AutoregressiveDecoder(ModelPart):
             dataset: The dataset to use for the decoder.
             train: Boolean flag, telling whether this is a training run.
         """
-        sentences = cast(Iterable[List[str]],
-                         dataset.get_series(self.data_id, allow_none=True))
+        has_sentences = dataset.has_series(self.data_id)
 
-        if sentences is None and train:
+        if not has_sentences and train:
             raise ValueError("When training, you must feed "
                              "reference sentences")
 
-        sentences_list = list(sentences) if sentences is not None else None
-
         fd = {}  # type: FeedDict
         fd[self.train_mode] = train
 
@@ -300,12 +297,16 @@ class AutoregressiveDecoder(ModelPart):
         fd[self.go_symbols] = np.full([len(dataset)], go_symbol_idx,
                                       dtype=np.int32)
 
-        if sentences is not None:
+        if has_sentences:
+            # the series is converted to indices only once for all batches
+            indices, starts, lengths = dataset.get_indexed_series(
+                self.data_id, self.vocabulary)
+
             # train_mode=False, since we don't want to <unk>ize target words!
-            inputs, weights = self.vocabulary.sentences_to_tensor(
-                sentences_list, self.max_output_len, train_mode=False,
-                add_start_symbol=False, add_end_symbol=True,
-                pad_to_max_len=False)
+            inputs, weights = self.vocabulary.indices_to_tensor(
+                indices, starts, lengths, self.max_output_len,
+                train_mode=False, add_start_symbol=False,
+                add_end_symbol=True, pad_to_max_len=False)
 
             fd[self.train_inputs] = inputs
             fd[self.train_mask] = weights
@@ -18,6 +18,16 @@ information about hypotheses in the beam. It is an object of type
 probabilities of the tokens, its length, finished flag, ID of the last token,
 and the last decoder and attention states.
 
+The decoder searches for all sentences in the batch at once. The hypotheses
+of all sentences are stored in a single flat dimension, which is beam-major:
+the ``k``-th hypothesis of the ``b``-th sentence is stored on the row
+``k * batch_size + b``. This is the layout obtained by tiling the encoder
+states ``beam_size`` times along the batch dimension, which is what the
+attention mechanisms do when they receive a beam-sized query. The step outputs
+(``SearchStepOutput``) are batch-major and indexed *within* each sentence,
+i.e. they have shape ``batch x beam`` and the parent IDs are in the range
+``[0, beam_size)``.
+
 There is another inner state object here, the ``BeamSearchLoopState``. It is a
 technical structure used with the ``tf.while_loop`` function. It stores all the
 previously mentioned information, plus the decoder ``LoopState``, which is used
@@ -39,15 +49,15 @@ from neuralmonkey.decorators import tensor
 
 # pylint: disable=invalid-name
 SearchState = NamedTuple("SearchState",
-                         [("logprob_sum", tf.Tensor),  # beam x 1
-                          ("prev_logprobs", tf.Tensor),  # beam x Vocabulary
-                          ("lengths", tf.Tensor),
-                          ("finished", tf.Tensor)])
+                         [("logprob_sum", tf.Tensor),  # (beam * batch)
+                          ("prev_logprobs", tf.Tensor),  # (beam * batch) x V
+                          ("lengths", tf.Tensor),  # (beam * batch)
+                          ("finished", tf.Tensor)])  # (beam * batch)
 
 SearchStepOutput = NamedTuple("SearchStepOutput",
-                              [("scores", tf.Tensor),
-                               ("parent_ids", tf.Tensor),
-                               ("token_ids", tf.Tensor)])
+                              [("scores", tf.Tensor),  # batch x beam
+                               ("parent_ids", tf.Tensor),  # batch x beam
+                               ("token_ids", tf.Tensor)])  # batch x beam
 
 SearchStepOutputTA = NamedTuple("SearchStepOutputTA",
                                 [("scores", tf.TensorArray),
@@ -68,7 +78,10 @@ BeamSearchOutput = NamedTuple("SearchStepOutput",
 
 # pylint: enable=invalid-name
 class BeamSearchDecoder(ModelPart):
-    """In-graph beam search for batch size 1.
+    """In-graph beam search decoder.
+
+    The search runs for all sentences in the batch at once, each of them
+    keeping its own beam of hypotheses.
 
     The hypothesis scoring algorithm is taken from
     https://arxiv.org/pdf/1609.08144.pdf. Length normalization is parameter
@@ -140,11 +153,15 @@ class BeamSearchDecoder(ModelPart):
         dec_ls = decoder_body(*dec_ls)
 
         # We want to feed these values in ensembles
+        batch_size = self.parent_decoder.batch_size
         self._search_state = SearchState(
-            logprob_sum=tf.placeholder_with_default([0.0], [None]),
+            logprob_sum=tf.placeholder_with_default(
+                tf.zeros([batch_size]), [None]),
             prev_logprobs=tf.nn.log_softmax(dec_ls.feedables.prev_logits),
-            lengths=tf.placeholder_with_default([1], [None]),
-            finished=tf.placeholder_with_default([False], [None]))
+            lengths=tf.placeholder_with_default(
+                tf.ones([batch_size], dtype=tf.int32), [None]),
+            finished=tf.placeholder_with_default(
+                tf.zeros([batch_size], dtype=tf.bool), [None]))
 
         self._decoder_state = dec_ls.feedables
 
@@ -162,8 +179,11 @@ class BeamSearchDecoder(ModelPart):
 
         def cond(*args) -> tf.Tensor:
             bsls = BeamSearchLoopState(*args)
-            return tf.less(
+            before_max_steps = tf.less(
                 bsls.decoder_loop_state.feedables.step - 1, self._max_steps)
+            not_all_done = tf.logical_not(
+                tf.reduce_all(bsls.bs_state.finished))
+            return tf.logical_and(before_max_steps, not_all_done)
 
         # First step has to be run manually because while_loop needs the same
         # shapes between steps and the first beam state is not beam-sized, but
@@ -181,9 +201,9 @@ class BeamSearchDecoder(ModelPart):
         dec_loop_state = final_state.decoder_loop_state
         bs_state = final_state.bs_state
 
-        scores = final_state.bs_output.scores.stack()
-        parent_ids = final_state.bs_output.parent_ids.stack()
-        token_ids = final_state.bs_output.token_ids.stack()
+        scores = self._stack_output(final_state.bs_output.scores)
+        parent_ids = self._stack_output(final_state.bs_output.parent_ids)
+        token_ids = self._stack_output(final_state.bs_output.token_ids)
 
         # TODO: return att_loop_states properly
         return BeamSearchOutput(
@@ -195,6 +215,20 @@ class BeamSearchDecoder(ModelPart):
             last_search_state=bs_state,
             attention_loop_states=[])
 
+    def _stack_output(self, output_ta: tf.TensorArray) -> tf.Tensor:
+        """Stack a step output array to a ``time x batch x beam`` tensor.
+
+        TensorFlow cannot stack an empty array whose element shape is not
+        fully defined (which is the case here since the batch size is
+        dynamic). An empty array is produced when no search step is run,
+        e.g. in the first ``session.run`` during ensembling.
+        """
+        empty_shape = [0, self.parent_decoder.batch_size, self._beam_size]
+        return tf.cond(
+            tf.greater(output_ta.size(), 0),
+            output_ta.stack,
+            lambda: tf.zeros(empty_shape, dtype=output_ta.dtype))
+
     def get_body(self) -> Callable:
         """Return a body function for ``tf.while_loop``."""
         decoder_body = self.parent_decoder.get_body(train_mode=False)
@@ -231,7 +265,7 @@ class BeamSearchDecoder(ModelPart):
             step = dec_loop_state.feedables.step - 1
 
             # mask the probabilities
-            # shape(logprobs) = beam x vocabulary
+            # shape(logprobs) = (beam * batch) x vocabulary
             logprobs = bs_state.prev_logprobs
 
             finished_mask = tf.expand_dims(tf.to_float(bs_state.finished), 1)
@@ -248,47 +282,59 @@ class BeamSearchDecoder(ModelPart):
             logprobs = unfinished_logprobs + finished_logprobs
 
             # update hypothesis scores
-            # shape(hyp_probs) = beam x vocabulary
+            # shape(hyp_probs) = (beam * batch) x vocabulary
             hyp_probs = tf.expand_dims(bs_state.logprob_sum, 1) + logprobs
 
             # update hypothesis lengths
             hyp_lengths = bs_state.lengths + 1 - tf.to_int32(bs_state.finished)
 
-            # shape(scores) = beam x vocabulary
+            # shape(scores) = (beam * batch) x vocabulary
             scores = hyp_probs / tf.expand_dims(
                 self._length_penalty(hyp_lengths), 1)
 
-            # flatten so we can use top_k
-            scores_flat = tf.reshape(scores, [-1])
+            # In the first step, there is only a single hypothesis for each
+            # sentence, in the other steps there are beam_size of them.
+            batch_size = self.parent_decoder.batch_size
+            vocabulary_size = len(self.vocabulary)
 
-            # shape(both) = beam
-            topk_scores, topk_indices = tf.nn.top_k(
-                scores_flat, self._beam_size)
+            # gather hypotheses of each sentence so we can use top_k
+            # shape(scores_by_sentence) = batch x (hyps * vocabulary)
+            scores_by_sentence = tf.reshape(
+                tf.transpose(
+                    tf.reshape(scores, [-1, batch_size, vocabulary_size]),
+                    [1, 0, 2]),
+                [batch_size, -1])
 
-            topk_scores.set_shape([self._beam_size])
-            topk_indices.set_shape([self._beam_size])
+            # shape(both) = batch x beam
+            topk_scores, topk_indices = tf.nn.top_k(
+                scores_by_sentence, self._beam_size)
 
-            # flatten the hypothesis probabilities
-            hyp_probs_flat = tf.reshape(hyp_probs, [-1])
+            topk_scores.set_shape([None, self._beam_size])
+            topk_indices.set_shape([None, self._beam_size])
 
-            # select logprobs of the best hyps (disregard lenghts)
-            next_beam_logprob_sum = tf.gather(hyp_probs_flat, topk_indices)
-            # pylint: disable=no-member
-            next_beam_logprob_sum.set_shape([self._beam_size])
-            # pylint: enable=no-member
+            # shape(both) = batch x beam
+            # the parent IDs are indices of hypotheses within the sentence
+            next_word_ids = tf.mod(topk_indices, vocabulary_size)
+            next_parent_ids = tf.div(topk_indices, vocabulary_size)
 
-            next_word_ids = tf.mod(topk_indices,
-                                   len(self.vocabulary))
+            # flatten back to the beam-major layout
+            # shape(next_beam_ids) = (beam * batch)
+            parent_rows = (next_parent_ids * batch_size +
+                           tf.expand_dims(tf.range(batch_size), 1))
+            next_beam_ids = tf.reshape(tf.transpose(parent_rows), [-1])
+            next_beam_word_ids = tf.reshape(tf.transpose(next_word_ids), [-1])
 
-            next_beam_ids = tf.div(topk_indices,
-                                   len(self.vocabulary))
+            # select logprobs of the best hyps (disregard lenghts)
+            next_beam_logprob_sum = tf.gather(
+                tf.reshape(hyp_probs, [-1]),
+                next_beam_ids * vocabulary_size + next_beam_word_ids)
 
             next_finished = tf.gather(bs_state.finished, next_beam_ids)
-            next_just_finished = tf.equal(next_word_ids, END_TOKEN_INDEX)
+            next_just_finished = tf.equal(next_beam_word_ids, END_TOKEN_INDEX)
             next_finished = tf.logical_or(next_finished, next_just_finished)
 
             next_feedables_dict = {
-                "input_symbol": next_word_ids,
+                "input_symbol": next_beam_word_ids,
                 "finished": next_finished}
             for key, val in dec_loop_state.feedables._asdict().items():
                 if key in ["step", "input_symbol", "finished"]:
@@ -329,7 +375,7 @@ class BeamSearchDecoder(ModelPart):
 
             next_output = SearchStepOutputTA(
                 scores=bs_output.scores.write(step, topk_scores),
-                parent_ids=bs_output.parent_ids.write(step, next_beam_ids),
+                parent_ids=bs_output.parent_ids.write(step, next_parent_ids),
                 token_ids=bs_output.token_ids.write(step, next_word_ids))
 
             return BeamSearchLoopState(
@@ -340,17 +386,21 @@ class BeamSearchDecoder(ModelPart):
 
         return body
 
+    # pylint: disable=unused-argument
     def feed_dict(self, dataset: Dataset, train: bool = False) -> FeedDict:
         """Populate the feed dictionary for the decoder object.
 
+        The batch size is taken from the parent decoder, so there is nothing
+        to feed here.
+
         Arguments:
             dataset: The dataset to use for the decoder.
             train: Boolean flag, telling whether this is a training run
         """
         assert not train
-        assert len(dataset) == 1
 
         return {}
+    # pylint: enable=unused-argument
 
     def _length_penalty(self, lengths):
         """Apply lp term from eq. 14."""
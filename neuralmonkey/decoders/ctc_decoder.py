@@ -127,13 +127,9 @@ class CTCDecoder(ModelPart):
         fd[self.train_mode] = train
 
         if sentences is not None:
+            # the targets need to be batch-major
             vectors, paddings = self.vocabulary.sentences_to_tensor(
-                list(sentences), train_mode=train)
-
-            # sentences_to_tensor returns time-major tensors, targets need to
-            # be batch-major
-            vectors = vectors.T
-            paddings = paddings.T
+                list(sentences), train_mode=train, time_major=False)
 
             # Need to convert the data to a sparse representation
             bool_mask = (paddings > 0.5)
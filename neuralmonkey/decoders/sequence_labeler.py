@@ -133,9 +133,10 @@ class SequenceLabeler(ModelPart):
 
         if sentences is not None:
             vectors, paddings = self.vocabulary.sentences_to_tensor(
-                list(sentences), pad_to_max_len=False, train_mode=train)
+                list(sentences), pad_to_max_len=False, train_mode=train,
+                time_major=False)
 
-            fd[self.train_targets] = vectors.T
-            fd[self.train_weights] = paddings.T
+            fd[self.train_targets] = vectors
+            fd[self.train_weights] = paddings
 
         return fd
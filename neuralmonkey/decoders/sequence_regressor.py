@@ -1,5 +1,6 @@
 from typing import cast, Callable, Iterable, List
 
+import numpy as np
 import tensorflow as tf
 
 from typeguard import check_argument_types
@@ -98,7 +99,9 @@ class SequenceRegressor(ModelPart):
 
         fd = {}  # type: FeedDict
         if sentences_list is not None:
-            fd[self.train_inputs] = list(zip(*sentences_list))[0]
+            fd[self.train_inputs] = np.array(
+                [sentence[0] for sentence in sentences_list],
+                dtype=np.float32)
 
         fd[self.train_mode] = train
 
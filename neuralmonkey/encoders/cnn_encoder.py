@@ -146,10 +146,11 @@ class CNNEncoder(ModelPart, SpatialStatefulWithOutput):
     def feed_dict(self, dataset: Dataset, train: bool = False) -> FeedDict:
         # if it is from the pickled file, it is list, not numpy tensor,
         # so convert it as as a prevention
-        images = np.array(dataset.get_series(self.data_id))
+        images = np.array(dataset.get_series(self.data_id), dtype=np.float32)
+        images /= 225.0
 
-        f_dict = {}
-        f_dict[self.image_input] = images / 225.0
+        f_dict = {}  # type: FeedDict
+        f_dict[self.image_input] = images
 
         f_dict[self.train_mode] = train
         return f_dict
@@ -173,7 +173,7 @@ class ImageNet(ModelPart, SpatialStatefulWithOutput):
                     var_list=local_variables + slim_variables)
 
     def feed_dict(self, dataset: Dataset, train: bool = False) -> FeedDict:
-        images = np.array(dataset.get_series(self.data_id))
+        images = np.array(dataset.get_series(self.data_id), dtype=np.float32)
         assert images.shape[1:] == (self.HEIGHT, self.WIDTH, 3)
 
         return {self.input_image: images}
@@ -177,21 +177,18 @@ class RawRNNEncoder(ModelPart, TemporalStatefulWithOutput):
         fd[self.train_mode] = train
 
         series = list(dataset.get_series(self.data_id))
-        lengths = []
-        inputs = []
+        lengths = np.array([x.shape[0] for x in series], dtype=np.int32)
 
-        max_len = max(x.shape[0] for x in series)
+        max_len = int(lengths.max())
         if self.max_input_len is not None:
             max_len = min(self.max_input_len, max_len)
+        lengths = np.minimum(lengths, max_len)
 
-        for x in series:
-            length = min(max_len, x.shape[0])
-            x_padded = np.zeros(shape=(max_len,) + x.shape[1:],
-                                dtype=x.dtype)
-            x_padded[:length] = x[:length]
-
-            lengths.append(length)
-            inputs.append(x_padded)
+        # the inputs are padded in a single batch-major array
+        inputs = np.zeros((len(series), max_len) + series[0].shape[1:],
+                          dtype=np.float32)
+        for i, (x, length) in enumerate(zip(series, lengths)):
+            inputs[i, :length] = x[:length]
 
         fd[self.inputs] = inputs
         fd[self._input_lengths] = lengths
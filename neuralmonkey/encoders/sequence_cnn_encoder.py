@@ -135,11 +135,9 @@ class SequenceCNNEncoder(ModelPart, Stateful):
 
         vectors, paddings = self.vocabulary.sentences_to_tensor(
             list(sentences), self.max_input_len, pad_to_max_len=False,
-            train_mode=train)
+            train_mode=train, time_major=False)
 
-        # as sentences_to_tensor returns lists of shape (time, batch),
-        # we need to transpose
-        fd[self.inputs] = list(zip(*vectors))
-        fd[self.input_mask] = list(zip(*paddings))
+        fd[self.inputs] = vectors
+        fd[self.input_mask] = paddings
 
         return fd
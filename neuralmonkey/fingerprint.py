@@ -0,0 +1,142 @@
+"""Fingerprints identifying values and functions across runs.
+
+The fingerprint of a function is computed from its name, its bytecode and the
+values it closes over; the fingerprint of an object from its class and its
+attributes; the fingerprint of a numpy array from its content. Objects which
+cannot be described this way (e.g. objects with slots only) have no
+fingerprint, because their ``repr`` may differ between runs or be truncated.
+"""
+
+from typing import Any, Callable, List, Optional, Set, Tuple
+import functools
+import hashlib
+import re
+import types
+
+import numpy as np
+
+
+class FingerprintError(ValueError):
+    """Error raised when an object cannot be identified across runs."""
+
+
+def fingerprint(obj: Any, _visited: Optional[Set[int]] = None) -> str:
+    """Compute a string which identifies a value or a function.
+
+    Objects can provide their own fingerprint by defining the
+    ``fingerprint`` method. Numpy arrays are identified by their content.
+
+    Arguments:
+        obj: The object to describe.
+
+    Returns:
+        A string which is the same for equal objects across runs.
+
+    Raises:
+        FingerprintError if the object (or a value it refers to) has no
+        attributes to describe and is not of a known type, so its only
+        description would be its ``repr`` (which can contain a memory
+        address).
+    """
+    if _visited is None:
+        _visited = set()
+
+    if obj is None or isinstance(obj, (bool, int, float, complex, str,
+                                       bytes)):
+        return repr(obj)
+
+    # cyclic references are described by the type only
+    if id(obj) in _visited:
+        return "<cycle {}>".format(type(obj).__qualname__)
+    _visited.add(id(obj))
+
+    description = _describe(obj, lambda value: fingerprint(value, _visited))
+    if description is None:
+        raise FingerprintError("Cannot compute fingerprint of {} object"
+                               .format(type(obj).__qualname__))
+    return description
+
+
+def _describe(obj: Any, recurse: Callable[[Any], str]) -> Optional[str]:
+    """Describe an object using the fingerprints of its parts."""
+    if hasattr(obj, "fingerprint") and callable(obj.fingerprint):
+        return "{}:{}".format(type(obj).__qualname__, obj.fingerprint())
+
+    for types_, describe in _DESCRIPTIONS:
+        if isinstance(obj, types_):
+            return describe(obj, recurse)
+
+    if hasattr(obj, "__dict__"):
+        return "{}.{}({})".format(type(obj).__module__,
+                                  type(obj).__qualname__, recurse(vars(obj)))
+    return None
+
+
+def _describe_sequence(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "{}({})".format(type(obj).__name__,
+                           ",".join(recurse(i) for i in obj))
+
+
+def _describe_set(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "set({})".format(",".join(sorted(recurse(i) for i in obj)))
+
+
+def _describe_dict(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "dict({})".format(",".join(sorted(
+        "{}:{}".format(recurse(k), recurse(v)) for k, v in obj.items())))
+
+
+def _describe_array(obj: Any, _: Callable[[Any], str]) -> str:
+    array = np.ascontiguousarray(obj)
+    if array.dtype.hasobject:
+        raise FingerprintError("Cannot compute fingerprint of an array of "
+                               "objects")
+    return "array({},{},{})".format(array.dtype.str, array.shape,
+                                    hashlib.sha1(array.tobytes()).hexdigest())
+
+
+def _describe_code(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "code({},{},{})".format(
+        hashlib.sha1(obj.co_code).hexdigest(), recurse(obj.co_consts),
+        recurse(obj.co_names))
+
+
+def _describe_function(obj: Any, recurse: Callable[[Any], str]) -> str:
+    closure = [cell.cell_contents for cell in obj.__closure__ or []]
+    return "function({}.{},{},{},{})".format(
+        obj.__module__, obj.__qualname__, recurse(obj.__code__),
+        recurse(obj.__defaults__), recurse(closure))
+
+
+def _describe_builtin(obj: Any, _: Callable[[Any], str]) -> str:
+    return "{}.{}".format(obj.__module__, obj.__qualname__)
+
+
+def _describe_partial(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "partial({},{},{})".format(
+        recurse(obj.func), recurse(obj.args), recurse(obj.keywords))
+
+
+def _describe_method(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "method({},{})".format(recurse(obj.__func__),
+                                  recurse(obj.__self__))
+
+
+def _describe_regex(obj: Any, recurse: Callable[[Any], str]) -> str:
+    return "regex({},{})".format(recurse(obj.pattern), obj.flags)
+
+
+# pylint: disable=invalid-name
+_DESCRIPTIONS = [
+    ((list, tuple), _describe_sequence),
+    ((set, frozenset), _describe_set),
+    (dict, _describe_dict),
+    ((np.ndarray, np.generic), _describe_array),
+    (types.CodeType, _describe_code),
+    (types.FunctionType, _describe_function),
+    ((types.BuiltinFunctionType, type), _describe_builtin),
+    (functools.partial, _describe_partial),
+    (types.MethodType, _describe_method),
+    (type(re.compile("")), _describe_regex)
+]  # type: List[Tuple[Any, Callable[[Any, Callable[[Any], str]], str]]]
+# pylint: enable=invalid-name
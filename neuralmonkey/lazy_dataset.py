@@ -0,0 +1,500 @@
+"""Implementation of the lazy dataset.
+
+The lazy dataset reads its series from the files every time they are
+requested. Line-based series are read using the line indices of the files
+(see ``readers.line_index``), so the dataset can be read from an arbitrary
+example or in shuffled chunks of lines without parsing the rest of the files.
+"""
+
+import itertools
+import functools
+import os
+import random
+
+from typing import cast, Any, List, Callable, Iterable, Dict, Optional, Tuple
+
+import numpy as np
+
+from neuralmonkey.base_dataset import (
+    BUCKET_BUFFER_SIZE, Dataset, Reader, bucket_batches,
+    get_preprocess_series, index_whole_series, shuffle_buffer)
+from neuralmonkey.length_filter import LengthFilter
+from neuralmonkey.logging import warn
+from neuralmonkey.parallel import parallel_map, parallel_map_chunks
+from neuralmonkey.readers.line_index import (chunk_positions, get_line_index,
+                                             read_chunks, read_lines)
+from neuralmonkey.readers.plain_text_reader import (MultiColumnReader,
+                                                    column_groups)
+from neuralmonkey.series_cache import SeriesCache, cached_file_series
+
+
+class LazyDataset(Dataset):
+    """Implements the lazy dataset.
+
+    The main difference between this implementation and the default one is
+    that the contents of the file are not fully loaded to the memory.
+    Instead, everytime the function ``get_series`` is called, a new file handle
+    is created and a generator which yields lines from the file is returned.
+
+    The lazy dataset can be shuffled only approximately. When a shuffle
+    buffer size is set, the files are read in chunks of lines in a random
+    order (if all the series are read by line-based readers, see
+    ``readers.plain_text_reader.line_reader``) and the examples are further
+    shuffled in a buffer of the given size as they stream.
+
+    When a series cache is used, the preprocessed series are read from the
+    cache instead of applying the preprocessors to every read line. A series
+    missing in the cache is preprocessed and stored when it is first read.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name: str,
+                 series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
+                 series_outputs: Dict[str, str],
+                 preprocessors: List[Tuple[str, str, Callable]] = None,
+                 shuffle_buffer_size: int = None,
+                 shuffle_chunk_size: int = 10000,
+                 num_workers: int = 1,
+                 cache: SeriesCache = None,
+                 length_filter: LengthFilter = None,
+                 start_offset: int = 0) -> None:
+        """Create a new instance of the lazy dataset.
+
+        Arguments:
+            name: The name of the dataset
+            series_paths_and_readers: The mapping of series name to its file
+            series_outputs: Dictionary mapping series names to their output
+                file
+            preprocessors: The preprocessors to apply to the read lines
+            shuffle_buffer_size: The number of examples shuffled together
+                when the dataset is shuffled. If None, the dataset is always
+                read in the order of the files.
+            shuffle_chunk_size: The number of lines in the chunks of the
+                files which are read in a random order when the dataset is
+                shuffled.
+            num_workers: The number of processes parsing the lines of the
+                files (if read by line-based readers) and applying the
+                preprocessors. If 1, everything is done in the main process.
+                The readers and the preprocessors which cannot be pickled
+                are applied in the main process.
+            cache: The cache of the preprocessed series. If None, the
+                preprocessors are applied every time the series is read.
+            length_filter: Filter of the examples by the lengths of the
+                series applied as the examples are read.
+            start_offset: The number of lines of the files skipped when the
+                series are read (see ``from_offset``).
+        """
+        parent_series = dict()  # type: Dict[str, Any]
+        parent_series.update({s: None for s in series_paths_and_readers})
+        if preprocessors:
+            parent_series.update({s[1]: None for s in preprocessors})
+        super().__init__(name, parent_series, series_outputs)
+        self.series_paths_and_readers = series_paths_and_readers
+
+        for series_name, (paths, _) in series_paths_and_readers.items():
+            for path in paths:
+                if not os.path.isfile(path):
+                    raise FileNotFoundError(
+                        "File not found. Series: {}, Path: {}"
+                        .format(series_name, path))
+
+        self.preprocess_series = get_preprocess_series(
+            series_paths_and_readers, preprocessors)
+
+        if shuffle_buffer_size is not None and shuffle_buffer_size <= 0:
+            raise ValueError("Shuffle buffer size must be positive, was {}"
+                             .format(shuffle_buffer_size))
+        if shuffle_chunk_size <= 0:
+            raise ValueError("Shuffle chunk size must be positive, was {}"
+                             .format(shuffle_chunk_size))
+        if num_workers <= 0:
+            raise ValueError("Number of workers must be positive, was {}"
+                             .format(num_workers))
+        if start_offset < 0:
+            raise ValueError("Offset must not be negative, was {}"
+                             .format(start_offset))
+
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.shuffle_chunk_size = shuffle_chunk_size
+        self.num_workers = num_workers
+        self.cache = cache
+        self.length_filter = length_filter
+        self._shuffle_seed = None  # type: Optional[int]
+        self._start_offset = start_offset
+        self._filtered_length = None  # type: Optional[int]
+        self._chunked = None  # type: Optional[bool]
+    # pylint: enable=too-many-arguments
+
+    @property
+    def _line_based(self) -> bool:
+        """Check whether all series can be read by lines using an index."""
+        return all(hasattr(reader, "parse_lines")
+                   for _, reader in self.series_paths_and_readers.values())
+
+    @property
+    def _read_in_chunks(self) -> bool:
+        """Check whether the shuffled files are read in chunks.
+
+        The files read by line-based readers are read in chunks of lines in
+        a random order before they are shuffled by the shuffle buffer, if
+        they can be read from an arbitrary line. Reading a chunk of an
+        ordinary gzipped file decompresses the file from its beginning, so
+        such files are read sequentially and shuffled only by the buffer.
+        """
+        if self._chunked is None:
+            self._chunked = self._line_based and all(
+                get_line_index(path).seekable
+                for paths, _ in self.series_paths_and_readers.values()
+                for path in paths)
+            if self._line_based and not self._chunked:
+                warn("Dataset '{}' has gzipped files which cannot be read "
+                     "from an arbitrary line, it is shuffled only by the "
+                     "shuffle buffer".format(self.name))
+        return self._chunked
+
+    def __len__(self) -> int:
+        """Get the length of the dataset.
+
+        If the series are read by line-based readers, the length is the
+        number of lines in the files, which is looked up in their line
+        indices. Otherwise, the first series has to be read. If the dataset
+        has a length filter, the series it limits are read once and the
+        examples which pass the filter are counted.
+
+        Returns:
+            The length of the dataset.
+        """
+        if not self.series_paths_and_readers:
+            return 0
+
+        if self.length_filter is not None and self.length_filter.limits:
+            if self._filtered_length is None:
+                self._filtered_length = sum(1 for _ in self._read_examples([]))
+            return self._filtered_length
+
+        if self._line_based:
+            paths, _ = next(iter(self.series_paths_and_readers.values()))
+            lines = sum(len(get_line_index(path)) for path in paths)
+            return max(lines - self._start_offset, 0)
+
+        series_id = next(iter(self.series_paths_and_readers))
+        return sum(1 for _ in self.get_series(series_id))
+
+    def has_series(self, name: str) -> bool:
+        """Check if the dataset contains a series of a given name.
+
+        Arguments:
+            name: Series name
+
+        Returns:
+            True if the dataset contains the series, False otherwise.
+        """
+        return (name in self.series_paths_and_readers
+                or name in self.preprocess_series)
+
+    def get_series(self, name: str, allow_none: bool = False) -> Iterable:
+        """Get the data series with a given name.
+
+        This function opens a new file handle and returns a generator which
+        yields preprocessed lines from the file.
+
+        Arguments:
+            name: The name of the series to fetch.
+            allow_none: If True, return None if the series does not exist.
+
+        Returns:
+            The data series.
+
+        Raises:
+            KeyError if the series does not exists and allow_none is False
+        """
+
+        if (allow_none and
+                name not in self.series_paths_and_readers and
+                name not in self.preprocess_series):
+            return None
+
+        if self.length_filter is not None and self.has_series(name):
+            return (example[0] for example in self._read_examples([name]))
+        return self._get_series(name)
+
+    def _get_series(self, name: str) -> Iterable:
+        """Get a data series without filtering the examples."""
+        if name in self.series_paths_and_readers:
+            return self._read_series(name)
+        elif name in self.preprocess_series:
+            src_id, func = self.preprocess_series[name]
+            if self.cache is not None and src_id is not None:
+                return self._read_cached_series(src_id, func)
+            return parallel_map(func, self._read_series(src_id),
+                                self.num_workers)
+        else:
+            raise Exception("Series '{}' is not in the dataset.".format(name))
+
+    def _read_cached_series(self, src_id: str,
+                            func: Callable) -> Iterable[Any]:
+        """Read a preprocessed series from the cache.
+
+        The whole series is preprocessed and stored in the cache in the
+        order of the files if it is not there yet. The items are then read
+        from the cache in the same order as the source series is read (i.e.
+        shuffled or starting from an offset), so the series stay aligned.
+        """
+        paths, reader = self.series_paths_and_readers[src_id]
+        series = cached_file_series(cast(SeriesCache, self.cache), paths,
+                                    reader, func, self.num_workers)
+        if series is None:
+            return parallel_map(func, self._read_series(src_id),
+                                self.num_workers)
+
+        if self._shuffle_seed is not None and self._read_in_chunks:
+            positions = chunk_positions(
+                len(series), self.shuffle_chunk_size,
+                random.Random(self._shuffle_seed))  # type: Iterable[int]
+        else:
+            positions = range(self._start_offset, len(series))
+
+        if self._shuffle_seed is not None:
+            positions = shuffle_buffer(
+                positions, cast(int, self.shuffle_buffer_size),
+                random.Random(self._shuffle_seed + 1))
+
+        return (series[i] for i in positions)
+
+    def _read_series(self, name: str) -> Iterable:
+        """Read a series from its files, shuffled if requested.
+
+        All the series use the same random seed, so they are shuffled in
+        the same way and stay aligned.
+        """
+        paths, reader = self.series_paths_and_readers[name]
+        return self._read_source(paths, reader)
+
+    def _read_source(self, paths: List[str], reader: Reader) -> Iterable:
+        """Read files using a reader in the order of the dataset."""
+        if self._shuffle_seed is not None and self._read_in_chunks:
+            items = self._parse_lines(reader, read_chunks(
+                paths, self.shuffle_chunk_size,
+                random.Random(self._shuffle_seed)))
+        elif self._line_based and (self._start_offset
+                                   or self.num_workers > 1):
+            indices = [get_line_index(path) for path in paths]
+            items = self._parse_lines(
+                reader, read_lines(indices, self._start_offset))
+        elif self._start_offset:
+            items = itertools.islice(reader(paths), self._start_offset, None)
+        else:
+            items = reader(paths)
+
+        if self._shuffle_seed is None:
+            return items
+
+        return shuffle_buffer(items, cast(int, self.shuffle_buffer_size),
+                              random.Random(self._shuffle_seed + 1))
+
+    def _parse_lines(self, reader: Reader,
+                     lines: Iterable[bytes]) -> Iterable[Any]:
+        """Parse lines read from the files using a line-based reader.
+
+        If the dataset uses more workers, the lines are parsed in chunks in
+        parallel processes.
+        """
+        if self.num_workers > 1:
+            return parallel_map_chunks(
+                functools.partial(_parse_line_chunk, reader), lines,
+                self.num_workers)
+
+        encoding = reader.encoding  # type: ignore
+        return reader.parse_lines(  # type: ignore
+            line.decode(encoding) for line in lines)
+
+    def shuffle(self) -> None:
+        """Shuffle the dataset approximately.
+
+        The shuffling takes effect only if the shuffle buffer size is set.
+        Then, a new random order of the examples is drawn for the following
+        reading of the series.
+        """
+        if self.shuffle_buffer_size is not None:
+            self._shuffle_seed = random.getrandbits(32)
+
+    @property
+    def series_ids(self) -> Iterable[str]:
+        return (list(self.series_paths_and_readers.keys()) +
+                list(self.preprocess_series.keys()))
+
+    def _read_examples(self, keys: List[str]) -> Iterable[Tuple]:
+        """Read the series together as tuples of their items.
+
+        The columns of a file read by a shared multi-column reader are read
+        in a single pass over the file, parsing every line once.
+
+        If the dataset has a length filter, the examples are filtered.
+
+        Arguments:
+            keys: The names of the series to read.
+
+        Returns:
+            Iterable of the examples as tuples of the series items.
+        """
+        if self.length_filter is not None:
+            read_keys = keys + [key for key in self.length_filter.limits
+                                if key not in keys]
+            examples = self.length_filter.filter(
+                read_keys, self._read_unfiltered_examples(read_keys),
+                self.name)
+            return (example[:len(keys)] for example in examples)
+
+        return self._read_unfiltered_examples(keys)
+
+    def _read_unfiltered_examples(self, keys: List[str]) -> Iterable[Tuple]:
+        file_keys = [key for key in keys
+                     if key in self.series_paths_and_readers]
+
+        columns = {}  # type: Dict[str, Iterable]
+        for paths, reader, group in column_groups(
+                self.series_paths_and_readers, file_keys):
+            if not isinstance(reader, MultiColumnReader):
+                continue
+
+            rows = itertools.tee(self._read_source(paths, reader.rows),
+                                 len(group))
+            for (key, column), key_rows in zip(group, rows):
+                columns[key] = map(
+                    functools.partial(reader.select, column=column), key_rows)
+
+        return zip(*[columns[key] if key in columns else self._get_series(key)
+                     for key in keys])
+
+    def batch_dataset(self, batch_size: int) -> Iterable[Dataset]:
+        """Split the dataset into a list of batched datasets.
+
+        The batches are read from the files as the generator proceeds.
+
+        Arguments:
+            batch_size: The size of a batch.
+
+        Returns:
+            Generator yielding batched datasets.
+        """
+        keys = list(self.series_ids)
+        examples = iter(self._read_examples(keys))
+
+        for batch_index in itertools.count():
+            batch = list(itertools.islice(examples, batch_size))
+            if not batch:
+                break
+            yield self._batch(keys, batch_index, batch)
+
+    def bucket_batch_dataset(
+            self, max_tokens: int,
+            buffer_size: Optional[int] = None) -> Iterable[Dataset]:
+        """Split the dataset into batches of examples of similar lengths.
+
+        Only a buffer of ``buffer_size`` examples is read at a time, so the
+        whole dataset is never loaded to the memory.
+
+        Arguments:
+            max_tokens: The maximum number of tokens in a batch.
+            buffer_size: The number of examples sorted together. If None,
+                ``BUCKET_BUFFER_SIZE`` examples are sorted together.
+
+        Returns:
+            Generator yielding batched datasets.
+        """
+        if buffer_size is None:
+            buffer_size = BUCKET_BUFFER_SIZE
+
+        keys = list(self.series_ids)
+        examples = self._read_examples(keys)
+
+        batches = bucket_batches(examples, max_tokens, buffer_size)
+        for batch_index, batch in enumerate(batches):
+            yield self._batch(keys, batch_index, batch)
+
+    def _batch(self, keys: List[str], batch_index: int,
+               examples: List[Tuple]) -> Dataset:
+        """Create an in-memory dataset of a batch of the examples."""
+        return Dataset(self.name + "-batch-{}".format(batch_index),
+                       {key: list(data)
+                        for key, data in zip(keys, zip(*examples))}, {})
+
+    def get_indexed_series(
+            self, name: str,
+            vocabulary: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get a text series converted to indices of a vocabulary.
+
+        The lazy dataset does not keep the indices, the series is read and
+        converted on every request. The batches of the dataset are in-memory
+        datasets which keep the indices of their own series.
+        """
+        return index_whole_series(self.get_series(name), vocabulary)
+
+    def add_series(self, name: str, series: Iterable[Any]) -> None:
+        raise NotImplementedError(
+            "Lazy dataset does not support adding series.")
+
+    def from_offset(self, start: int) -> "LazyDataset":
+        """Get a view of the dataset starting from the given example.
+
+        If all the series are read by line-based readers, the files are
+        read directly from the starting line located by the line index.
+        Otherwise, the preceding examples are read and thrown away. The view
+        is never shuffled, the examples are skipped in the order of the
+        files. If the dataset has a length filter, the limited series are
+        read to find the line of the starting example.
+
+        Arguments:
+            start: The number of examples to skip.
+
+        Returns:
+            A lazy dataset sharing the files with this one.
+        """
+        if self.shuffle_buffer_size is not None:
+            warn("The view of dataset '{}' starting from example {} is not "
+                 "shuffled, the examples are skipped in the order of the "
+                 "files".format(self.name, start))
+
+        if self.length_filter is not None and self.length_filter.limits:
+            keys = list(self.length_filter.limits)
+            unfiltered = self._offset_view(self._start_offset, None)
+            start = self.length_filter.skipped_examples(
+                keys, zip(*[unfiltered.get_series(key) for key in keys]),
+                start, self.name)
+        return self._offset_view(self._start_offset + start,
+                                 self.length_filter)
+
+    def _offset_view(self, offset: int, length_filter: Optional[LengthFilter]
+                     ) -> "LazyDataset":
+        """Get an unshuffled view of the dataset starting from a line."""
+        dataset = LazyDataset(
+            self.name, self.series_paths_and_readers, self.series_outputs,
+            shuffle_chunk_size=self.shuffle_chunk_size,
+            num_workers=self.num_workers, cache=self.cache,
+            length_filter=length_filter, start_offset=offset)
+        dataset.preprocess_series = dict(self.preprocess_series)
+        return dataset
+
+    def subset(self, start: int, length: int) -> "Dataset":
+        # new name
+        subset_name = "{}.{}.{}".format(self.name, start, length)
+
+        # new outputs
+        subset_outputs = {k: "{}.{:010}".format(v, start)
+                          for k, v in self.series_outputs.items()}
+
+        # new series, read as a single batch of the view
+        batch = next(iter(self.from_offset(start).batch_dataset(length)),
+                     None)
+        subset_series = {
+            key: [] if batch is None else list(batch.get_series(key))
+            for key in self.series_ids}
+
+        return Dataset(subset_name, subset_series, subset_outputs)
+
+
+def _parse_line_chunk(reader: Reader, chunk: List[bytes]) -> List[Any]:
+    """Parse a chunk of lines read from the files using a line reader."""
+    encoding = reader.encoding  # type: ignore
+    return list(reader.parse_lines(  # type: ignore
+        line.decode(encoding) for line in chunk))
@@ -3,7 +3,7 @@
 
 # pylint: disable=unused-import
 from typing import (Any, Callable, Dict, List, Tuple, Optional, Union,
-                    Iterable, Set)
+                    Set)
 # pylint: enable=unused-import
 
 import time
@@ -50,7 +50,8 @@ def training_loop(tf_manager: TensorFlowManager,
                   train_start_offset: int = 0,
                   runners_batch_size: Optional[int] = None,
                   initial_variables: Optional[Union[str, List[str]]] = None,
-                  postprocess: Postprocess = None) -> None:
+                  postprocess: Postprocess = None,
+                  batch_max_tokens: Optional[int] = None) -> None:
     """Execute the training loop for given graph and data.
 
     Args:
@@ -84,13 +85,16 @@ def training_loop(tf_manager: TensorFlowManager,
         val_preview_num_examples: how many examples should be printed during
             validation
         train_start_offset: how many lines from the training dataset should be
-            skipped. The training starts from the next batch.
+            skipped. The training starts from the next line.
         runners_batch_size: batch size of runners. It is the same as batch_size
             if not specified
         initial_variables: variables used for initialization, for example for
             continuation of training
         postprocess: A function which takes the dataset with its output series
             and generates additional series from them.
+        batch_max_tokens: If specified, the training batches are formed from
+            examples of similar lengths and their size is limited by the
+            number of tokens (including padding) instead of ``batch_size``.
     """
     check_argument_types()
 
@@ -158,23 +162,40 @@ def training_loop(tf_manager: TensorFlowManager,
             log("Epoch {} starts".format(epoch_n), color="red")
 
             train_dataset.shuffle()
-            train_batched_datasets = train_dataset.batch_dataset(batch_size)
+            epoch_dataset = train_dataset  # type: Dataset
 
             if epoch_n == 1 and train_start_offset:
                 if not isinstance(train_dataset, LazyDataset):
                     warn("Not skipping training instances with "
                          "shuffled in-memory dataset")
+                elif train_dataset.shuffle_buffer_size is not None:
+                    warn("Not skipping training instances with "
+                         "shuffled lazy dataset")
                 else:
-                    _skip_lines(train_start_offset, train_batched_datasets)
+                    epoch_dataset = _skip_lines(train_start_offset,
+                                                train_dataset)
+
+            if batch_max_tokens is None:
+                train_batched_datasets = epoch_dataset.batch_dataset(
+                    batch_size)
+            else:
+                train_batched_datasets = epoch_dataset.bucket_batch_dataset(
+                    batch_max_tokens)
+
+            # the feed dicts of the following batches are prepared while the
+            # current batch is being trained on
+            train_batches = tf_manager.prefetch(
+                train_batched_datasets, trainer.all_coders, train=True)
 
-            for batch_n, batch_dataset in enumerate(train_batched_datasets):
+            for batch_n, (batch_dataset, batch_feed_dict) in enumerate(
+                    train_batches):
                 step += 1
                 seen_instances += len(batch_dataset)
                 if _is_logging_time(step, log_period_batch,
                                     last_log_time, log_period_time):
                     trainer_result = tf_manager.execute(
                         batch_dataset, [trainer], train=True,
-                        summaries=True)
+                        summaries=True, feed_dict=batch_feed_dict)
                     train_results, train_outputs = run_on_dataset(
                         tf_manager, runners, batch_dataset,
                         postprocess, write_out=False,
@@ -193,7 +214,8 @@ def training_loop(tf_manager: TensorFlowManager,
                     last_log_time = time.process_time()
                 else:
                     tf_manager.execute(batch_dataset, [trainer],
-                                       train=True, summaries=False)
+                                       train=True, summaries=False,
+                                       feed_dict=batch_feed_dict)
 
                 if _is_logging_time(step, val_period_batch,
                                     last_val_time, val_period_time):
@@ -636,26 +658,25 @@ def _print_examples(dataset: Dataset,
         log_print("")
 
 
-def _skip_lines(start_offset: int,
-                batched_datasets: Iterable[Dataset]) -> None:
+def _skip_lines(start_offset: int, dataset: LazyDataset) -> Dataset:
     """Skip training instances from the beginning.
 
     Arguments:
-        start_offset: How many training instances to skip (minimum)
-        batched_datasets: From where to throw away batches
+        start_offset: How many training instances to skip
+        dataset: The lazy dataset to skip the instances from
+
+    Returns:
+        A view of the dataset starting after the skipped instances.
     """
     log("Skipping first {} instances in the dataset".format(start_offset))
 
-    skipped_instances = 0
-    while skipped_instances < start_offset:
-        try:
-            skipped_instances += len(next(batched_datasets))  # type: ignore
-        except StopIteration:
-            raise ValueError("Trying to skip more instances than "
-                             "the size of the dataset")
+    skipped = dataset.from_offset(start_offset)
+    if len(skipped) == 0:
+        raise ValueError("Trying to skip more instances than "
+                         "the size of the dataset")
 
-    if skipped_instances > 0:
-        log("Skipped {} instances".format(skipped_instances))
+    log("Skipped {} instances".format(start_offset))
+    return skipped
 
 
 def _log_model_variables(var_list: List[tf.Variable] = None) -> None:
@@ -0,0 +1,187 @@
+"""Filtering of dataset examples by the lengths of their series."""
+
+import itertools
+import re
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from neuralmonkey.logging import log
+from neuralmonkey.readers.binary_reader import compact_token_series
+
+SERIES_MIN_LENGTH = re.compile("min_len_([^_]*)$")
+SERIES_MAX_LENGTH = re.compile("max_len_([^_]*)$")
+
+
+class LengthFilter(object):
+    """Filter of dataset examples by the lengths of their series.
+
+    An example is removed if a series item is shorter than the minimum
+    length or longer than the maximum length of the series, or if the ratio
+    of the longest and the shortest item of the limited series exceeds the
+    maximum ratio. Optionally, the long items are truncated to the maximum
+    length instead of removing the examples.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[Optional[int],
+                                               Optional[int]]],
+                 max_ratio: float = None,
+                 truncate: bool = False) -> None:
+        """Create a new length filter.
+
+        Arguments:
+            limits: Mapping of the series names to their minimum and maximum
+                lengths (either of them can be None).
+            max_ratio: The maximum ratio of the lengths of the limited
+                series in an example. If None, the ratio is not limited.
+            truncate: If true, the items longer than the maximum length are
+                truncated, otherwise the examples are removed.
+        """
+        if max_ratio is not None and max_ratio < 1:
+            raise ValueError("Maximum length ratio must be at least 1, was {}"
+                             .format(max_ratio))
+        self.limits = limits
+        self.max_ratio = max_ratio
+        self.truncate = truncate
+
+    def restrict(self, keys: Iterable[str],
+                 check_ratio: bool = True) -> "LengthFilter":
+        """Get a filter of only some of the series."""
+        return LengthFilter({key: limit for key, limit in self.limits.items()
+                             if key in keys},
+                            self.max_ratio if check_ratio else None,
+                            self.truncate)
+
+    def filter(self, keys: List[str], examples: Iterable[Tuple],
+               dataset_name: str) -> Iterable[Tuple]:
+        """Filter examples and log the number of the removed ones.
+
+        Arguments:
+            keys: The names of the series in the examples. They must include
+                all the limited series.
+            examples: The examples as tuples of the series items.
+            dataset_name: The name of the dataset used in the log message.
+
+        Returns:
+            Generator of the kept (and possibly truncated) examples.
+        """
+        limited = [(keys.index(key), min_len, max_len)
+                   for key, (min_len, max_len) in self.limits.items()]
+
+        removed = 0
+        truncated = 0
+        for example in examples:
+            lengths = []
+            keep = True
+            for index, min_len, max_len in limited:
+                length = len(example[index])
+                if min_len is not None and length < min_len:
+                    keep = False
+                    break
+                if max_len is not None and length > max_len:
+                    if not self.truncate:
+                        keep = False
+                        break
+                    example = (example[:index]
+                               + (example[index][:max_len],)
+                               + example[index + 1:])
+                    length = max_len
+                    truncated += 1
+                lengths.append(length)
+
+            if (keep and self.max_ratio is not None and len(lengths) > 1
+                    and max(lengths) > self.max_ratio * max(min(lengths), 1)):
+                keep = False
+
+            if keep:
+                yield example
+            else:
+                removed += 1
+
+        log("Length filter removed {} examples from dataset '{}'{}".format(
+            removed, dataset_name,
+            ", truncated {} items".format(truncated) if self.truncate
+            else ""))
+
+    def skipped_examples(self, keys: List[str], examples: Iterable[Tuple],
+                         start: int, dataset_name: str) -> int:
+        """Count the examples read until the given number of them is kept.
+
+        Arguments:
+            keys: The names of the series in the examples.
+            examples: The unfiltered examples.
+            start: The number of the kept examples to skip.
+            dataset_name: The name of the dataset used in the log message.
+
+        Returns:
+            The number of the unfiltered examples preceding the first kept
+            example after the skipped ones (or the number of all of them).
+        """
+        positions = itertools.count()
+        kept = itertools.islice(
+            self.filter(keys + [""],
+                        (example + (next(positions),)
+                         for example in examples), dataset_name),
+            start, None)
+        example = next(kept, None)
+        if example is None:
+            return next(positions)
+        return example[-1]
+
+    def filter_series(self, series: Dict[str, Any],
+                      dataset_name: str) -> Dict[str, Any]:
+        """Filter the series of an in-memory dataset."""
+        if not self.limits:
+            return series
+
+        keys = list(series.keys())
+        examples = list(self.filter(keys, zip(*[series[key] for key in keys]),
+                                    dataset_name))
+        if (not self.truncate
+                and len(examples) == len(next(iter(series.values())))):
+            return series
+
+        return {key: _series_from_items([example[i] for example in examples],
+                                        series[key])
+                for i, key in enumerate(keys)}
+
+
+def _series_from_items(items: List[Any], original: Any) -> Any:
+    """Create a series of the same kind as the original one."""
+    if isinstance(original, np.ndarray):
+        return np.array(items, dtype=original.dtype).reshape(
+            (len(items),) + original.shape[1:])
+    return compact_token_series(items)
+
+
+def get_length_filter(series_config: Dict[str, Any],
+                      max_ratio: Optional[float],
+                      truncate: bool) -> Optional[LengthFilter]:
+    """Get the length filter from the dataset keyword argument specs.
+
+    The minimum and maximum lengths of a series named 'xxx' are specified by
+    the 'min_len_xxx' and 'max_len_xxx' parameters.
+
+    Returns:
+        The length filter or None if no series lengths are limited.
+    """
+    limits = {}  # type: Dict[str, Tuple[Optional[int], Optional[int]]]
+    for key, value in series_config.items():
+        for index, regex in enumerate([SERIES_MIN_LENGTH, SERIES_MAX_LENGTH]):
+            matcher = regex.match(key)
+            if matcher:
+                if not isinstance(value, int) or value < 0:
+                    raise ValueError(
+                        "Length limit '{}' must be a non-negative integer, "
+                        "was {}.".format(key, value))
+                limit = list(limits.get(matcher.group(1), (None, None)))
+                limit[index] = value
+                limits[matcher.group(1)] = (limit[0], limit[1])
+
+    if not limits:
+        if max_ratio is not None:
+            raise ValueError("Maximum length ratio is set, but no series "
+                             "has limited length.")
+        return None
+    return LengthFilter(limits, max_ratio, truncate)
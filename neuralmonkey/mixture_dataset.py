@@ -0,0 +1,165 @@
+"""Implementation of the weighted mixture of datasets."""
+
+import itertools
+
+from typing import (Any, List, Callable, Iterable, Iterator, Dict, Optional,
+                    Tuple)
+
+import numpy as np
+from typeguard import check_argument_types
+
+from neuralmonkey.base_dataset import Dataset, index_whole_series
+
+
+class MixtureDataset(Dataset):
+    """A weighted mixture of several datasets.
+
+    The mixture streams batches of its datasets: each batch is taken from
+    a dataset chosen randomly according to the weights. Every dataset keeps
+    its own position across the epochs of the mixture; when it runs out of
+    examples, it is shuffled (using its own shuffling, e.g. the shuffle
+    buffer of a lazy dataset) and read again from the beginning. The datasets
+    are never concatenated or loaded to the memory by the mixture.
+
+    An epoch of the mixture ends after ``epoch_size`` examples.
+    """
+
+    def __init__(self, name: str,
+                 datasets: List[Dataset],
+                 weights: List[float] = None,
+                 epoch_size: int = None) -> None:
+        """Create a new mixture of datasets.
+
+        Arguments:
+            name: The name of the dataset.
+            datasets: The mixed datasets.
+            weights: The probabilities of taking a batch from the datasets.
+                They do not need to sum to one. If None, all the datasets
+                have the same weight.
+            epoch_size: The number of examples in an epoch. If None, it is
+                the total length of the datasets.
+        """
+        check_argument_types()
+        if not datasets:
+            raise ValueError("The mixture must contain at least one dataset.")
+        if weights is None:
+            weights = [1.] * len(datasets)
+        if len(weights) != len(datasets):
+            raise ValueError(
+                "The number of weights ({}) differs from the number of "
+                "datasets ({}).".format(len(weights), len(datasets)))
+        if any(weight < 0 for weight in weights) or sum(weights) <= 0:
+            raise ValueError("The weights must be non-negative and must not "
+                             "all be zero, were {}.".format(weights))
+        if epoch_size is not None and epoch_size <= 0:
+            raise ValueError("Epoch size must be positive, was {}"
+                             .format(epoch_size))
+
+        super().__init__(name, {}, {})
+        self.datasets = datasets
+        self.weights = np.array(weights, dtype=np.float64) / sum(weights)
+        self.epoch_size = epoch_size
+
+        # the batch streams of the datasets, one for every batching setup
+        self._streams = {}  # type: Dict[Tuple, List[Iterator[Dataset]]]
+
+    def __len__(self) -> int:
+        """Get the number of examples in an epoch of the mixture."""
+        if self.epoch_size is not None:
+            return self.epoch_size
+        return sum(len(dataset) for dataset in self.datasets)
+
+    def has_series(self, name: str) -> bool:
+        return all(dataset.has_series(name) for dataset in self.datasets)
+
+    @property
+    def series_ids(self) -> Iterable[str]:
+        return [series_id for series_id in self.datasets[0].series_ids
+                if self.has_series(series_id)]
+
+    def get_series(self, name: str, allow_none: bool = False) -> Iterable:
+        """Get a series of all the datasets, one after another.
+
+        The series are chained lazily, so they are not loaded at once.
+        """
+        if not self.has_series(name):
+            if allow_none:
+                return None
+            raise KeyError("Series '{}' is not in all the mixed datasets."
+                           .format(name))
+        return itertools.chain.from_iterable(
+            dataset.get_series(name) for dataset in self.datasets)
+
+    def shuffle(self) -> None:
+        """Do nothing, the datasets are shuffled when they are exhausted."""
+
+    def batch_dataset(self, batch_size: int) -> Iterable[Dataset]:
+        return self._mix_batches(
+            ("batch", batch_size),
+            lambda dataset: dataset.batch_dataset(batch_size))
+
+    def bucket_batch_dataset(
+            self, max_tokens: int,
+            buffer_size: Optional[int] = None) -> Iterable[Dataset]:
+        return self._mix_batches(
+            ("bucket", max_tokens, buffer_size),
+            lambda dataset: dataset.bucket_batch_dataset(max_tokens,
+                                                         buffer_size))
+
+    def _mix_batches(
+            self, key: Tuple,
+            batches: Callable[[Dataset], Iterable[Dataset]]
+    ) -> Iterable[Dataset]:
+        """Yield the batches of an epoch of the mixture.
+
+        Arguments:
+            key: Identifier of the batching setup. The datasets continue
+                where the previous epoch with the same setup stopped.
+            batches: Function splitting a dataset into batches.
+        """
+        if key not in self._streams:
+            self._streams[key] = [_repeat_batches(dataset, batches)
+                                  for dataset in self.datasets]
+        streams = self._streams[key]
+
+        # the length of a lazy dataset may need reading its files
+        epoch_size = len(self)
+        examples = 0
+        while examples < epoch_size:
+            dataset_index = np.random.choice(len(streams), p=self.weights)
+            batch = next(streams[dataset_index], None)
+            if batch is None:
+                # the stream was closed by an error in an earlier epoch
+                raise ValueError("Dataset '{}' in a mixture stopped "
+                                 "yielding batches.".format(
+                                     self.datasets[dataset_index].name))
+            examples += len(batch)
+            yield batch
+
+    def get_indexed_series(
+            self, name: str,
+            vocabulary: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return index_whole_series(self.get_series(name), vocabulary)
+
+    def add_series(self, name: str, series: Iterable[Any]) -> None:
+        raise NotImplementedError(
+            "Mixture dataset does not support adding series.")
+
+    def subset(self, start: int, length: int) -> "Dataset":
+        raise NotImplementedError(
+            "Mixture dataset does not support subsets.")
+
+
+def _repeat_batches(
+        dataset: Dataset,
+        batches: Callable[[Dataset], Iterable[Dataset]]) -> Iterator[Dataset]:
+    """Split a dataset into batches endlessly, shuffling it every time."""
+    while True:
+        dataset.shuffle()
+        empty = True
+        for batch in batches(dataset):
+            empty = False
+            yield batch
+        if empty:
+            raise ValueError("Dataset '{}' in a mixture is empty."
+                             .format(dataset.name))
@@ -3,6 +3,7 @@
 import os
 from typing import List
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.contrib.tensorboard.plugins import projector
 from typeguard import check_argument_types
@@ -180,26 +181,27 @@ class EmbeddedFactorSequence(Sequence):
         fd = {}  # type: FeedDict
 
         # for checking the lengths of individual factors
-        arr_strings = []
-        last_paddings = None
+        first_paddings = None
 
         for factor_plc, name, vocabulary in zip(
                 self.input_factors, self.data_ids, self.vocabularies):
-            factors = dataset.get_series(name)
-            vectors, paddings = vocabulary.sentences_to_tensor(
-                list(factors), self.max_length, pad_to_max_len=False,
-                train_mode=train, add_start_symbol=self.add_start_symbol,
-                add_end_symbol=self.add_end_symbol)
-
-            fd[factor_plc] = list(zip(*vectors))
-
-            arr_strings.append(paddings.tostring())
-            last_paddings = paddings
-
-        if len(set(arr_strings)) > 1:
-            raise ValueError("The lenghts of factors do not match")
-
-        fd[self.mask] = list(zip(*last_paddings))
+            # the series is converted to indices only once for all batches
+            indices, starts, lengths = dataset.get_indexed_series(
+                name, vocabulary)
+            vectors, paddings = vocabulary.indices_to_tensor(
+                indices, starts, lengths, self.max_length,
+                pad_to_max_len=False, train_mode=train,
+                add_start_symbol=self.add_start_symbol,
+                add_end_symbol=self.add_end_symbol, time_major=False)
+
+            fd[factor_plc] = vectors
+
+            if first_paddings is None:
+                first_paddings = paddings
+            elif not np.array_equal(paddings, first_paddings):
+                raise ValueError("The lenghts of factors do not match")
+
+        fd[self.mask] = first_paddings
 
         return fd
 
@@ -0,0 +1,194 @@
+"""Shared pool of worker processes for data loading.
+
+The datasets, the vocabularies and the readers process data in parallel
+using a shared pool of worker processes. The pool is created at the first
+use and reused for all the functions applied in parallel, so the workers are
+not started again for every read of a series (e.g. the validation data in the
+middle of the training) and no idle workers are kept for the functions which
+are not used any more. The pool is shut down when the program exits.
+
+The function is pickled once for every map and sent to the workers together
+with the chunks of items. The workers keep the recently used functions, so
+large preprocessors (e.g. a BPE model or a vocabulary) are unpickled by each
+worker only once.
+
+The workers are started by a fork server (or spawned where the fork server
+is not available), never forked from the current process. Forking
+a process that runs other threads, such as the TensorFlow sessions, could
+copy locks held by these threads and deadlock the workers.
+
+The functions and items sent to the workers are pickled, so the functions
+need to be defined at the module level (or be picklable objects). Functions
+which cannot be pickled, e.g. closures, are applied in the current process.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Set
+import atexit
+import collections
+import functools
+import hashlib
+import itertools
+import multiprocessing
+import multiprocessing.pool
+import pickle
+import threading
+
+from neuralmonkey.logging import warn
+
+# Number of items sent to a worker at once
+PARALLEL_CHUNK_SIZE = 1000
+
+# Number of recently used functions kept unpickled by a worker
+WORKER_FUNCTIONS = 8
+
+_POOLS = {}  # type: Dict[int, multiprocessing.pool.Pool]
+_POOLS_LOCK = threading.Lock()
+_WARNED = set()  # type: Set[str]
+
+# the functions unpickled by a worker process, by their hashes
+_WORKER_FUNCTIONS = collections.OrderedDict()  # type: collections.OrderedDict
+
+
+def _context() -> Any:
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _apply_worker_function(function_hash: str, pickled_function: bytes,
+                           chunk: List[Any]) -> List[Any]:
+    function = _WORKER_FUNCTIONS.pop(function_hash, None)
+    if function is None:
+        function = pickle.loads(pickled_function)
+        if len(_WORKER_FUNCTIONS) >= WORKER_FUNCTIONS:
+            _WORKER_FUNCTIONS.popitem(last=False)
+    _WORKER_FUNCTIONS[function_hash] = function
+    return function(chunk)
+
+
+def get_pool(num_workers: int) -> multiprocessing.pool.Pool:
+    """Get the shared pool of worker processes.
+
+    Arguments:
+        num_workers: The number of the worker processes.
+
+    Returns:
+        The pool, created at the first request.
+    """
+    with _POOLS_LOCK:
+        if num_workers not in _POOLS:
+            _POOLS[num_workers] = _context().Pool(num_workers)
+        return _POOLS[num_workers]
+
+
+@atexit.register
+def _shutdown_pools() -> None:
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.terminate()
+            pool.join()
+        _POOLS.clear()
+
+
+def is_picklable(obj: Any) -> bool:
+    """Check whether an object can be sent to the worker processes."""
+    try:
+        pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    # pylint: disable=broad-except
+    # pickling calls arbitrary code of the objects, which can raise anything
+    except Exception:
+        return False
+    # pylint: enable=broad-except
+    return True
+
+
+def _map_items(function: Callable[[Any], Any],
+               chunk: List[Any]) -> List[Any]:
+    return [function(item) for item in chunk]
+
+
+def _map_chunks(function: Callable[[List[Any]], List[Any]],
+                items: Iterable[Any], num_workers: int, chunk_size: int,
+                description: str) -> Iterable[Any]:
+    iterator = iter(items)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+
+    try:
+        pickled_function = pickle.dumps(function,
+                                        protocol=pickle.HIGHEST_PROTOCOL)
+    # pylint: disable=broad-except
+    # pickling calls arbitrary code of the objects, which can raise anything
+    except Exception:
+        if description not in _WARNED:
+            _WARNED.add(description)
+            warn("Function {} cannot be sent to worker processes, it is "
+                 "applied in the main process.".format(description))
+        for chunk in chunks:
+            yield from function(chunk)
+        return
+    # pylint: enable=broad-except
+
+    pool = get_pool(num_workers)
+    function_hash = hashlib.sha1(pickled_function).hexdigest()
+
+    # at most two chunks per worker are read ahead, so the items do not
+    # need to fit in the memory
+    pending = collections.deque()  # type: collections.deque
+    for chunk in chunks:
+        pending.append(pool.apply_async(
+            _apply_worker_function,
+            (function_hash, pickled_function, chunk)))
+        if len(pending) >= 2 * num_workers:
+            yield from pending.popleft().get()
+
+    while pending:
+        yield from pending.popleft().get()
+
+
+def _describe(function: Callable) -> str:
+    return getattr(function, "__qualname__", type(function).__qualname__)
+
+
+def parallel_map_chunks(function: Callable[[List[Any]], List[Any]],
+                        items: Iterable[Any], num_workers: int,
+                        chunk_size: int = PARALLEL_CHUNK_SIZE
+                       ) -> Iterable[Any]:
+    """Apply a function to chunks of items in the shared worker pool.
+
+    If the function cannot be pickled, it is applied to the chunks in the
+    current process. The items and the results must be picklable.
+
+    Arguments:
+        function: The function turning a list of items to a list of results.
+        items: The items to process. They are consumed as the results are
+            requested.
+        num_workers: The number of worker processes.
+        chunk_size: The number of items in a chunk.
+
+    Returns:
+        Generator yielding the results in the order of the items.
+    """
+    return _map_chunks(function, items, num_workers, chunk_size,
+                       _describe(function))
+
+
+def parallel_map(function: Callable[[Any], Any], items: Iterable[Any],
+                 num_workers: int,
+                 chunk_size: int = PARALLEL_CHUNK_SIZE) -> Iterable[Any]:
+    """Apply a function to items, in the shared worker pool if requested.
+
+    Arguments:
+        function: The function to apply.
+        items: The items to process.
+        num_workers: The number of worker processes. If 1, the function is
+            applied in the current process.
+        chunk_size: The number of items sent to a worker at once.
+
+    Returns:
+        Iterable of the results in the order of the items.
+    """
+    if num_workers <= 1:
+        return map(function, items)
+
+    return _map_chunks(functools.partial(_map_items, function), items,
+                       num_workers, chunk_size, _describe(function))
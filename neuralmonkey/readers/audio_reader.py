@@ -26,11 +26,7 @@ def audio_reader(prefix: str = "",
         provided prefix) and returns a list of numpy arrays.
     """
 
-    if audio_format == "wav":
-        load_file = _load_wav
-    elif audio_format == "sph":
-        load_file = _load_sph
-    else:
+    if audio_format not in AUDIO_LOADERS:
         raise ValueError(
             "Unsupported audio format: {}".format(audio_format))
 
@@ -39,11 +35,24 @@ def audio_reader(prefix: str = "",
             with open(list_file) as f_list:
                 for audio_file in f_list:
                     path = os.path.join(prefix, audio_file.rstrip())
-                    yield load_file(path)
+                    yield load_audio(path, audio_format)
 
     return load
 
 
+def load_audio(path: str, audio_format: str = "wav") -> Audio:
+    """Read a single audio file.
+
+    Args:
+        path: The path to the file.
+        audio_format: The format of the file, 'wav' or 'sph'.
+    """
+    if audio_format not in AUDIO_LOADERS:
+        raise ValueError(
+            "Unsupported audio format: {}".format(audio_format))
+    return AUDIO_LOADERS[audio_format](path)
+
+
 def _load_wav(path: str) -> Audio:
     """Read a WAV file."""
     return Audio(*wavfile.read(path))
@@ -62,3 +71,7 @@ def _load_sph(path: str) -> Audio:
                            "processing {}".format(error_code, path))
 
     return Audio(*wavfile.read(data))
+
+
+AUDIO_LOADERS = {"wav": _load_wav,
+                 "sph": _load_sph}
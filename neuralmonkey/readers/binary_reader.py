@@ -0,0 +1,297 @@
+"""Binary storage of data series.
+
+Tokenized text series are stored as a flat array of int32 token ids, an
+array of int64 sentence offsets and a table of the token strings. Other
+series are stored as a file of pickled items with an array of their offsets.
+Both kinds of series are loaded as sequences with random access which read
+the items from memory-mapped files only when they are accessed.
+
+The same compact representation of tokenized text is also used for the text
+series of in-memory datasets, which saves the overhead of Python lists and
+strings (see ``compact_token_series``).
+"""
+
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, cast
+import array
+import collections
+import json
+import os
+import pickle
+
+import numpy as np
+
+from neuralmonkey.readers.numpy_reader import ConcatenatedArray
+
+
+class OffsetSeries(collections.Sequence):
+    """A series of items stored as consecutive parts of flat arrays.
+
+    The item boundaries are given by an array of int64 offsets (with one
+    extra offset for the end of the last item). The items are decoded from
+    their parts of the arrays only when accessed, so the series supports
+    random access without reading whole memory-mapped files.
+    """
+
+    def __init__(self, offsets: np.ndarray) -> None:
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        """Get the number of items in the series."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        """Get an item or a list of the items selected by a slice."""
+        if isinstance(item, slice):
+            return [self[i] for i in range(len(self))[item]]
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Series index out of range")
+
+        return self._item(self.offsets[item], self.offsets[item + 1])
+
+    def _item(self, start: int, end: int) -> Any:
+        """Decode the item stored between the given offsets."""
+        raise NotImplementedError()
+
+
+class BinarySeries(OffsetSeries):
+    """A tokenized text series stored in flat arrays.
+
+    The tokens of all sentences are stored as a flat array of int32 token
+    ids, the sentence boundaries as an array of int64 offsets to the flat
+    array (with one extra offset for the end of the last sentence). The ids
+    index a table of token strings which is loaded to the memory. The arrays
+    are either memory-mapped binary files or arrays in the memory.
+    """
+
+    def __init__(self, token_ids: np.ndarray, offsets: np.ndarray,
+                 tokens: np.ndarray) -> None:
+        """Create the series from the loaded arrays.
+
+        Arguments:
+            token_ids: The flat array of the token ids.
+            offsets: The array of sentence start offsets.
+            tokens: Array of token strings indexed by the token ids.
+        """
+        super().__init__(offsets)
+        self.token_ids = token_ids
+        self.tokens = tokens
+
+    def _item(self, start: int, end: int) -> List[str]:
+        return self.tokens[self.token_ids[start:end]].tolist()
+
+
+class PickledSeries(OffsetSeries):
+    """A series of arbitrary picklable items stored in a binary file.
+
+    Every item is pickled separately, so it can be loaded on its own using
+    the array of the item offsets in the file.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        """Create the series from the loaded arrays.
+
+        Arguments:
+            data: The bytes of the pickled items.
+            offsets: The array of item start offsets in the data, followed
+                by the size of the data.
+        """
+        super().__init__(offsets)
+        self.data = data
+
+    def _item(self, start: int, end: int) -> Any:
+        return pickle.loads(self.data[start:end].tobytes())
+
+
+def compact_token_series(series: Iterable[Any]) -> Sequence[Any]:
+    """Store a tokenized text series compactly in the memory.
+
+    The tokens are interned in a table shared by the whole series and the
+    sentences are stored as flat arrays of token ids and offsets. Accessing
+    a sentence returns a new list of the tokens, so the series behaves like
+    a list of sentences for preprocessors and vocabularies.
+
+    Arguments:
+        series: The series to store.
+
+    Returns:
+        The series itself if it is an array (which may be memory-mapped),
+        a ``BinarySeries`` if all items of the series are lists (or tuples)
+        of strings, a list of the items otherwise.
+    """
+    if isinstance(series, (np.ndarray, ConcatenatedArray)):
+        return series
+
+    token_to_id = {}  # type: Dict[str, int]
+    token_ids = array.array("i")
+    offsets = array.array("q", [0])
+
+    def stored() -> BinarySeries:
+        tokens = np.empty([len(token_to_id)], dtype=object)
+        tokens[:] = sorted(token_to_id, key=token_to_id.__getitem__)
+        return BinarySeries(
+            np.frombuffer(token_ids, dtype=np.int32)
+            if token_ids else np.zeros([0], dtype=np.int32),
+            np.frombuffer(offsets, dtype=np.int64), tokens)
+
+    iterator = iter(series)
+    for sentence in iterator:
+        if isinstance(sentence, (list, tuple)):
+            sentence_ids = [token_to_id.get(token) for token in sentence]
+            if None in sentence_ids:
+                for i, token in enumerate(sentence):
+                    if sentence_ids[i] is None and isinstance(token, str):
+                        sentence_ids[i] = token_to_id.setdefault(
+                            token, len(token_to_id))
+
+        if (not isinstance(sentence, (list, tuple))
+                or None in sentence_ids):
+            # not a tokenized text, the series stays a list
+            return list(stored()) + [sentence] + list(iterator)
+
+        token_ids.extend(cast(List[int], sentence_ids))
+        offsets.append(offsets[-1] + len(sentence_ids))
+
+    if len(offsets) == 1:
+        return []
+    return stored()
+
+
+def _binary_series_paths(directory: str,
+                         series_id: str) -> Tuple[str, str, str]:
+    """Get paths to the token ids, offsets and token table of a series."""
+    prefix = os.path.join(directory, series_id)
+    return prefix + ".ids", prefix + ".offsets", prefix + ".tokens.json"
+
+
+def _pickled_series_paths(directory: str, series_id: str) -> Tuple[str, str]:
+    """Get paths to the pickled items and offsets of a series."""
+    prefix = os.path.join(directory, series_id)
+    return prefix + ".pickle", prefix + ".pickle.offsets"
+
+
+def _memmap(path: str, dtype: type) -> np.ndarray:
+    # memory-mapping of an empty file is not possible
+    if os.path.getsize(path) > 0:
+        return np.memmap(path, dtype=dtype, mode="r")
+    return np.zeros([0], dtype=dtype)
+
+
+def save_binary_series(series: Iterable[List[str]], directory: str,
+                       series_id: str, chunk_size: int = 10000) -> int:
+    """Write a tokenized text series in the binary format.
+
+    Arguments:
+        series: The sentences as lists of string tokens.
+        directory: The directory to store the files to.
+        series_id: The name of the series, used as a prefix of the files.
+        chunk_size: Number of sentences written to the disk at once.
+
+    Returns:
+        The number of sentences in the series.
+
+    Raises:
+        ValueError if the series does not contain tokenized text.
+    """
+    ids_path, offsets_path, tokens_path = _binary_series_paths(
+        directory, series_id)
+
+    token_to_id = {}  # type: Dict[str, int]
+    offsets = [0]
+    chunk = []  # type: List[int]
+
+    with open(ids_path, "wb") as f_ids:
+        for sentence in series:
+            if not isinstance(sentence, (list, tuple)):
+                raise ValueError(
+                    "Series '{}' does not contain tokenized text, found "
+                    "item of type {}".format(series_id, type(sentence)))
+
+            for token in sentence:
+                token_id = token_to_id.get(token)
+                if token_id is None:
+                    if not isinstance(token, str):
+                        raise ValueError(
+                            "Series '{}' contains a non-string token {}"
+                            .format(series_id, repr(token)))
+                    token_id = len(token_to_id)
+                    token_to_id[token] = token_id
+                chunk.append(token_id)
+            offsets.append(offsets[-1] + len(sentence))
+
+            if len(offsets) % chunk_size == 0:
+                np.array(chunk, dtype=np.int32).tofile(f_ids)
+                chunk = []
+
+        np.array(chunk, dtype=np.int32).tofile(f_ids)
+
+    np.array(offsets, dtype=np.int64).tofile(offsets_path)
+
+    with open(tokens_path, "w", encoding="utf-8") as f_tokens:
+        json.dump(sorted(token_to_id, key=token_to_id.__getitem__),
+                  f_tokens, ensure_ascii=False)
+
+    return len(offsets) - 1
+
+
+def load_binary_series(directory: str, series_id: str) -> BinarySeries:
+    """Load a tokenized text series stored in the binary format.
+
+    Arguments:
+        directory: The directory with the series files.
+        series_id: The name of the series.
+
+    Returns:
+        The memory-mapped series.
+    """
+    ids_path, offsets_path, tokens_path = _binary_series_paths(
+        directory, series_id)
+
+    with open(tokens_path, encoding="utf-8") as f_tokens:
+        token_list = json.load(f_tokens)
+    tokens = np.empty([len(token_list)], dtype=object)
+    tokens[:] = token_list
+
+    return BinarySeries(_memmap(ids_path, np.int32),
+                        _memmap(offsets_path, np.int64), tokens)
+
+
+def save_pickled_series(series: Iterable[Any], directory: str,
+                        series_id: str) -> int:
+    """Write a series of picklable items to a binary file.
+
+    Arguments:
+        series: The items of the series.
+        directory: The directory to store the files to.
+        series_id: The name of the series, used as a prefix of the files.
+
+    Returns:
+        The number of items in the series.
+    """
+    data_path, offsets_path = _pickled_series_paths(directory, series_id)
+
+    offsets = [0]
+    with open(data_path, "wb") as f_data:
+        for item in series:
+            f_data.write(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL))
+            offsets.append(f_data.tell())
+
+    np.array(offsets, dtype=np.int64).tofile(offsets_path)
+    return len(offsets) - 1
+
+
+def load_pickled_series(directory: str, series_id: str) -> PickledSeries:
+    """Load a series stored as pickled items.
+
+    Arguments:
+        directory: The directory with the series files.
+        series_id: The name of the series.
+
+    Returns:
+        The memory-mapped series.
+    """
+    data_path, offsets_path = _pickled_series_paths(directory, series_id)
+    return PickledSeries(_memmap(data_path, np.uint8),
+                         _memmap(offsets_path, np.int64))
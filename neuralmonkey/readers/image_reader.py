@@ -1,17 +1,45 @@
-from typing import Callable, Iterable, List, Optional
+"""Readers of images listed in text files.
+
+The images can be decoded in a pool of threads (PIL releases the global
+interpreter lock while decoding) and the decoded images can be stored in
+a memory-mapped cache, so they are decoded and resized only once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import collections
+import contextlib
+import fcntl
+import hashlib
+import json
 import os
+import threading
+
 import numpy as np
 from PIL import Image, ImageFile
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+# JPEGs are decoded at least this many times larger than the target size
+# (the same trade-off between speed and quality as in ``Image.thumbnail``)
+DRAFT_REDUCING_GAP = 2
 
+_IMAGE_DTYPES = ["uint8", "float32", "float64"]
+
+
+# pylint: disable=too-many-arguments
+# the decoding options are shared with imagenet_reader and are set directly
+# in the configuration files, like the other reader parameters
 def image_reader(prefix="",
                  pad_w: Optional[int] = None,
                  pad_h: Optional[int] = None,
                  rescale_w: bool = False,
                  rescale_h: bool = False,
                  keep_aspect_ratio: bool = False,
-                 mode: str = "RGB") -> Callable:
+                 mode: str = "RGB",
+                 dtype: str = "float32",
+                 num_threads: int = 1,
+                 draft: bool = True,
+                 cache_dir: Optional[str] = None) -> Callable:
     """Get a reader of images loading them from a list of pahts.
 
     Args:
@@ -26,6 +54,13 @@ def image_reader(prefix="",
             rescaling. Can only be used if both width and height are rescaled.
         mode: Scipy image loading mode, see scipy documentation for more
             details.
+        dtype: Data type of the returned arrays, one of 'uint8', 'float32'
+            and 'float64'.
+        num_threads: Number of threads decoding the images.
+        draft: If true, rescaled JPEG images are decoded at a reduced size
+            (see ``Image.draft``), which is much faster for large images.
+        cache_dir: Directory of the cache of the decoded images. If None,
+            the images are decoded every time they are read.
 
     Returns:
         The reader function that takes a list of image paths (relative to
@@ -41,49 +76,125 @@ def image_reader(prefix="",
         raise ValueError(
             "While rescaling only one side, aspect ratio must be kept, "
             "was set to false.")
+    _check_dtype(dtype)
 
-    def load(list_files: List[str]) -> Iterable[np.ndarray]:
-        for list_file in list_files:
-            with open(list_file) as f_list:
-                for i, image_file in enumerate(f_list):
-                    path = os.path.join(prefix, image_file.rstrip())
+    def load_image(path: str) -> np.ndarray:
+        try:
+            image = Image.open(path)  # type: Image.Image
+            if (draft and (rescale_w or rescale_h)
+                    and pad_w is not None and pad_h is not None):
+                _draft(image, mode, _rescaled_size(
+                    image.size, pad_w, pad_h, rescale_w, rescale_h,
+                    keep_aspect_ratio))
+            image = image.convert(mode)
+        except IOError:
+            image = Image.new(mode, (pad_w, pad_h))
 
-                    if not os.path.exists(path):
-                        raise Exception(
-                            ("Image file '{}' no."
-                             "{}  does not exist.").format(path, i + 1))
+        image = _rescale_or_crop(image, pad_w, pad_h,
+                                 rescale_w, rescale_h,
+                                 keep_aspect_ratio)
+        image_np = np.array(image)
+
+        if len(image_np.shape) == 2:
+            channels = 1
+            image_np = np.expand_dims(image_np, 2)
+        elif len(image_np.shape) == 3:
+            channels = image_np.shape[2]
+        else:
+            raise ValueError(
+                ("Image should have either 2 (black and white) "
+                 "or three dimensions (color channels), has {} "
+                 "dimension.").format(len(image_np.shape)))
+
+        return _pad(image_np, pad_w, pad_h, channels, dtype)
 
-                    try:
-                        image = Image.open(path).convert(mode)
-                    except IOError:
-                        image = Image.new(mode, (pad_w, pad_h))
-
-                    image = _rescale_or_crop(image, pad_w, pad_h,
-                                             rescale_w, rescale_h,
-                                             keep_aspect_ratio)
-                    image_np = np.array(image)
-
-                    if len(image_np.shape) == 2:
-                        channels = 1
-                        image_np = np.expand_dims(image_np, 2)
-                    elif len(image_np.shape) == 3:
-                        channels = image_np.shape[2]
-                    else:
-                        raise ValueError(
-                            ("Image should have either 2 (black and white) "
-                             "or three dimensions (color channels), has {} "
-                             "dimension.").format(len(image_np.shape)))
-
-                    yield _pad(image_np, pad_w, pad_h, channels)
+    cache = None
+    if cache_dir is not None:
+        cache = ImageCache(cache_dir, "image_reader", [
+            pad_w, pad_h, rescale_w, rescale_h, keep_aspect_ratio, mode,
+            dtype, draft])
+
+    def load(list_files: List[str]) -> Iterable[np.ndarray]:
+        return _read_images(list_files, prefix, load_image, num_threads,
+                            cache)
 
     return load
+# pylint: enable=too-many-arguments
 
 
 def imagenet_reader(prefix: str,
                     target_width: int = 227,
-                    target_height: int = 227) -> Callable:
-    """Load and prepare image the same way as Caffe scripts."""
+                    target_height: int = 227,
+                    dtype: str = "float32",
+                    num_threads: int = 1,
+                    draft: bool = True,
+                    cache_dir: Optional[str] = None) -> Callable:
+    """Load and prepare image the same way as Caffe scripts.
+
+    The decoding options (``dtype``, ``num_threads``, ``draft`` and
+    ``cache_dir``) are the same as in ``image_reader``.
+    """
+    _check_dtype(dtype)
+
+    def load_image(path: str) -> np.ndarray:
+        image = Image.open(path)  # type: Image.Image
+
+        width, height = image.size
+        if width == height:
+            size = (target_width, target_height)
+        elif height < width:
+            size = (int(width * float(target_height) / height),
+                    target_height)
+        else:
+            size = (target_width,
+                    int(height * float(target_width) / width))
+
+        if draft:
+            _draft(image, "RGB", size)
+        image = image.convert("RGB")
+
+        _rescale_or_crop(image, size[0], size[1], True, True, False)
+        cropped_image = _crop(image, target_width, target_height)
+
+        res = _pad(np.array(cropped_image),
+                   target_width, target_height, 3, dtype)
+        assert res.shape == (target_width, target_height, 3)
+        return res
+
+    cache = None
+    if cache_dir is not None:
+        cache = ImageCache(cache_dir, "imagenet_reader", [
+            target_width, target_height, dtype, draft])
+
     def load(list_files: List[str]) -> Iterable[np.ndarray]:
+        return _read_images(list_files, prefix, load_image, num_threads,
+                            cache)
+
+    return load
+
+
+def _check_dtype(dtype: str) -> None:
+    if dtype not in _IMAGE_DTYPES:
+        raise ValueError("Image data type must be one of {}, was '{}'."
+                         .format(", ".join(_IMAGE_DTYPES), dtype))
+
+
+def _read_images(list_files: List[str], prefix: str,
+                 load_image: Callable[[str], np.ndarray], num_threads: int,
+                 cache: Optional["ImageCache"]) -> Iterable[np.ndarray]:
+    """Read the images listed in files, keeping their order.
+
+    Arguments:
+        list_files: Files with the image paths, one per line.
+        prefix: Prefix of the image paths.
+        load_image: Function which loads a single image.
+        num_threads: Number of threads running ``load_image``.
+        cache: Cache of the decoded images, or None.
+
+    Returns:
+        Generator yielding the images.
+    """
+    def paths() -> Iterable[str]:
         for list_file in list_files:
             with open(list_file) as f_list:
                 for i, image_file in enumerate(f_list):
@@ -91,32 +202,224 @@ def imagenet_reader(prefix: str,
 
                     if not os.path.exists(path):
                         raise Exception(
-                            "Image file '{}' no. {} does not exist."
-                            .format(path, i + 1))
-
-                    image = Image.open(path).convert("RGB")
-
-                    width, height = image.size
-                    if width == height:
-                        _rescale_or_crop(image, target_width, target_height,
-                                         True, True, False)
-                    elif height < width:
-                        _rescale_or_crop(
-                            image,
-                            int(width * float(target_height) / height),
-                            target_height, True, True, False)
-                    else:
-                        _rescale_or_crop(
-                            image, target_width,
-                            int(height * float(target_width) / width),
-                            True, True, False)
-                    cropped_image = _crop(image, target_width, target_height)
-
-                    res = _pad(np.array(cropped_image),
-                               target_width, target_height, 3)
-                    assert res.shape == (target_width, target_height, 3)
-                    yield res
-    return load
+                            ("Image file '{}' no."
+                             "{}  does not exist.").format(path, i + 1))
+                    yield path
+
+    def load_cached(path: str) -> np.ndarray:
+        if cache is None:
+            return load_image(path)
+
+        image = cache.get(path)
+        if image is None:
+            image = load_image(path)
+            cache.put(path, image)
+        return image
+
+    try:
+        if num_threads <= 1:
+            yield from map(load_cached, paths())
+        else:
+            yield from _thread_map(load_cached, paths(), num_threads)
+    finally:
+        if cache is not None:
+            cache.save_index()
+
+
+def _thread_map(function: Callable, items: Iterable,
+                num_threads: int) -> Iterable:
+    """Map a function over items in a thread pool, keeping their order.
+
+    Unlike ``Executor.map``, only a limited number of items is processed
+    ahead of the consumer, so the items can be read lazily.
+    """
+    pending = collections.deque()  # type: collections.deque
+    with ThreadPoolExecutor(num_threads) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(function, item))
+                if len(pending) >= 4 * num_threads:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _rescaled_size(size: Tuple[int, int], pad_w: int, pad_h: int,
+                   rescale_w: bool, rescale_h: bool,
+                   keep_aspect_ratio: bool) -> Tuple[int, int]:
+    """Get the size to which ``_rescale_or_crop`` scales an image."""
+    orig_w, orig_h = size
+    if rescale_w and rescale_h and not keep_aspect_ratio:
+        return pad_w, pad_h
+    elif rescale_w and rescale_h and keep_aspect_ratio:
+        ratio = min(pad_h / orig_h, pad_w / orig_h)
+        return int(orig_w * ratio), int(orig_h * ratio)
+    elif rescale_w:
+        return pad_w, int(orig_h * pad_w / orig_w)
+    return int(orig_w * pad_h / orig_h), pad_h
+
+
+def _draft(image: Image.Image, mode: str, size: Tuple[int, int]) -> None:
+    """Let a JPEG image be decoded at a reduced size.
+
+    The image is decoded at least ``DRAFT_REDUCING_GAP`` times larger than
+    the given size, so the following resizing produces the same result up to
+    rounding. Other image formats are not affected.
+    """
+    if image.format != "JPEG":
+        return
+    image.draft(mode, (max(size[0], 1) * DRAFT_REDUCING_GAP,
+                       max(size[1], 1) * DRAFT_REDUCING_GAP))
+
+
+class ImageCache(object):
+    """Memory-mapped cache of decoded images.
+
+    The images decoded with the same reader parameters are stored in a
+    single binary file as rows of a memory-mapped array. The index mapping
+    image paths (with their modification times) to the rows is stored in
+    a JSON file next to it. All the images in the cache must have the same
+    shape and data type, which holds for the padded images of the readers.
+
+    The cache can be shared by the threads of a reader and by several
+    readers (or processes) with the same parameters. The images are
+    appended to the end of the binary file and the index is merged with the
+    one on the disk, both under a lock file, so the readers never overwrite
+    each other's images.
+    """
+
+    def __init__(self, directory: str, reader: str, parameters: List) -> None:
+        """Open the cache of images decoded with the given parameters.
+
+        Arguments:
+            directory: The directory of the cache.
+            reader: The name of the reader function.
+            parameters: Parameters of the reader which affect the decoded
+                images.
+        """
+        key = hashlib.sha1(json.dumps([reader, parameters]).encode("utf-8"))
+        self.directory = os.path.join(directory, key.hexdigest())
+        self.data_path = os.path.join(self.directory, "images.dat")
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.lock_path = os.path.join(self.directory, "lock")
+
+        self._lock = threading.Lock()
+        self._data = None  # type: Optional[np.ndarray]
+        self._index = {}  # type: Dict[str, List]
+        self._new_entries = {}  # type: Dict[str, List]
+        self._shape = None  # type: Optional[Tuple[int, ...]]
+        self._dtype = None  # type: Optional[np.dtype]
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        with self._file_lock():
+            self._load_index()
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Lock the cache against the other processes."""
+        with open(self.lock_path, "ab") as f_lock:
+            fcntl.flock(f_lock, fcntl.LOCK_EX)
+            yield
+
+    def _load_index(self) -> None:
+        """Load the index stored on the disk, keeping the new entries."""
+        if not os.path.isfile(self.index_path):
+            return
+
+        with open(self.index_path, encoding="utf-8") as f_index:
+            info = json.load(f_index)
+        shape = tuple(info["shape"])
+        dtype = np.dtype(info["dtype"])
+        if self._shape is not None and (shape != self._shape
+                                        or dtype != self._dtype):
+            raise ValueError(
+                "Images of shape {} and type {} cannot be cached with images "
+                "of shape {} and type {}.".format(
+                    self._shape, self._dtype, shape, dtype))
+
+        self._shape = shape
+        self._dtype = dtype
+        self._index = info["images"]
+        self._index.update(self._new_entries)
+
+    def _row(self, row: int) -> np.ndarray:
+        # the data file may have grown since it was mapped
+        if self._data is None or row >= len(self._data):
+            assert self._shape is not None and self._dtype is not None
+            row_size = self._dtype.itemsize * int(np.prod(self._shape))
+            self._data = np.memmap(
+                self.data_path, dtype=self._dtype, mode="r",
+                shape=(os.path.getsize(self.data_path) // row_size,)
+                + self._shape)
+        return self._data[row]
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        """Get a cached image.
+
+        Arguments:
+            path: The path to the image file.
+
+        Returns:
+            The image or None if it is not cached or the file has been
+            modified since it was cached.
+        """
+        with self._lock:
+            entry = self._index.get(os.path.abspath(path))
+            if entry is None or entry[1] != os.path.getmtime(path):
+                return None
+            return self._row(entry[0])
+
+    def put(self, path: str, image: np.ndarray) -> None:
+        """Store an image to the cache.
+
+        Arguments:
+            path: The path to the image file.
+            image: The decoded image.
+        """
+        with self._lock, self._file_lock():
+            if self._shape is None:
+                self._shape = image.shape
+                self._dtype = image.dtype
+            elif image.shape != self._shape or image.dtype != self._dtype:
+                raise ValueError(
+                    "Image '{}' of shape {} and type {} cannot be cached "
+                    "with images of shape {} and type {}.".format(
+                        path, image.shape, image.dtype, self._shape,
+                        self._dtype))
+
+            # the image is appended after all the complete rows, a partially
+            # written row of an interrupted process is overwritten
+            file_mode = "r+b" if os.path.isfile(self.data_path) else "wb"
+            with open(self.data_path, file_mode) as f_data:
+                row = f_data.seek(0, os.SEEK_END) // image.nbytes
+                f_data.seek(row * image.nbytes)
+                f_data.truncate()
+                f_data.write(np.ascontiguousarray(image).tobytes())
+
+            entry = [row, os.path.getmtime(path)]
+            self._index[os.path.abspath(path)] = entry
+            self._new_entries[os.path.abspath(path)] = entry
+
+    def save_index(self) -> None:
+        """Merge the new images to the index on the disk."""
+        with self._lock, self._file_lock():
+            if not self._new_entries:
+                return
+            self._load_index()
+            assert self._dtype is not None
+
+            tmp_path = "{}.{}".format(self.index_path, os.getpid())
+            with open(tmp_path, "w", encoding="utf-8") as f_index:
+                json.dump({"images": self._index, "shape": self._shape,
+                           "dtype": self._dtype.str}, f_index)
+            os.replace(tmp_path, self.index_path)
+            self._new_entries = {}
 
 
 def _rescale_or_crop(image: Image.Image, pad_w: int, pad_h: int,
@@ -159,10 +462,15 @@ def _crop(image: Image.Image, pad_w: int, pad_h: int) -> Image.Image:
 
 
 def _pad(image: np.ndarray, pad_w: int, pad_h: int,
-         channels: int) -> np.ndarray:
+         channels: int, dtype: str = "float32") -> np.ndarray:
+    if image.ndim == 2:
+        image = np.expand_dims(image, 2)
     img_h, img_w = image.shape[:2]
 
-    image_padded = np.zeros((pad_h, pad_w, channels))
+    if (img_h, img_w) == (pad_h, pad_w):
+        return image.astype(dtype, copy=False)
+
+    image_padded = np.zeros((pad_h, pad_w, channels), dtype=dtype)
     image_padded[:img_h, :img_w, :] = image
 
     return image_padded
@@ -0,0 +1,338 @@
+"""Index of line offsets in text files.
+
+The index stores the byte offset of the beginning of every line of a file,
+so it is possible to count the lines of the file or to start reading it from
+an arbitrary line without reading the preceding part of the file. For gzipped
+files, the offsets refer to the decompressed data.
+
+A gzipped file can be read from an arbitrary position only by decompressing
+it from the beginning of its compressed block. The index therefore also
+stores checkpoints - pairs of decompressed and compressed offsets of the
+gzip members the file consists of. Files compressed in independent blocks
+(e.g. by ``bgzip`` or ``pigz --independent``) are thus read from the nearest
+checkpoint; ordinary single-member gzip files are decompressed from their
+beginning, but the preceding lines are still not parsed. Such files are not
+``seekable``, so they should not be read in many chunks.
+
+Building the index requires reading the whole file. Therefore, the index is
+cached next to the file (in a file with the ``.lineidx.npz`` suffix) and
+rebuilt only when the size or modification time of the file changes.
+
+Several files can be read as a single sequence of lines using their indices,
+either from a given line or in chunks of lines in a random order.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import gzip
+import os
+import random
+import zipfile
+import zlib
+
+import numpy as np
+
+from neuralmonkey.logging import log, warn
+
+INDEX_SUFFIX = ".lineidx.npz"
+_BLOCK_SIZE = 1 << 20
+
+# minimal distance of two checkpoints in the decompressed data
+_CHECKPOINT_DISTANCE = 1 << 20
+
+_LOADED_INDICES = {}  # type: Dict[str, LineIndex]
+
+
+def _file_stamp(path: str) -> Tuple[int, float]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+class LineIndex(object):
+    """Offsets of lines in a single text file."""
+
+    def __init__(self, path: str, offsets: np.ndarray,
+                 checkpoints: np.ndarray, stamp: Tuple[int, float]) -> None:
+        """Create the index from the line offsets.
+
+        Arguments:
+            path: The path to the indexed file.
+            offsets: Byte offsets of the beginnings of the lines, followed by
+                the offset of the end of the file.
+            checkpoints: For gzipped files, a matrix whose rows are the
+                decompressed and compressed offsets of the gzip members
+                (at least the first one). Empty for plain text files.
+            stamp: Size and modification time of the file when indexed.
+        """
+        self.path = path
+        self.offsets = offsets
+        self.checkpoints = checkpoints
+        self.stamp = stamp
+
+    def __len__(self) -> int:
+        """Get the number of lines of the file."""
+        return len(self.offsets) - 1
+
+    @property
+    def seekable(self) -> bool:
+        """Check whether a line is read without reading the whole file.
+
+        A line of a gzipped file is read by decompressing the file from the
+        nearest preceding checkpoint, so only the gzipped files with more
+        checkpoints are seekable.
+        """
+        return not self.path.endswith(".gz") or len(self.checkpoints) > 1
+
+    def read_lines(self, start: int, end: int) -> Iterator[bytes]:
+        """Read a range of lines from the file.
+
+        Arguments:
+            start: Number of the first line to read (from zero).
+            end: Number of the line after the last line to read.
+
+        Returns:
+            Generator yielding the lines as bytes.
+        """
+        end = min(end, len(self))
+        if start >= end:
+            return
+
+        offset = int(self.offsets[start])
+
+        if not self.path.endswith(".gz"):
+            with open(self.path, "rb") as f_data:
+                f_data.seek(offset)
+                for _ in range(end - start):
+                    yield f_data.readline()
+            return
+
+        # find the last gzip member starting before the line
+        member = np.searchsorted(self.checkpoints[:, 0], offset,
+                                 side="right") - 1
+        member_offset, compressed_offset = self.checkpoints[member]
+
+        with open(self.path, "rb") as f_raw:
+            f_raw.seek(int(compressed_offset))
+            with gzip.GzipFile(fileobj=f_raw, mode="rb") as f_data:
+                f_data.seek(offset - int(member_offset))
+                for _ in range(end - start):
+                    yield f_data.readline()
+
+
+def _plain_blocks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f_data:
+        yield from iter(lambda: f_data.read(_BLOCK_SIZE), b"")
+
+
+def _gzip_blocks(path: str,
+                 checkpoints: List[Tuple[int, int]]) -> Iterator[bytes]:
+    """Decompress a gzipped file and record the starts of its members.
+
+    Arguments:
+        path: Path to the gzipped file.
+        checkpoints: List to which the pairs of decompressed and compressed
+            offsets of the members are appended.
+
+    Returns:
+        Generator yielding blocks of the decompressed data.
+    """
+    position = 0
+    compressed_position = 0
+    decompressor = None
+
+    with open(path, "rb") as f_raw:
+        for block in iter(lambda: f_raw.read(_BLOCK_SIZE), b""):
+            data = block
+            data_start = compressed_position
+            compressed_position += len(block)
+
+            while data:
+                if decompressor is None:
+                    if (not checkpoints or position - checkpoints[-1][0]
+                            >= _CHECKPOINT_DISTANCE):
+                        checkpoints.append((position, data_start))
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+                decompressed = decompressor.decompress(data)
+                position += len(decompressed)
+                yield decompressed
+
+                if decompressor.eof:
+                    data = decompressor.unused_data
+                    data_start = compressed_position - len(data)
+                    decompressor = None
+                else:
+                    data = b""
+
+
+def _build_offsets(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the offsets of all lines of a file.
+
+    Returns:
+        A tuple of the line offsets and the gzip checkpoints.
+    """
+    newlines = [np.zeros([1], dtype=np.int64)]
+    position = 0
+    checkpoints = []  # type: List[Tuple[int, int]]
+
+    if path.endswith(".gz"):
+        blocks = _gzip_blocks(path, checkpoints)
+    else:
+        blocks = _plain_blocks(path)
+
+    for block in blocks:
+        block_newlines = np.flatnonzero(
+            np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+        newlines.append(block_newlines.astype(np.int64) + position + 1)
+        position += len(block)
+
+    offsets = np.concatenate(newlines)
+
+    # the file does not end with a newline, so the last line ends with the
+    # end of the file
+    if offsets[-1] != position:
+        offsets = np.append(offsets, position)
+
+    return offsets, np.array(checkpoints, dtype=np.int64).reshape([-1, 2])
+
+
+def get_line_index(path: str) -> LineIndex:
+    """Get the line index of a file.
+
+    The index is looked up in the memory and in the cache file next to the
+    data. If it is not found there, it is outdated or the cache file cannot
+    be read, it is built and stored to the cache file.
+
+    Arguments:
+        path: Path to the text file.
+
+    Returns:
+        The line index of the file.
+    """
+    stamp = _file_stamp(path)
+
+    index = _LOADED_INDICES.get(path)
+    if index is not None and index.stamp == stamp:
+        return index
+
+    index_path = path + INDEX_SUFFIX
+    cached = _load_offsets(index_path, stamp)
+    if cached is not None:
+        offsets, checkpoints = cached
+    else:
+        log("Building line index of '{}'".format(path))
+        offsets, checkpoints = _build_offsets(path)
+        _store_offsets(index_path, offsets, checkpoints, stamp)
+
+    index = LineIndex(path, offsets, checkpoints, stamp)
+    _LOADED_INDICES[path] = index
+    return index
+
+
+def _load_offsets(index_path: str, stamp: Tuple[int, float]
+                 ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Load the line offsets and the checkpoints from the index file.
+
+    Returns:
+        The offsets and the checkpoints, or None if the index file does not
+        exist, is outdated or cannot be read.
+    """
+    if not os.path.isfile(index_path):
+        return None
+
+    size, mtime = stamp
+    try:
+        with np.load(index_path) as cached:
+            if ("checkpoints" in cached.files and cached["size"] == size
+                    and cached["mtime"] == mtime):
+                return cached["offsets"], cached["checkpoints"]
+    except (OSError, ValueError, KeyError, EOFError,
+            zipfile.BadZipFile) as exc:
+        warn("Cannot read line index '{}', it will be rebuilt: {}"
+             .format(index_path, exc))
+    return None
+
+
+def _store_offsets(index_path: str, offsets: np.ndarray,
+                   checkpoints: np.ndarray, stamp: Tuple[int, float]) -> None:
+    """Store the line offsets and the checkpoints to the index file.
+
+    The index is written to a temporary file first, so other processes never
+    read a partially written index.
+    """
+    size, mtime = stamp
+    tmp_path = "{}.tmp-{}".format(index_path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f_index:
+            np.savez(f_index, offsets=offsets, checkpoints=checkpoints,
+                     size=size, mtime=mtime)
+        os.replace(tmp_path, index_path)
+    except OSError as exc:
+        warn("Cannot store line index '{}': {}".format(index_path, exc))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_lines(indices: List[LineIndex], start: int,
+               end: Optional[int] = None) -> Iterable[bytes]:
+    """Read a range of lines of files.
+
+    Arguments:
+        indices: Line indices of the files. The files are treated as a single
+            sequence of lines.
+        start: Number of the first line to read (from zero).
+        end: Number of the line after the last line to read. If None, the
+            files are read until the end.
+
+    Returns:
+        Generator yielding the lines as bytes.
+    """
+    file_start = 0
+    for index in indices:
+        file_end = file_start + len(index)
+        if end is not None and end <= file_start:
+            break
+
+        if start < file_end:
+            yield from index.read_lines(
+                max(start - file_start, 0),
+                len(index) if end is None else end - file_start)
+        file_start = file_end
+
+
+def read_chunks(paths: List[str], chunk_size: int,
+                rng: random.Random) -> Iterable[bytes]:
+    """Read lines of files in chunks in a random order.
+
+    Every chunk is read from its first line located by the line index, so
+    the files should be ``seekable``.
+
+    Arguments:
+        paths: Paths to the files. They are treated as a single sequence of
+            lines.
+        chunk_size: The number of lines in a chunk.
+        rng: The random generator used to permute the chunks.
+
+    Returns:
+        Generator yielding the lines as bytes.
+    """
+    indices = [get_line_index(path) for path in paths]
+    total_lines = sum(len(index) for index in indices)
+
+    for chunk_start in _chunk_starts(total_lines, chunk_size, rng):
+        yield from read_lines(indices, chunk_start, chunk_start + chunk_size)
+
+
+def _chunk_starts(length: int, chunk_size: int,
+                  rng: random.Random) -> List[int]:
+    """Get the starts of chunks of a sequence in a random order."""
+    chunk_starts = list(range(0, length, chunk_size))
+    rng.shuffle(chunk_starts)
+    return chunk_starts
+
+
+def chunk_positions(length: int, chunk_size: int,
+                    rng: random.Random) -> Iterable[int]:
+    """Get the positions in the order in which ``read_chunks`` reads."""
+    for chunk_start in _chunk_starts(length, chunk_size, rng):
+        yield from range(chunk_start, min(chunk_start + chunk_size, length))
@@ -1,10 +1,127 @@
-from typing import List
+from typing import Callable, List, Optional, Union
 
 import numpy as np
 
 
-def numpy_reader(files: List[str]):
-    if len(files) == 1:
-        return np.load(files[0])
+class ConcatenatedArray(object):
+    """Several arrays presented as their concatenation along the first axis.
 
-    return np.concatenate([np.load(f) for f in files], axis=0)
+    The arrays are not copied. Indexing the first axis gathers the rows only
+    from the arrays which contain them, so when the arrays are memory-mapped,
+    only the requested rows are read from the disk.
+    """
+
+    def __init__(self, arrays: List[np.ndarray]) -> None:
+        """Create the virtual concatenation.
+
+        Arguments:
+            arrays: The concatenated arrays. They must have the same shape
+                except for the first dimension and the same data type.
+        """
+        if not arrays:
+            raise ValueError("No arrays to concatenate.")
+
+        for array in arrays[1:]:
+            if (array.shape[1:] != arrays[0].shape[1:]
+                    or array.dtype != arrays[0].dtype):
+                raise ValueError(
+                    "Cannot concatenate arrays of shapes {} and {} and types "
+                    "{} and {}.".format(arrays[0].shape, array.shape,
+                                        arrays[0].dtype, array.dtype))
+
+        self.arrays = arrays
+        self.offsets = np.cumsum([0] + [len(array) for array in arrays])
+
+    @property
+    def shape(self):
+        """Get the shape of the concatenation."""
+        return (int(self.offsets[-1]),) + self.arrays[0].shape[1:]
+
+    @property
+    def dtype(self):
+        """Get the data type of the arrays."""
+        return self.arrays[0].dtype
+
+    @property
+    def ndim(self) -> int:
+        """Get the number of dimensions of the arrays."""
+        return self.arrays[0].ndim
+
+    def __len__(self) -> int:
+        """Get the length of the concatenation."""
+        return int(self.offsets[-1])
+
+    def __iter__(self):
+        """Iterate over the rows of all the arrays."""
+        for array in self.arrays:
+            yield from array
+
+    def __getitem__(self, item: Union[int, slice, np.ndarray, List[int]]):
+        """Get a row or an array of the rows selected by the item."""
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError("Index {} out of range".format(item))
+            array_index = np.searchsorted(self.offsets, item, side="right") - 1
+            return self.arrays[array_index][item - self.offsets[array_index]]
+
+        if isinstance(item, slice):
+            item = np.arange(len(self))[item]
+
+        indices = np.asarray(item)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = np.where(indices < 0, indices + len(self), indices)
+        if indices.size and (indices.min() < 0
+                             or indices.max() >= len(self)):
+            raise IndexError("Index out of range")
+
+        result = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        array_indices = np.searchsorted(
+            self.offsets, indices, side="right") - 1
+        for array_index in np.unique(array_indices):
+            mask = array_indices == array_index
+            result[mask] = self.arrays[array_index][
+                indices[mask] - self.offsets[array_index]]
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        """Copy the concatenation to a single array."""
+        # pylint: disable=unused-argument
+        result = np.concatenate(self.arrays, axis=0)
+        return result if dtype is None else result.astype(dtype)
+
+
+def get_numpy_reader(
+        mmap_mode: Optional[str] = None
+) -> Callable[[List[str]], Union[np.ndarray, ConcatenatedArray]]:
+    """Get reader of arrays stored in ``.npy`` files.
+
+    Several files are presented as a single array concatenated along the
+    first axis without copying them (see ``ConcatenatedArray``).
+
+    Arguments:
+        mmap_mode: The memory-mapping mode of ``np.load``. If 'r', the
+            arrays are not loaded to the memory, only the rows which are
+            accessed are read from the disk. If None, the files are loaded.
+
+    Returns:
+        The reader function. The datasets call it in the main process (see
+        its ``main_process_only`` attribute), so the arrays are not copied
+        from the worker processes.
+    """
+    def reader(files: List[str]) -> Union[np.ndarray, ConcatenatedArray]:
+        arrays = [np.load(f, mmap_mode=mmap_mode) for f in files]
+        if len(arrays) == 1:
+            return arrays[0]
+        return ConcatenatedArray(arrays)
+
+    reader.main_process_only = True  # type: ignore
+    return reader
+
+
+# pylint: disable=invalid-name
+numpy_reader = get_numpy_reader()
+mmap_numpy_reader = get_numpy_reader(mmap_mode="r")
+# pylint: enable=invalid-name
@@ -1,6 +1,8 @@
-from typing import List, Iterable, Callable
+from typing import Any, Dict, List, Iterable, Callable, Optional, Tuple
+import collections
 import gzip
 import csv
+import functools
 import io
 import sys
 
@@ -23,21 +25,107 @@ def string_reader(
                     for line in f_data:
                         yield str(line, "utf-8")
             else:
-                with open(path, encoding=encoding) as f_data:
+                # the lines end only with "\n", as in the line index
+                with open(path, encoding=encoding, newline="\n") as f_data:
                     for line in f_data:
                         yield line
 
     return reader
 
 
+class LineReader(object):
+    """Reader which parses the lines of the files.
+
+    Every line of the files yields exactly one item, so the reader can also
+    parse lines read from elsewhere (e.g. chunks of the files located using
+    a line index). For this purpose, the ``parse_lines`` function and the
+    encoding are available as attributes of the reader.
+
+    The reader can be sent to worker processes if the ``parse_lines``
+    function can be pickled.
+    """
+
+    def __init__(self, parse_lines: Callable[[Iterable[str]], Iterable[Any]],
+                 encoding: str = "utf-8",
+                 multi_column: Optional[Tuple["MultiColumnReader", int]] = None
+                 ) -> None:
+        """Create a new line reader.
+
+        Arguments:
+            parse_lines: Function turning an iterable of lines to an iterable
+                of the items.
+            encoding: The encoding of the files.
+            multi_column: The multi-column reader and the number of the
+                column if the reader reads a single column of it.
+        """
+        self.parse_lines = parse_lines
+        self.encoding = encoding
+        self.multi_column = multi_column
+
+    def __call__(self, files: List[str]) -> Iterable[Any]:
+        return self.parse_lines(string_reader(self.encoding)(files))
+
+
+def line_reader(parse_lines: Callable[[Iterable[str]], Iterable[Any]],
+                encoding: str = "utf-8") -> LineReader:
+    """Get reader which parses the lines of the files.
+
+    Arguments:
+        parse_lines: Function turning an iterable of lines to an iterable of
+            the items.
+        encoding: The encoding of the files.
+    """
+    return LineReader(parse_lines, encoding)
+
+
+def _parse_tokenized(lines: Iterable[str]) -> Iterable[List[str]]:
+    for line in lines:
+        yield line.strip().split()
+
+
 def tokenized_text_reader(encoding: str = "utf-8") -> PlainTextFileReader:
     """Get reader for space-separated tokenized text."""
-    def reader(files: List[str]) -> Iterable[List[str]]:
-        lines = string_reader(encoding)
-        for line in lines(files):
-            yield line.strip().split()
+    return line_reader(_parse_tokenized, encoding)
 
-    return reader
+
+def _parse_columns(lines: Iterable[str], delimiter: str,
+                   quotechar: Optional[str]) -> Iterable[List[str]]:
+    """Split delimiter-separated lines to lists of column values."""
+    column_count = None
+    for line in lines:
+        io_line = io.StringIO(line.strip())
+        if quotechar is not None:
+            parsed_csv = list(csv.reader(io_line, delimiter=delimiter,
+                                         quotechar=quotechar,
+                                         skipinitialspace=True))
+        else:
+            parsed_csv = list(csv.reader(io_line, delimiter=delimiter,
+                                         quoting=csv.QUOTE_NONE,
+                                         skipinitialspace=True))
+        # an empty line has no columns at all
+        row = parsed_csv[0] if parsed_csv else []
+        columns = len(row)
+        if column_count is None:
+            column_count = columns
+        elif column_count != columns:
+            warn("A mismatch in number of columns. Expected {} got {}"
+                 .format(column_count, columns))
+        yield row
+
+
+def _select_column(row: List[Any], column: int) -> Any:
+    if len(row) < column:
+        warn("There is a missing column number {} in the dataset."
+             .format(column))
+        return None
+    return row[column - 1]
+
+
+def _parse_column(lines: Iterable[str], column: int, delimiter: str,
+                  quotechar: Optional[str]) -> Iterable[List[str]]:
+    for row in _parse_columns(lines, delimiter, quotechar):
+        value = _select_column(row, column)
+        yield [] if value is None else value.split()
 
 
 def column_separated_reader(
@@ -48,33 +136,121 @@ def column_separated_reader(
     Args:
         column: number of column to be returned. It starts with 1 for the first
     """
-    def reader(files: List[str]) -> Iterable[List[str]]:
-        column_count = None
-        text_reader = string_reader(encoding)
-        for line in text_reader(files):
-            io_line = io.StringIO(line.strip())
-            if quotechar is not None:
-                parsed_csv = list(csv.reader(io_line, delimiter=delimiter,
-                                             quotechar=quotechar,
-                                             skipinitialspace=True))
-            else:
-                parsed_csv = list(csv.reader(io_line, delimiter=delimiter,
-                                             quoting=csv.QUOTE_NONE,
-                                             skipinitialspace=True))
-            columns = len(parsed_csv[0])
-            if column_count is None:
-                column_count = columns
-            elif column_count != columns:
-                warn("A mismatch in number of columns. Expected {} got {}"
-                     .format(column_count, columns))
-            if columns < column:
-                warn("There is a missing column number {} in the dataset."
-                     .format(column))
-                yield []
-            else:
-                yield parsed_csv[0][column - 1].split()
+    return line_reader(functools.partial(
+        _parse_column, column=column, delimiter=delimiter,
+        quotechar=quotechar), encoding)
 
-    return reader
+
+class MultiColumnReader(object):
+    """Reader of several columns of delimiter-separated tokenized text.
+
+    Reading a column of a file with a column-separated reader parses whole
+    lines, so a dataset reading several columns of a file using several
+    readers reads and parses the file several times. Readers of individual
+    columns created by the ``column`` method (or the ``shared_column_reader``
+    function) of a single multi-column reader can be used instead. The
+    datasets recognize them and read all the columns of a file in a single
+    pass, parsing every line only once.
+
+    Used on its own, a column reader behaves like a column-separated reader.
+    """
+
+    def __init__(self, delimiter: str = "\t", quotechar: str = None,
+                 encoding: str = "utf-8") -> None:
+        """Create a new multi-column reader.
+
+        Arguments:
+            delimiter: The column delimiter.
+            quotechar: The quote character. If None, the columns cannot be
+                quoted.
+            encoding: The encoding of the files.
+        """
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.encoding = encoding
+        self.rows = line_reader(self.parse_rows, encoding)
+
+    def parse_rows(self, lines: Iterable[str]) -> Iterable[List[List[str]]]:
+        """Parse lines to rows of tokenized columns."""
+        for row in _parse_columns(lines, self.delimiter, self.quotechar):
+            yield [value.split() for value in row]
+
+    def column(self, column: int) -> PlainTextFileReader:
+        """Get reader of a single column.
+
+        Arguments:
+            column: The number of the column, starting with 1.
+
+        Returns:
+            A line-based reader with the ``multi_column`` attribute set to
+            the pair of this object and the column number.
+        """
+        return LineReader(functools.partial(self.parse_column, column),
+                          self.encoding, multi_column=(self, column))
+
+    def parse_column(self, column: int,
+                     lines: Iterable[str]) -> Iterable[List[str]]:
+        """Parse lines to the values of a single column."""
+        for row in self.parse_rows(lines):
+            yield self.select(row, column)
+
+    @staticmethod
+    def select(row: List[List[str]], column: int) -> List[str]:
+        """Get a column from a parsed row."""
+        value = _select_column(row, column)
+        return [] if value is None else value
+
+
+def shared_column_reader(reader: MultiColumnReader,
+                         column: int) -> PlainTextFileReader:
+    """Get reader of a column sharing the parsing with other columns.
+
+    This is a configuration-friendly form of ``MultiColumnReader.column``.
+
+    Arguments:
+        reader: The multi-column reader shared by the columns of a file.
+        column: The number of the column, starting with 1.
+    """
+    return reader.column(column)
+
+
+def column_groups(
+        series_paths_and_readers: Dict[str, Tuple[List[str], Any]],
+        keys: Iterable[str]) -> List[Tuple[List[str], Any,
+                                           List[Tuple[str, int]]]]:
+    """Group the series which are columns of the same files.
+
+    The series read by column readers of the same multi-column reader from
+    the same files form a group which can be read in a single pass.
+
+    Arguments:
+        series_paths_and_readers: The mapping of series names to the paths
+            to their files and their readers.
+        keys: The names of the series to group.
+
+    Returns:
+        A list of triples of the paths, the reader and the pairs of series
+        names and column numbers. The reader is either a multi-column reader
+        reading several columns, or the reader of a single series (with the
+        column number set to zero).
+    """
+    groups = collections.OrderedDict()  # type: Dict[Any, Tuple]
+    for key in keys:
+        paths, reader = series_paths_and_readers[key]
+        multi_column = getattr(reader, "multi_column", None)
+
+        if multi_column is None:
+            groups[key] = (paths, reader, [(key, 0)])
+        else:
+            multi_reader, column = multi_column
+            group_key = (id(multi_reader), tuple(paths))
+            groups.setdefault(
+                group_key, (paths, multi_reader, []))[2].append((key, column))
+
+    # a single column is read by its own reader
+    return [(paths, reader, group) if len(group) > 1
+            else (paths, series_paths_and_readers[group[0][0]][1], group)
+            for paths, reader, group in groups.values()]
 
 
 def csv_reader(column: int):
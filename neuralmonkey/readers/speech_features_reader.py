@@ -0,0 +1,238 @@
+"""Reader of speech features computed from audio files.
+
+Computing speech features (e.g. MFCCs) is expensive. Using the audio reader
+with the ``SpeechFeaturesPreprocessor`` computes them every time the series
+is read, which for lazy datasets means every epoch. The reader in this
+module computes the features in the shared pool of worker processes (see
+``neuralmonkey.parallel``) and optionally stores them to a feature store on
+the disk, from which they are read in the following epochs and runs.
+
+The feature store of a list of audio files is a directory with a binary file
+of the float32 feature frames of all the recordings, an array of the offsets
+of the recordings in the frames and a JSON file with the feature dimension.
+The store is memory-mapped, so the features of a recording are read from the
+disk only when it is accessed.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from neuralmonkey.logging import log
+from neuralmonkey.parallel import parallel_map
+from neuralmonkey.processors.speech import SpeechFeaturesPreprocessor
+from neuralmonkey.readers.audio_reader import AUDIO_LOADERS, load_audio
+from neuralmonkey.readers.binary_reader import OffsetSeries
+
+STORE_INFO = "features.json"
+_FRAMES_FILE = "frames.f32"
+_OFFSETS_FILE = "offsets.i64"
+
+
+class FeatureStore(OffsetSeries):
+    """Speech features of a list of recordings stored in binary files.
+
+    The feature frames of all recordings are stored as a single float32
+    matrix, the recording boundaries as an array of int64 offsets to its
+    rows (with one extra offset for the end of the last recording).
+    """
+
+    def __init__(self, frames: np.ndarray, offsets: np.ndarray) -> None:
+        """Create the store from the loaded arrays.
+
+        Arguments:
+            frames: The matrix of the feature frames.
+            offsets: The array of the recording start offsets.
+        """
+        super().__init__(offsets)
+        self.frames = frames
+
+    def _item(self, start: int, end: int) -> np.ndarray:
+        return self.frames[start:end]
+
+
+def save_feature_store(features: Iterable[np.ndarray],
+                       directory: str) -> int:
+    """Write features of recordings to a feature store.
+
+    The features are written as they are computed, so they do not need to
+    fit in the memory.
+
+    Arguments:
+        features: The feature matrices of the recordings, each of shape
+            [num_frames, num_features].
+        directory: The directory of the store. It must exist.
+
+    Returns:
+        The number of the recordings.
+    """
+    offsets = [0]
+    dimension = None
+    with open(os.path.join(directory, _FRAMES_FILE), "wb") as f_frames:
+        for matrix in features:
+            if dimension is None:
+                dimension = matrix.shape[1]
+            elif matrix.shape[1] != dimension:
+                raise ValueError(
+                    "Features of dimension {} found in a store of dimension "
+                    "{}".format(matrix.shape[1], dimension))
+
+            np.ascontiguousarray(matrix, dtype=np.float32).tofile(f_frames)
+            offsets.append(offsets[-1] + len(matrix))
+
+    np.array(offsets, dtype=np.int64).tofile(
+        os.path.join(directory, _OFFSETS_FILE))
+    with open(os.path.join(directory, STORE_INFO), "w",
+              encoding="utf-8") as f_info:
+        json.dump({"dimension": dimension or 0,
+                   "recordings": len(offsets) - 1}, f_info)
+
+    return len(offsets) - 1
+
+
+def load_feature_store(directory: str) -> FeatureStore:
+    """Load a feature store.
+
+    Arguments:
+        directory: The directory of the store.
+
+    Returns:
+        The memory-mapped store.
+    """
+    with open(os.path.join(directory, STORE_INFO), encoding="utf-8") as f_info:
+        dimension = json.load(f_info)["dimension"]
+
+    frames_path = os.path.join(directory, _FRAMES_FILE)
+    offsets = np.fromfile(os.path.join(directory, _OFFSETS_FILE),
+                          dtype=np.int64)
+
+    # memory-mapping of an empty file is not possible
+    if offsets[-1] == 0:
+        frames = np.zeros([0, dimension], dtype=np.float32)
+    else:
+        frames = np.memmap(frames_path, dtype=np.float32, mode="r",
+                           shape=(int(offsets[-1]), dimension))
+
+    return FeatureStore(frames, offsets)
+
+
+class _FeatureExtractor(object):
+    """Picklable function computing features of a single audio file."""
+
+    def __init__(self, audio_format: str,
+                 feature_args: Dict[str, Any]) -> None:
+        self.audio_format = audio_format
+        self.feature_args = feature_args
+        self._preprocess = None  # type: Optional[Callable]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the preprocessing function is created again in the worker
+        state = dict(self.__dict__)
+        state["_preprocess"] = None
+        return state
+
+    def __call__(self, path: str) -> np.ndarray:
+        if self._preprocess is None:
+            self._preprocess = SpeechFeaturesPreprocessor(
+                **self.feature_args)
+
+        audio = load_audio(path, self.audio_format)
+        return self._preprocess(audio).astype(np.float32)
+
+
+def _audio_paths(list_files: List[str], prefix: str) -> List[str]:
+    paths = []
+    for list_file in list_files:
+        with open(list_file, encoding="utf-8") as f_list:
+            for audio_file in f_list:
+                paths.append(os.path.join(prefix, audio_file.rstrip()))
+    return paths
+
+
+def speech_features_reader(prefix: str = "",
+                           audio_format: str = "wav",
+                           num_workers: int = 1,
+                           store_dir: Optional[str] = None,
+                           **kwargs) -> Callable:
+    """Get a reader of speech features of audio files.
+
+    This reader replaces the combination of the ``audio_reader`` and the
+    ``SpeechFeaturesPreprocessor``. The features are returned as float32
+    arrays.
+
+    Arguments:
+        prefix: Prefix of the paths to the audio files.
+        audio_format: The format of the audio files, 'wav' or 'sph'.
+        num_workers: The number of processes computing the features.
+        store_dir: The directory of the feature stores. For each list of
+            audio files and feature settings, the features are computed only
+            once and then read from a store in this directory. The stores are
+            invalidated when any of the audio files changes. If None, the
+            features are computed every time the files are read.
+        kwargs: The arguments of the ``SpeechFeaturesPreprocessor``
+            (the feature type, the delta features and the arguments of the
+            feature function).
+
+    Returns:
+        The reader function that takes a list of files with audio file paths
+        (relative to the provided prefix) and returns the features as arrays
+        of shape [num_frames, num_features].
+    """
+    if num_workers <= 0:
+        raise ValueError("Number of workers must be positive, was {}"
+                         .format(num_workers))
+
+    if audio_format not in AUDIO_LOADERS:
+        raise ValueError(
+            "Unsupported audio format: {}".format(audio_format))
+    # check the feature arguments before the features are computed
+    SpeechFeaturesPreprocessor(**kwargs)
+
+    extract = _FeatureExtractor(audio_format, kwargs)
+
+    def compute(paths: List[str]) -> Iterable[np.ndarray]:
+        return parallel_map(extract, paths, num_workers, chunk_size=4)
+
+    def store_key(paths: List[str]) -> str:
+        description = [
+            audio_format, sorted(kwargs.items())]  # type: List[Any]
+        for path in paths:
+            stat = os.stat(path)
+            description.append([os.path.abspath(path), stat.st_size,
+                                stat.st_mtime])
+        return hashlib.sha1(
+            json.dumps(description).encode("utf-8")).hexdigest()
+
+    def load(list_files: List[str]) -> Iterable[np.ndarray]:
+        paths = _audio_paths(list_files, prefix)
+        if store_dir is None:
+            return compute(paths)
+
+        directory = os.path.join(store_dir, store_key(paths))
+        if not os.path.isfile(os.path.join(directory, STORE_INFO)):
+            log("Computing speech features of {} to '{}'".format(
+                ", ".join(list_files), directory))
+
+            tmp_directory = "{}.tmp-{}".format(directory, os.getpid())
+            os.makedirs(tmp_directory)
+            try:
+                save_feature_store(compute(paths), tmp_directory)
+            except Exception:
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+                raise
+
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # another process may have stored the same features first
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+                if not os.path.isfile(os.path.join(directory, STORE_INFO)):
+                    raise
+
+        return load_feature_store(directory)
+
+    return load
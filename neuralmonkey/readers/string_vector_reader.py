@@ -1,34 +1,83 @@
-from typing import List, Iterable, Type
+from typing import List, Iterable, Iterator, Optional, Tuple, Type
 import gzip
+import itertools
+import warnings
+
 import numpy as np
 
+# Number of lines parsed at once
+CHUNK_SIZE = 10000
+
+
+def get_string_vector_reader(dtype: Type = np.float32,
+                             columns: Optional[int] = None,
+                             chunk_size: int = CHUNK_SIZE):
+    """Get a reader for vectors encoded as whitespace-separated numbers.
 
-def get_string_vector_reader(dtype: Type = np.float32, columns: int = None):
-    """Get a reader for vectors encoded as whitespace-separated numbers."""
-    def process_line(line: str, lineno: int, path: str) -> np.ndarray:
-        numbers = line.strip().split()
+    The lines are parsed in chunks, each chunk by a single NumPy call. The
+    vectors are still yielded one by one, so only a chunk of the file is in
+    the memory at once when the series is read lazily. The vectors of
+    a chunk are views of a single array.
+
+    Arguments:
+        dtype: The data type of the vectors.
+        columns: The number of numbers on every line. If None, the lines may
+            have different lengths.
+        chunk_size: The number of lines parsed at once.
+    """
+    def process_line(line: bytes, lineno: int, path: str) -> np.ndarray:
+        numbers = line.split()
         if columns is not None and len(numbers) != columns:
             raise ValueError("Wrong number of columns ({}) on line {}, file {}"
                              .format(len(numbers), lineno, path))
 
-        return np.array(numbers, dtype=dtype)
+        return np.array([number.decode("utf-8") for number in numbers],
+                        dtype=dtype)
+
+    def parse_chunk(lines: List[bytes], linenos: List[int],
+                    path: str) -> Iterable[np.ndarray]:
+        counts = [len(line.split()) for line in lines]
+        if columns is not None and any(count != columns for count in counts):
+            # report the first line with a wrong number of columns
+            return [process_line(line, lineno, path)
+                    for line, lineno in zip(lines, linenos)]
+
+        try:
+            with warnings.catch_warnings():
+                # older NumPy only warns about unparsable numbers
+                warnings.simplefilter("error", DeprecationWarning)
+                flat = np.fromstring(b" ".join(lines), dtype=dtype, sep=" ")
+        except (ValueError, DeprecationWarning):
+            flat = None
+
+        if flat is None or flat.size != sum(counts):
+            # find the malformed line (or parse the lines one by one if
+            # NumPy did not accept the chunk for another reason)
+            return [process_line(line, lineno, path)
+                    for line, lineno in zip(lines, linenos)]
+
+        if columns is not None:
+            return list(flat.reshape([len(lines), columns]))
+        return np.split(flat, np.cumsum(counts)[:-1])
+
+    def read_chunks(path: str) -> Iterator[Tuple[List[bytes], List[int]]]:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f_data:
+            numbered_lines = ((lineno, line.strip()) for lineno, line
+                              in enumerate(f_data, start=1))
+            non_empty = ((lineno, line) for lineno, line in numbered_lines
+                         if line)
+            while True:
+                chunk = list(itertools.islice(non_empty, chunk_size))
+                if not chunk:
+                    break
+                linenos, lines = zip(*chunk)
+                yield list(lines), list(linenos)
 
-    def reader(files: List[str])-> Iterable[List[np.ndarray]]:
+    def reader(files: List[str]) -> Iterable[np.ndarray]:
         for path in files:
-            current_line = 0
-
-            if path.endswith(".gz"):
-                with gzip.open(path, "r") as f_data:
-                    for line in f_data:
-                        current_line += 1
-                        if line.strip():
-                            yield process_line(str(line), current_line, path)
-            else:
-                with open(path) as f_data:
-                    for line in f_data:
-                        current_line += 1
-                        if line.strip():
-                            yield process_line(line, current_line, path)
+            for lines, linenos in read_chunks(path):
+                yield from parse_chunk(lines, linenos, path)
 
     return reader
 
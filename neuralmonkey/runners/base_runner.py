@@ -39,6 +39,13 @@ class BaseRunner(Generic[MP]):
             notice("Top-level decoder {} does not have the 'data_id' attribute"
                    .format(decoder.name))
 
+    def start_batch(self) -> None:
+        """Prepare the runner for executing a new batch.
+
+        The runners sharing a computation with other runners (e.g. a beam
+        search) start a new one here. The other runners do nothing.
+        """
+
     def get_executable(self,
                        compute_losses: bool,
                        summaries: bool,
@@ -1,4 +1,4 @@
-from typing import Callable, List, Dict, Optional, Set, cast
+from typing import Callable, List, Dict, Optional, Set
 
 import scipy
 import numpy as np
@@ -11,19 +11,33 @@ from neuralmonkey.runners.base_runner import (
 # pylint: disable=unused-import
 from neuralmonkey.runners.base_runner import FeedDict
 # pylint: enable=unused-import
-from neuralmonkey.vocabulary import PAD_TOKEN_INDEX, END_TOKEN, PAD_TOKEN
+from neuralmonkey.vocabulary import END_TOKEN, PAD_TOKEN
 
 
 class BeamSearchExecutable(Executable):
     def __init__(self,
-                 rank: int,
+                 max_rank: int,
                  all_coders: Set[ModelPart],
                  num_sessions: int,
                  decoder: BeamSearchDecoder,
                  postprocess: Optional[Callable]) -> None:
-        """TODO: docstring describing the whole knowhow."""
-
-        self._rank = rank
+        """Create a beam search executable.
+
+        The executable runs the beam search once and backtracks the
+        hypotheses of all ranks from 1 to ``max_rank`` at the end. The
+        results for the individual ranks are stored in the ``rank_results``
+        list, the ``result`` attribute holds the results of the best
+        hypotheses.
+
+        Arguments:
+            max_rank: The number of best hypotheses to extract.
+            all_coders: Model parts the decoder depends on.
+            num_sessions: Number of sessions (more than one for ensembles).
+            decoder: The beam search decoder.
+            postprocess: Series-level postprocess applied on each rank.
+        """
+
+        self._max_rank = max_rank
         self._num_sessions = num_sessions
         self._all_coders = all_coders
         self._decoder = decoder
@@ -32,11 +46,12 @@ class BeamSearchExecutable(Executable):
         # Length of the currently sequence decoded so far
         self._step = 0
 
-        # We need to define the np.empty arrays here due to the usage
-        # of np.append later
-        self._scores = np.empty([0, decoder.beam_size], dtype=float)
-        self._parent_ids = np.empty([0, decoder.beam_size], dtype=int)
-        self._token_ids = np.empty([0, decoder.beam_size], dtype=int)
+        # The step outputs have shape time x batch x beam. The batch size is
+        # not known until the first results are collected, so we store the
+        # outputs of each session.run and concatenate them at the end.
+        self._scores = []  # type: List[np.ndarray]
+        self._parent_ids = []  # type: List[np.ndarray]
+        self._token_ids = []  # type: List[np.ndarray]
 
         self._next_feed = [{} for _ in range(self._num_sessions)] \
             # type: List[FeedDict]
@@ -50,6 +65,7 @@ class BeamSearchExecutable(Executable):
                 fd.update({self._decoder.max_steps: 0})
 
         self.result = None  # type: ExecutionResult
+        self.rank_results = None  # type: List[ExecutionResult]
 
     def next_to_execute(self) -> NextExecute:
         return (self._all_coders,
@@ -76,27 +92,26 @@ class BeamSearchExecutable(Executable):
         # ensembles: step_size == 1
         step_size = bs_outputs.last_dec_loop_state.step - 1
 
-        self._step += step_size
-        self._scores = np.append(
-            self._scores,
-            bs_outputs.last_search_step_output.scores[0:step_size],
-            axis=0)
-
-        self._parent_ids = np.append(
-            self._parent_ids,
-            bs_outputs.last_search_step_output.parent_ids[0:step_size],
-            axis=0)
-
-        self._token_ids = np.append(
-            self._token_ids,
-            bs_outputs.last_search_step_output.token_ids[0:step_size],
-            axis=0)
+        if step_size > 0:
+            self._step += step_size
+            self._scores.append(
+                bs_outputs.last_search_step_output.scores[0:step_size])
+            self._parent_ids.append(
+                bs_outputs.last_search_step_output.parent_ids[0:step_size])
+            self._token_ids.append(
+                bs_outputs.last_search_step_output.token_ids[0:step_size])
 
         if (self._decoder.max_output_len is not None and
                 self._step > self._decoder.max_output_len):
             self.prepare_results()
             return
 
+        # We can stop decoding when all hypotheses of all sentences in the
+        # batch are finished
+        if self._step > 0 and np.all(bs_outputs.last_search_state.finished):
+            self.prepare_results()
+            return
+
         # Prepare the next feed_dict (required for ensembles)
         self._next_feed = []
         for result in results:
@@ -129,53 +144,133 @@ class BeamSearchExecutable(Executable):
 
             self._next_feed.append(fd)
 
-        if self._token_ids.size == 0:
-            return
-
-        # We assume that we can stop decoding when all tokens
-        # in the last step were <pad>
-        # TODO: investigate this and fix this if necessary
-        if np.all(np.equal(self._token_ids[-1], PAD_TOKEN_INDEX)):
-            self.prepare_results()
+    def prepare_results(self):
+        # shape(all) = time x batch x beam
+        scores = np.concatenate(self._scores, axis=0)
+        parent_ids = np.concatenate(self._parent_ids, axis=0)
+        token_ids = np.concatenate(self._token_ids, axis=0)
+
+        max_time, batch_size, _ = scores.shape
+        batch_indices = np.expand_dims(np.arange(batch_size), 1)
+
+        # indices of the hypotheses with ranks 1 to max_rank in each sentence
+        # shape(hyp_idx) = batch x max_rank
+        hyp_idx = np.argsort(-scores[-1], axis=1)[:, :self._max_rank]
+        bs_scores = scores[-1][batch_indices, hyp_idx]
+
+        # backtrack the hypotheses of all sentences and ranks at once
+        output_ids = np.empty([max_time, batch_size, self._max_rank],
+                              dtype=int)
+        for time in reversed(range(max_time)):
+            output_ids[time] = token_ids[time][batch_indices, hyp_idx]
+            hyp_idx = parent_ids[time][batch_indices, hyp_idx]
+
+        index_to_word = self._decoder.vocabulary.index_to_word
+
+        self.rank_results = []
+        for rank_index in range(self._max_rank):
+            decoded_tokens = []
+            for sentence_ids in output_ids[:, :, rank_index].T:
+                before_eos_tokens = []
+                for token_id in sentence_ids:
+                    tok = index_to_word[token_id]
+                    if tok == END_TOKEN:
+                        break
+                    # TODO: investigate why the decoder can start generating
+                    # padding before generating the END_TOKEN
+                    if tok != PAD_TOKEN:
+                        before_eos_tokens.append(tok)
+                decoded_tokens.append(before_eos_tokens)
+
+            if self._postprocess is not None:
+                decoded_tokens = self._postprocess(decoded_tokens)
+
+            # TODO: provide better summaries in case (issue #599)
+            # we want to use the runner during training.
+            # The loss is summed here because it gets averaged over all
+            # sentences in reduce_execution_results.
+            self.rank_results.append(ExecutionResult(
+                outputs=decoded_tokens,
+                losses=[np.sum(bs_scores[:, rank_index])],
+                scalar_summaries=None,
+                histogram_summaries=None,
+                image_summaries=None))
+
+        self.result = self.rank_results[0]
     # pylint: enable=too-many-locals
 
-    def prepare_results(self):
-        max_time = self._step
 
-        output_tokens = []
-        hyp_idx = np.argpartition(
-            -self._scores[-1], self._rank - 1)[self._rank - 1]
-        bs_score = self._scores[-1][hyp_idx]
-        for time in reversed(range(max_time)):
-            token_id = self._token_ids[time][hyp_idx]
-            token = self._decoder.vocabulary.index_to_word[token_id]
-            output_tokens.append(token)
-            hyp_idx = self._parent_ids[time][hyp_idx]
-
-        output_tokens.reverse()
-
-        before_eos_tokens = []
-        for tok in output_tokens:
-            if tok == END_TOKEN:
-                break
-            # TODO: investigate why the decoder can start generating
-            # padding before generating the END_TOKEN
-            if tok != PAD_TOKEN:
-                before_eos_tokens.append(tok)
-
-        if self._postprocess is not None:
-            decoded_tokens = self._postprocess([before_eos_tokens])
-        else:
-            decoded_tokens = [before_eos_tokens]
-
-        # TODO: provide better summaries in case (issue #599)
-        # we want to use the runner during training.
-        self.result = ExecutionResult(
-            outputs=decoded_tokens,
-            losses=[bs_score],
-            scalar_summaries=None,
-            histogram_summaries=None,
-            image_summaries=None)
+class BeamSearchRankExecutable(Executable):
+    """Executable providing a single rank of a shared beam search.
+
+    Runners of different ranks of the same beam search decoder share one
+    ``BeamSearchExecutable``. Only the first rank executable created for the
+    batch (the leader) actually executes it, the others only wait for the
+    results.
+    """
+
+    def __init__(self,
+                 search: BeamSearchExecutable,
+                 rank: int,
+                 is_leader: bool) -> None:
+        self._search = search
+        self._rank = rank
+        self._is_leader = is_leader
+
+    @property
+    def result(self) -> Optional[ExecutionResult]:
+        if self._search.rank_results is None:
+            return None
+        return self._search.rank_results[self._rank - 1]
+
+    def next_to_execute(self) -> NextExecute:
+        if self._is_leader:
+            return self._search.next_to_execute()
+        return set(), {}, None
+
+    def collect_results(self, results: List[Dict]) -> None:
+        if self._is_leader:
+            self._search.collect_results(results)
+
+
+class BeamSearchGroup(object):
+    """A beam search shared among runners of different ranks.
+
+    For each batch, the group creates a single ``BeamSearchExecutable`` which
+    extracts the hypotheses of all the ranks, and gives each runner a view of
+    its rank. This way, the search is run only once per batch regardless of
+    the number of runners.
+
+    The search of a batch is started by the first runner asking for an
+    executable after ``start_batch`` is called (the ``TensorFlowManager``
+    calls it before every batch), the other runners only read its results.
+    """
+
+    def __init__(self,
+                 decoder: BeamSearchDecoder,
+                 max_rank: int,
+                 postprocess: Optional[Callable]) -> None:
+        self.decoder = decoder
+        self.max_rank = max_rank
+        self._postprocess = postprocess
+
+        self._search = None  # type: Optional[BeamSearchExecutable]
+
+    def start_batch(self) -> None:
+        """Forget the search of the previous batch."""
+        self._search = None
+
+    def get_executable(self,
+                       rank: int,
+                       all_coders: Set[ModelPart],
+                       num_sessions: int) -> BeamSearchRankExecutable:
+        if self._search is None:
+            self._search = BeamSearchExecutable(
+                self.max_rank, all_coders, num_sessions, self.decoder,
+                self._postprocess)
+            return BeamSearchRankExecutable(self._search, rank, True)
+
+        return BeamSearchRankExecutable(self._search, rank, False)
 
 
 class BeamSearchRunner(BaseRunner):
@@ -183,7 +278,20 @@ class BeamSearchRunner(BaseRunner):
                  output_series: str,
                  decoder: BeamSearchDecoder,
                  rank: int = 1,
-                 postprocess: Callable[[List[str]], List[str]] = None) -> None:
+                 postprocess: Callable[[List[str]], List[str]] = None,
+                 group: BeamSearchGroup = None) -> None:
+        """Create a beam search runner.
+
+        Arguments:
+            output_series: Name of the output series.
+            decoder: The beam search decoder.
+            rank: Rank of the hypothesis from the beam to output.
+            postprocess: Series-level postprocess applied on output. When
+                the group is provided, the postprocess of the group is used.
+            group: A beam search group shared with runners of other ranks
+                (see ``beam_search_runner_range``). If None, the runner
+                runs its own search.
+        """
         check_argument_types()
         BaseRunner.__init__(self, output_series, decoder)
 
@@ -192,18 +300,28 @@ class BeamSearchRunner(BaseRunner):
                 ("Rank of output hypothesis must be between 1 and the beam "
                  "size ({}), was {}.").format(decoder.beam_size, rank))
 
+        if group is None:
+            group = BeamSearchGroup(decoder, rank, postprocess)
+
+        if group.decoder is not decoder or rank > group.max_rank:
+            raise ValueError(
+                "The beam search group must use the same decoder as the "
+                "runner and must extract hypotheses up to rank {}."
+                .format(rank))
+
         self._rank = rank
-        self._postprocess = postprocess
+        self._group = group
+
+    def start_batch(self) -> None:
+        """Start a new search shared with the other runners of the group."""
+        self._group.start_batch()
 
     def get_executable(self,
                        compute_losses: bool = False,
                        summaries: bool = True,
-                       num_sessions: int = 1) -> BeamSearchExecutable:
-        decoder = cast(BeamSearchDecoder, self._decoder)
-
-        return BeamSearchExecutable(
-            self._rank, self.all_coders, num_sessions, decoder,
-            self._postprocess)
+                       num_sessions: int = 1) -> BeamSearchRankExecutable:
+        return self._group.get_executable(
+            self._rank, self.all_coders, num_sessions)
 
     @property
     def loss_names(self) -> List[str]:
@@ -223,7 +341,8 @@ def beam_search_runner_range(output_series: str,
     """Return beam search runners for a range of ranks from 1 to max_rank.
 
     This means there is max_rank output series where the n-th series contains
-    the n-th best hypothesis from the beam search.
+    the n-th best hypothesis from the beam search. All the runners share
+    a single beam search, i.e. the search is run only once for each batch.
 
     Args:
         output_series: Prefix of output series.
@@ -246,6 +365,8 @@ def beam_search_runner_range(output_series: str,
              "bigger than beam size {}.").format(
                  max_rank, decoder.beam_size))
 
+    group = BeamSearchGroup(decoder, max_rank, postprocess)
+
     return [BeamSearchRunner("{}.rank{:03d}".format(output_series, r),
-                             decoder, r, postprocess)
+                             decoder, r, postprocess, group)
             for r in range(1, max_rank + 1)]
@@ -0,0 +1,456 @@
+"""Persistent cache of preprocessed data series.
+
+Applying preprocessors (e.g. byte-pair encoding) to large corpora is slow and
+it is repeated on every run of an experiment, and for the lazy datasets even
+on every epoch. The series cache stores the preprocessed series on the disk
+and reuses them whenever the same preprocessor is applied to the same data.
+
+The cache entries are addressed by a hash of the content of the input files,
+a fingerprint of the reader and a fingerprint of the preprocessors. The
+fingerprint of a function is computed from its name, its bytecode and the
+values it closes over; the fingerprint of an object from its class and its
+attributes; the fingerprint of a numpy array from its content. Series made
+by preprocessors which cannot be fingerprinted this way are not cached.
+Changes in the code called by the preprocessor are not detected and the
+cache needs to be purged manually after such changes, using the
+``neuralmonkey-cache`` command.
+
+Tokenized text series are stored in the binary format of the binary dataset,
+other series as pickled items. Both are memory-mapped when loaded.
+
+The lazy datasets read their preprocessed series using
+``cached_file_series``, the in-memory datasets look them up using the keys
+made by ``filtered_series_key`` and ``dataset_series_key``.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import argparse
+import collections
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+from typeguard import check_argument_types
+
+from neuralmonkey.fingerprint import FingerprintError, fingerprint
+from neuralmonkey.length_filter import LengthFilter
+from neuralmonkey.logging import log, warn
+from neuralmonkey.parallel import parallel_map
+from neuralmonkey.readers.binary_reader import (
+    load_binary_series, load_pickled_series, save_binary_series,
+    save_pickled_series)
+
+ENTRY_INFO = "entry.json"
+FILE_HASHES = "file_hashes.json"
+_SERIES_ID = "series"
+_BLOCK_SIZE = 1 << 20
+
+
+def _directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory))
+
+
+class SeriesCache(object):
+    """On-disk cache of preprocessed data series."""
+
+    def __init__(self, directory: str, max_size_mb: int = None) -> None:
+        """Create a cache stored in a directory.
+
+        Arguments:
+            directory: The directory of the cache. It is created if it does
+                not exist.
+            max_size_mb: The maximum total size of the cache entries in
+                megabytes. When it is exceeded, the least recently used
+                entries are removed. If None, the size is not limited.
+        """
+        check_argument_types()
+
+        self.directory = directory
+        self.max_size_mb = max_size_mb
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def file_hash(self, path: str) -> str:
+        """Get the hash of the content of a file.
+
+        The hashes are remembered in the cache directory together with the
+        size and the modification time of the files, so unchanged files are
+        hashed only once.
+
+        Arguments:
+            path: The path to the file.
+
+        Returns:
+            The hexadecimal SHA-1 digest of the file content.
+        """
+        hashes_path = os.path.join(self.directory, FILE_HASHES)
+        hashes = {}  # type: Dict[str, Any]
+        if os.path.isfile(hashes_path):
+            with open(hashes_path, encoding="utf-8") as f_hashes:
+                hashes = json.load(f_hashes)
+
+        abs_path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime]
+
+        known = hashes.get(abs_path)
+        if known is not None and known["stamp"] == stamp:
+            return known["hash"]
+
+        log("Computing hash of '{}'".format(path))
+        digest = hashlib.sha1()
+        with open(path, "rb") as f_data:
+            for block in iter(lambda: f_data.read(_BLOCK_SIZE), b""):
+                digest.update(block)
+
+        hashes[abs_path] = {"stamp": stamp, "hash": digest.hexdigest()}
+        tmp_path = "{}.{}".format(hashes_path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f_hashes:
+            json.dump(hashes, f_hashes)
+        os.replace(tmp_path, hashes_path)
+
+        return digest.hexdigest()
+
+    def key(self, paths: List[str], *functions: Any) -> Optional[str]:
+        """Get the key of a series derived from files.
+
+        Arguments:
+            paths: The input files of the series.
+            functions: The reader and the preprocessors which produce the
+                series from the files.
+
+        Returns:
+            The key of the series or None if the functions cannot be
+            fingerprinted, so the series cannot be cached.
+        """
+        digest = hashlib.sha1()
+        for path in paths:
+            digest.update(self.file_hash(path).encode("utf-8"))
+        try:
+            for function in functions:
+                digest.update(fingerprint(function).encode("utf-8"))
+        except FingerprintError as exc:
+            warn("The series will not be cached: {}".format(exc))
+            return None
+        return digest.hexdigest()
+
+    def load(self, key: str) -> Optional[collections.Sequence]:
+        """Load a cached series.
+
+        Arguments:
+            key: The key of the series.
+
+        Returns:
+            The memory-mapped series or None if it is not in the cache.
+        """
+        entry = self._entry_path(key)
+        info_path = os.path.join(entry, ENTRY_INFO)
+        if not os.path.isfile(info_path):
+            return None
+
+        with open(info_path, encoding="utf-8") as f_info:
+            info = json.load(f_info)
+
+        # the modification time of the info marks the last use of the entry
+        os.utime(info_path)
+        log("Using cached series '{}' ({})".format(key, info["description"]))
+
+        if info["format"] == "tokens":
+            return load_binary_series(entry, _SERIES_ID)
+        return load_pickled_series(entry, _SERIES_ID)
+
+    def store(self, key: str, series: Iterable[Any],
+              description: str = "") -> Optional[collections.Sequence]:
+        """Store a series in the cache.
+
+        The series is written as it is read, so it does not need to fit in
+        the memory. Tokenized text is stored in the compact binary format,
+        other series are pickled.
+
+        Arguments:
+            key: The key of the series.
+            series: The series to store.
+            description: A human-readable description of the series shown
+                when the entries are listed.
+
+        Returns:
+            The stored series loaded from the cache.
+        """
+        iterator = iter(series)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            first = None
+        items = iterator if first is None else _prepend(first, iterator)
+
+        tokenized = (isinstance(first, (list, tuple))
+                     and all(isinstance(token, str) for token in first))
+
+        tmp_entry = "{}.tmp-{}".format(self._entry_path(key), os.getpid())
+        os.makedirs(tmp_entry)
+        try:
+            if tokenized:
+                length = save_binary_series(items, tmp_entry, _SERIES_ID)
+            else:
+                length = save_pickled_series(items, tmp_entry, _SERIES_ID)
+
+            with open(os.path.join(tmp_entry, ENTRY_INFO), "w",
+                      encoding="utf-8") as f_info:
+                json.dump({"description": description,
+                           "format": "tokens" if tokenized else "pickle",
+                           "length": length,
+                           "created": time.time()}, f_info)
+
+            # another process may have stored the same series meanwhile
+            if os.path.isdir(self._entry_path(key)):
+                shutil.rmtree(tmp_entry)
+            else:
+                os.rename(tmp_entry, self._entry_path(key))
+        except Exception:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            raise
+
+        self._evict(keep=key)
+        return self.load(key)
+
+    def cached(self, key: Optional[str], compute: Callable[[], Iterable[Any]],
+               description: str = "") -> Iterable[Any]:
+        """Get a series from the cache or compute and store it.
+
+        Arguments:
+            key: The key of the series. If None, the series is not cached.
+            compute: Function computing the series if it is not cached.
+            description: A human-readable description of the series.
+
+        Returns:
+            The cached series.
+        """
+        if key is None:
+            return compute()
+
+        series = self.load(key)
+        if series is None:
+            log("Preprocessed series '{}' ({}) not cached, computing it"
+                .format(key, description))
+            # the errors of the computation are not caught, only the errors
+            # of storing the items (e.g. unpicklable items)
+            source_failed = []  # type: List[bool]
+            items = _guarded(compute(), source_failed)
+            try:
+                series = self.store(key, items, description)
+            except (pickle.PicklingError, AttributeError, TypeError,
+                    ValueError) as exc:
+                if source_failed:
+                    raise
+                warn("Cannot cache series '{}': {}".format(key, exc))
+                return compute()
+        return series
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """List the cache entries.
+
+        Returns:
+            A list of dictionaries describing the entries, sorted from the
+            least recently used one. The dictionaries contain the key, the
+            description, the size in bytes, the number of items and the time
+            of the last use.
+        """
+        result = []
+        for key in os.listdir(self.directory):
+            info_path = os.path.join(self._entry_path(key), ENTRY_INFO)
+            if not os.path.isfile(info_path):
+                continue
+
+            with open(info_path, encoding="utf-8") as f_info:
+                info = json.load(f_info)
+
+            info["key"] = key
+            info["size"] = _directory_size(self._entry_path(key))
+            info["used"] = os.path.getmtime(info_path)
+            result.append(info)
+
+        return sorted(result, key=lambda info: info["used"])
+
+    def purge(self, keys: List[str] = None) -> None:
+        """Remove entries from the cache.
+
+        Arguments:
+            keys: The keys of the entries to remove. If None, all the entries
+                are removed.
+        """
+        if keys is None:
+            keys = [info["key"] for info in self.entries()]
+
+        for key in keys:
+            if not os.path.isdir(self._entry_path(key)):
+                raise ValueError("No cache entry '{}'".format(key))
+            shutil.rmtree(self._entry_path(key))
+            log("Removed cache entry '{}'".format(key))
+
+    def _evict(self, keep: str = None) -> None:
+        """Remove the least recently used entries exceeding the size limit.
+
+        Arguments:
+            keep: The key of an entry which should not be removed.
+        """
+        if self.max_size_mb is None:
+            return
+
+        entries = self.entries()
+        total_size = sum(info["size"] for info in entries)
+        for info in entries:
+            if total_size <= self.max_size_mb * 1024 * 1024:
+                break
+            if info["key"] == keep:
+                continue
+
+            shutil.rmtree(self._entry_path(info["key"]))
+            total_size -= info["size"]
+            log("Evicted cache entry '{}' ({})".format(
+                info["key"], info["description"]))
+
+
+# pylint: disable=invalid-name
+SeriesSources = Dict[str, Tuple[List[str], Any]]
+# pylint: enable=invalid-name
+
+
+def describe_series(function: Callable, sources: List[str]) -> str:
+    """Describe a preprocessed series in the series cache."""
+    name = getattr(function, "__qualname__", type(function).__name__)
+    return "{} of {}".format(name, ", ".join(sources))
+
+
+def cached_file_series(cache: SeriesCache, paths: List[str], reader: Any,
+                       function: Callable,
+                       num_workers: int) -> Optional[collections.Sequence]:
+    """Get a series preprocessed from files from the cache.
+
+    The whole series is preprocessed and stored in the cache in the order of
+    the files if it is not there yet.
+
+    Arguments:
+        cache: The series cache.
+        paths: The files of the source series.
+        reader: The reader of the files.
+        function: The preprocessor applied to the source series.
+        num_workers: The number of processes applying the preprocessor.
+
+    Returns:
+        The preprocessed series or None if it could not be cached.
+    """
+    series = cache.cached(
+        cache.key(paths, reader, function),
+        lambda: parallel_map(function, reader(paths), num_workers),
+        describe_series(function, paths))
+    if not isinstance(series, collections.Sequence):
+        return None
+    return series
+
+
+def filtered_series_key(
+        cache: SeriesCache, series_paths_and_readers: SeriesSources,
+        src_id: str, prefilter: Optional[LengthFilter],
+        function: Callable) -> Optional[str]:
+    """Get the cache key of a series preprocessed after the length filter.
+
+    The examples kept by the filter depend on all the limited series, so
+    the key includes their files and readers and the filter itself.
+    """
+    paths, reader = series_paths_and_readers[src_id]
+    if prefilter is None or not prefilter.limits:
+        return cache.key(paths, reader, function)
+
+    limited = sorted(prefilter.limits)
+    return cache.key(
+        paths + [path for s_id in limited
+                 for path in series_paths_and_readers[s_id][0]],
+        reader, function, prefilter,
+        [(s_id, series_paths_and_readers[s_id][1]) for s_id in limited])
+
+
+def dataset_series_key(
+        cache: SeriesCache, series_paths_and_readers: SeriesSources,
+        preprocessors: Optional[List[Tuple[str, str, Callable]]],
+        length_filter: Optional[LengthFilter],
+        preprocessor: Callable) -> Optional[str]:
+    """Get the cache key of a series of a dataset-level preprocessor.
+
+    A dataset-level preprocessor can use any of the series of the filtered
+    dataset, so the key includes all the files of the dataset, their
+    readers, the preprocessors and the length filter.
+    """
+    sources = sorted(series_paths_and_readers.items())
+    return cache.key([path for _, (paths, _) in sources for path in paths],
+                     [(s_id, reader) for s_id, (_, reader) in sources],
+                     preprocessors, length_filter, preprocessor)
+
+
+def _guarded(items: Iterable[Any], failed: List[bool]) -> Iterable[Any]:
+    """Iterate over items and record whether the iteration raised an error."""
+    iterator = iter(items)
+    while True:
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        except Exception:
+            failed.append(True)
+            raise
+        yield item
+
+
+def _prepend(first: Any, rest: Iterable[Any]) -> Iterable[Any]:
+    yield first
+    yield from rest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Manage the cache of preprocessed data series.")
+    parser.add_argument("directory", metavar="CACHE-DIR",
+                        help="the directory of the cache")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("list", help="list the cache entries")
+    purge_parser = subparsers.add_parser("purge",
+                                         help="remove cache entries")
+    purge_parser.add_argument("keys", metavar="KEY", nargs="*",
+                              help="keys of the entries to remove")
+    purge_parser.add_argument("--all", action="store_true",
+                              help="remove all the entries")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error("Cache directory '{}' does not exist"
+                     .format(args.directory))
+    cache = SeriesCache(args.directory)
+
+    if args.command == "list":
+        entries = cache.entries()
+        for info in entries:
+            print("{}\t{:.1f} MB\t{} items\t{}\t{}".format(
+                info["key"], info["size"] / 1024 / 1024, info["length"],
+                time.strftime("%Y-%m-%d %H:%M:%S",
+                              time.localtime(info["used"])),
+                info["description"]))
+        print("Total: {} entries, {:.1f} MB".format(
+            len(entries),
+            sum(info["size"] for info in entries) / 1024 / 1024))
+    elif args.command == "purge":
+        if args.all == bool(args.keys):
+            parser.error("Specify either the keys or --all")
+        cache.purge(None if args.all else args.keys)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,39 @@
 #!/usr/bin/env python3.5
 
+import gzip
+import os
+import tempfile
 import unittest
 
-from neuralmonkey.dataset import LazyDataset
-from neuralmonkey.readers.plain_text_reader import UtfPlainTextReader
+import numpy as np
+
+from neuralmonkey.dataset import (Dataset, LazyDataset, MixtureDataset,
+                                  load_binary_dataset, load_dataset_from_files,
+                                  save_binary_dataset)
+from neuralmonkey.readers.binary_reader import compact_token_series
+from neuralmonkey.readers.line_index import INDEX_SUFFIX, get_line_index
+from neuralmonkey.readers.numpy_reader import (ConcatenatedArray,
+                                               mmap_numpy_reader)
+from neuralmonkey.readers.plain_text_reader import (MultiColumnReader,
+                                                    UtfPlainTextReader,
+                                                    tsv_reader)
+from neuralmonkey.vocabulary import Vocabulary
+
+
+def _reverse(sentence):
+    return sentence[::-1]
+
+
+# pylint: disable=abstract-method
+class _CountedMixture(MixtureDataset):
+    """Mixture counting how many times its length was computed."""
+
+    length_calls = 0
+
+    def __len__(self) -> int:
+        self.length_calls += 1
+        return super().__len__()
+# pylint: enable=abstract-method
 
 
 class TestDataset(unittest.TestCase):
@@ -15,6 +45,402 @@ class TestDataset(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             LazyDataset("name", paths_and_readers, {}, None)
 
+    def test_shuffled_batches(self):
+        sentences = [["w{}".format(i)] for i in range(10)]
+        dataset = Dataset("dataset", {"source": sentences,
+                                      "ids": np.arange(10)}, {})
+        dataset.shuffle()
+
+        batches = list(dataset.batch_dataset(4))
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+
+        ids = [i for batch in batches for i in batch.get_series("ids")]
+        self.assertEqual(sorted(ids), list(range(10)))
+        for batch in batches:
+            for sent, i in zip(batch.get_series("source"),
+                               batch.get_series("ids")):
+                self.assertEqual(sent, ["w{}".format(i)])
+
+        # the series themselves are not copied
+        # pylint: disable=protected-access
+        self.assertIs(batches[0]._series["source"], sentences)
+        # pylint: enable=protected-access
+
+        subset = dataset.subset(8, 5)
+        self.assertEqual(list(subset.get_series("ids")), ids[8:])
+
+    def test_bucket_batching(self):
+        sentences = [["w"] * length for length in [1, 7, 2, 8, 3, 1, 9, 2]]
+        dataset = Dataset("dataset", {"source": sentences,
+                                      "ids": list(range(len(sentences)))}, {})
+
+        batches = list(dataset.bucket_batch_dataset(max_tokens=8))
+
+        ids = sorted(i for batch in batches for i in batch.get_series("ids"))
+        self.assertEqual(ids, list(range(len(sentences))))
+
+        for batch in batches:
+            lengths = [len(s) for s in batch.get_series("source")]
+            self.assertEqual(len(lengths), len(batch))
+            self.assertTrue(len(lengths) * max(lengths) <= 8
+                            or len(lengths) == 1)
+
+        # the examples are sorted only within the buffers
+        for batch in dataset.bucket_batch_dataset(max_tokens=8,
+                                                  buffer_size=4):
+            self.assertEqual(len({i // 4 for i in batch.get_series("ids")}),
+                             1)
+
+    def test_lazy_shuffle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths_and_readers = {}
+            for series in ["source", "target"]:
+                path = os.path.join(directory, series + ".txt")
+                with open(path, "w", encoding="utf-8") as f_data:
+                    for i in range(105):
+                        print("{} {}".format(series, i), file=f_data)
+                paths_and_readers[series] = ([path], UtfPlainTextReader)
+
+            dataset = LazyDataset("name", paths_and_readers, {}, None,
+                                  shuffle_buffer_size=20,
+                                  shuffle_chunk_size=10)
+            self.assertEqual(len(dataset), 105)
+
+            unshuffled = list(dataset.get_series("source"))
+            dataset.shuffle()
+            pairs = list(zip(dataset.get_series("source"),
+                             dataset.get_series("target")))
+
+            self.assertEqual(len(pairs), 105)
+            self.assertNotEqual([src for src, _ in pairs], unshuffled)
+            self.assertEqual(sorted(src for src, _ in pairs),
+                             sorted(unshuffled))
+            for src, tgt in pairs:
+                self.assertEqual(src[1], tgt[1])
+
+    def test_lazy_shuffle_gzip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.txt.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f_data:
+                for i in range(50):
+                    print("line {}".format(i), file=f_data)
+
+            dataset = LazyDataset("name", {"source": ([path],
+                                                      UtfPlainTextReader)},
+                                  {}, [("source", "number", lambda s: s[1])],
+                                  shuffle_buffer_size=20,
+                                  shuffle_chunk_size=5)
+            dataset.shuffle()
+
+            # a single-member gzip file is not read in chunks
+            self.assertFalse(get_line_index(path).seekable)
+            # pylint: disable=protected-access
+            self.assertFalse(dataset._read_in_chunks)
+            # pylint: enable=protected-access
+            pairs = list(zip(dataset.get_series("source"),
+                             dataset.get_series("number")))
+            self.assertEqual(sorted(int(src[1]) for src, _ in pairs),
+                             list(range(50)))
+            for src, number in pairs:
+                self.assertEqual(src[1], number)
+
+    def test_corrupt_line_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.txt")
+            with open(path, "w", encoding="utf-8") as f_data:
+                for i in range(10):
+                    print("line {}".format(i), file=f_data)
+            with open(path + INDEX_SUFFIX, "wb") as f_index:
+                f_index.write(b"PK\x03\x04 partial")
+
+            # the unreadable index is rebuilt and replaced
+            self.assertEqual(len(get_line_index(path)), 10)
+            with np.load(path + INDEX_SUFFIX) as index:
+                self.assertEqual(len(index["offsets"]), 11)
+            self.assertEqual(os.listdir(directory),
+                             ["data.txt", "data.txt" + INDEX_SUFFIX])
+
+    def test_lazy_subset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.txt.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f_data:
+                for i in range(50):
+                    print("line {}".format(i), file=f_data)
+
+            dataset = LazyDataset("name", {"source": ([path],
+                                                      UtfPlainTextReader)},
+                                  {}, [("source", "number", lambda s: s[1])])
+
+            subset = dataset.subset(45, 10)
+            self.assertEqual(list(subset.get_series("number")),
+                             ["45", "46", "47", "48", "49"])
+
+            view = dataset.from_offset(20)
+            self.assertEqual(len(view), 30)
+            self.assertEqual(next(iter(view.get_series("source"))),
+                             ["line", "20"])
+
+    def test_lazy_carriage_returns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.txt")
+            with open(path, "wb") as f_data:
+                f_data.write(b"a\rb\r\nc\nd e\n")
+
+            dataset = LazyDataset("name", {"source": ([path],
+                                                      UtfPlainTextReader)},
+                                  {})
+
+            # the indexed and the sequential reading split the same lines
+            self.assertEqual(len(dataset), 3)
+            self.assertEqual(len(list(dataset.get_series("source"))), 3)
+            self.assertEqual(list(dataset.from_offset(1).get_series("source")),
+                             [["c"], ["d", "e"]])
+
+    def test_parallel_loading(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.txt")
+            with open(path, "w", encoding="utf-8") as f_data:
+                for i in range(2500):
+                    print("line {}".format(i), file=f_data)
+
+            # the preprocessor is sent to the workers, the lambda is applied
+            # in the main process
+            for function in [_reverse, lambda s: s[::-1]]:
+                preprocessors = [("source", "reversed", function)]
+                for lazy in [False, True]:
+                    sequential = load_dataset_from_files(
+                        name="name", lazy=lazy, preprocessors=preprocessors,
+                        s_source=path)
+                    parallel = load_dataset_from_files(
+                        name="name", lazy=lazy, preprocessors=preprocessors,
+                        num_workers=3, s_source=path)
+
+                    for series in ["source", "reversed"]:
+                        self.assertEqual(
+                            list(parallel.get_series(series)),
+                            list(sequential.get_series(series)))
+
+    def test_parallel_mmap_loading(self):
+        with tempfile.TemporaryDirectory() as directory:
+            text_path = os.path.join(directory, "data.txt")
+            with open(text_path, "w", encoding="utf-8") as f_data:
+                for i in range(10):
+                    print("line {}".format(i), file=f_data)
+
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(directory, "{}.npy".format(i)))
+                np.save(paths[-1], np.full([5 * max(i, 1), 3], i,
+                                           dtype=np.float32))
+
+            dataset = load_dataset_from_files(
+                name="name", num_workers=2, s_source=text_path,
+                s_single=(paths[2:], mmap_numpy_reader),
+                s_concatenated=(paths[:2], mmap_numpy_reader))
+
+            # the arrays are read in the main process and stay memory-mapped
+            self.assertIsInstance(dataset.get_series("single"), np.memmap)
+            concatenated = dataset.get_series("concatenated")
+            self.assertIsInstance(concatenated, ConcatenatedArray)
+            self.assertTrue(all(isinstance(array, np.memmap)
+                                for array in concatenated.arrays))
+            self.assertEqual(
+                dataset.subset(3, 4).get_series("concatenated")[:, 0].tolist(),
+                [0, 0, 1, 1])
+
+    def test_binary_dataset(self):
+        source = [["a", "b", "c"], [], ["b"], ["d", "a"]]
+        target = [["x"], ["y", "x"], ["z"], ["y"]]
+        dataset = Dataset("dataset", {"source": source, "target": target},
+                          {})
+
+        with tempfile.TemporaryDirectory() as directory:
+            save_binary_dataset(dataset, directory)
+            binary = load_binary_dataset(directory, s_target_out="out.txt")
+
+            self.assertEqual(len(binary), 4)
+            self.assertEqual(binary.name, "dataset")
+            self.assertEqual(list(binary.get_series("source")), source)
+            self.assertEqual(binary.get_series("target")[3], ["y"])
+
+            subset = binary.subset(1, 2)
+            self.assertEqual(list(subset.get_series("source")), source[1:3])
+            self.assertEqual(subset.series_outputs,
+                             {"target": "out.txt.0000000001"})
+
+            binary.shuffle()
+            pairs = sorted(zip(binary.get_series("source"),
+                               binary.get_series("target")))
+            self.assertEqual(pairs, sorted(zip(source, target)))
+
+    def test_mixture(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "lazy.txt")
+            with open(path, "w", encoding="utf-8") as f_data:
+                for i in range(50):
+                    print("lazy {}".format(i), file=f_data)
+
+            lazy = LazyDataset(
+                "lazy", {"source": ([path], UtfPlainTextReader)}, {},
+                shuffle_buffer_size=10)
+            in_memory = Dataset(
+                "in-memory", {"source": [["memory", str(i)]
+                                         for i in range(20)],
+                              "target": [["x"]] * 20}, {})
+
+            mixture = MixtureDataset("mixture", [lazy, in_memory],
+                                     weights=[3, 1], epoch_size=200)
+            self.assertEqual(len(mixture), 200)
+            self.assertEqual(mixture.series_ids, ["source"])
+
+            np.random.seed(0)
+            counts = {"lazy": 0, "memory": 0}
+            seen_lazy = []
+            for epoch in range(2):
+                mixture.shuffle()
+                examples = 0
+                for batch in mixture.batch_dataset(5):
+                    examples += len(batch)
+                    for sentence in batch.get_series("source"):
+                        counts[sentence[0]] += 1
+                        if sentence[0] == "lazy" and epoch == 0:
+                            seen_lazy.append(int(sentence[1]))
+                self.assertEqual(examples, 200)
+
+            self.assertGreater(counts["lazy"], 2 * counts["memory"])
+            # the lazy dataset is read through before it is repeated
+            self.assertEqual(sorted(seen_lazy[:50]), list(range(50)))
+
+    def test_mixture_of_empty(self):
+        empty = Dataset("empty", {"source": []}, {})
+        mixture = MixtureDataset("mixture", [empty], epoch_size=10)
+        # the mixture keeps failing after the stream of batches is closed
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                list(mixture.batch_dataset(5))
+
+    def test_mixture_length(self):
+        dataset = Dataset("dataset", {"source": [["x"]] * 20}, {})
+        mixture = _CountedMixture("mixture", [dataset])
+        self.assertEqual(sum(len(batch)
+                             for batch in mixture.batch_dataset(2)), 20)
+        # the length is not recomputed for every batch
+        self.assertEqual(mixture.length_calls, 1)
+
+    def test_length_filter(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = {}
+            for series_id, lengths in [("source", [3, 0, 12, 4, 2, 5]),
+                                       ("target", [3, 2, 11, 4, 9, 5])]:
+                paths[series_id] = os.path.join(tmp_dir, series_id)
+                with open(paths[series_id], "w") as f_data:
+                    for i, length in enumerate(lengths):
+                        print(" ".join([str(i)] * length), file=f_data)
+
+            def first_tokens(dataset):
+                return [sentence[0] for sentence
+                        in dataset.get_series("target")]
+
+            for lazy in [False, True]:
+                dataset = load_dataset_from_files(
+                    lazy=lazy, s_source=paths["source"],
+                    s_target=paths["target"], min_len_source=1,
+                    max_len_source=10, max_len_target=10,
+                    max_length_ratio=2.0)
+                self.assertEqual(first_tokens(dataset), ["0", "3", "5"])
+                self.assertEqual(len(dataset), 3)
+                if lazy:
+                    # the offset counts the kept examples
+                    self.assertEqual(first_tokens(dataset.from_offset(2)),
+                                     ["5"])
+
+                truncated = load_dataset_from_files(
+                    lazy=lazy, s_source=paths["source"],
+                    s_target=paths["target"], max_len_source=4,
+                    max_len_target=4, truncate_long=True)
+                self.assertEqual(first_tokens(truncated),
+                                 ["0", "1", "2", "3", "4", "5"])
+                self.assertEqual(
+                    [len(sentence)
+                     for sentence in truncated.get_series("source")],
+                    [3, 0, 4, 4, 2, 4])
+                self.assertEqual(len(truncated), 6)
+
+    def test_compact_token_series(self):
+        sentences = [["a", "b", "a"], [], ("c",), ["b"]]
+        series = compact_token_series(iter(sentences))
+        self.assertEqual(len(series), 4)
+        self.assertEqual(series[0], ["a", "b", "a"])
+        self.assertEqual(series[-2], ["c"])
+        self.assertEqual(len(series.tokens), 3)
+
+        mixed = [["a"], ["b", 1], ["c"]]
+        self.assertEqual(compact_token_series(mixed), mixed)
+        self.assertEqual(compact_token_series([np.zeros(2)])[0].shape, (2,))
+
+    def test_indexed_series(self):
+        sentences = [["a", "b", "a"], [], ["c", "x"], ["b"]]
+        vocabulary = Vocabulary(["a", "b", "c"])
+
+        for series in [sentences, compact_token_series(sentences)]:
+            dataset = Dataset("dataset", {"source": series}, {})
+            dataset.shuffle()
+
+            for batch in dataset.batch_dataset(3):
+                expected = vocabulary.sentences_to_tensor(
+                    list(batch.get_series("source")), 2,
+                    pad_to_max_len=False, add_end_symbol=True)
+                tensors = vocabulary.indices_to_tensor(
+                    *batch.get_indexed_series("source", vocabulary), 2,
+                    pad_to_max_len=False, add_end_symbol=True)
+                for tensor, expected_tensor in zip(tensors, expected):
+                    self.assertTrue(np.array_equal(tensor, expected_tensor))
+
+            # the series is indexed once for the dataset and its views
+            # pylint: disable=protected-access
+            self.assertEqual(len(dataset._indexed_series), 1)
+            # pylint: enable=protected-access
+
+    def test_multi_column(self):
+        parsed_lines = []
+
+        class CountingReader(MultiColumnReader):
+            def parse_rows(self, lines):
+                for line in lines:
+                    parsed_lines.append(line)
+                    yield from super().parse_rows([line])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.tsv")
+            with open(path, "w", encoding="utf-8") as f_data:
+                for i in range(30):
+                    print("{}\t{} {}\t{}".format(i, i, i + 1, i % 3),
+                          file=f_data)
+
+            reader = CountingReader()
+            expected = {series_id: list(tsv_reader(column)([path]))
+                        for column, series_id in enumerate(
+                            ["source", "target", "score"], 1)}
+
+            for lazy in [False, True]:
+                del parsed_lines[:]
+                dataset = load_dataset_from_files(
+                    lazy=lazy, s_source=(path, reader.column(1)),
+                    s_target=(path, reader.column(2)),
+                    s_score=(path, reader.column(3)),
+                    shuffle_buffer_size=7 if lazy else None,
+                    shuffle_chunk_size=4)
+                dataset.shuffle()
+                batches = list(dataset.batch_dataset(8))
+                self.assertEqual(len(parsed_lines), 30)
+
+                examples = sorted(
+                    example for batch in batches for example in zip(
+                        *[batch.get_series(series_id)
+                          for series_id in expected]))
+                self.assertEqual(examples,
+                                 sorted(zip(*expected.values())))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3.5
+
+import unittest
+
+import numpy as np
+
+from neuralmonkey.dataset import Dataset
+from neuralmonkey.dataset_profile import (
+    bucketed_batches, fixed_size_batches, padding_stats, profile_dataset)
+from neuralmonkey.vocabulary import Vocabulary
+
+
+class TestDatasetProfile(unittest.TestCase):
+
+    def test_profile_dataset(self):
+        dataset = Dataset(
+            "dataset", {"source": [["a", "b"], ["a"], ["c", "a", "b"]],
+                        "labels": [1, 2, 3]}, {})
+        profiles = profile_dataset(dataset, batch_size=2)
+
+        self.assertEqual(set(profiles), {"source"})
+        self.assertEqual(list(profiles["source"].lengths), [2, 1, 3])
+
+        coverage = profiles["source"].coverage(Vocabulary(["a", "b"]))
+        self.assertAlmostEqual(coverage["tokens"], 5 / 6)
+        self.assertAlmostEqual(coverage["types"], 2 / 3)
+
+    def test_padding_stats(self):
+        lengths = np.array([2, 4, 4, 2])
+
+        stats = padding_stats(lengths, fixed_size_batches(len(lengths), 2))
+        self.assertEqual(stats["batches"], 2)
+        self.assertAlmostEqual(stats["padding"], 4 / 16)
+        self.assertEqual(stats["max_padded_tokens"], 8)
+
+        stats = padding_stats(lengths, bucketed_batches(lengths, 8, None))
+        self.assertEqual(stats["batches"], 2)
+        self.assertAlmostEqual(stats["padding"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3.5
+
+import unittest
+
+from neuralmonkey.parallel import get_pool, is_picklable, parallel_map
+
+
+def _double(number):
+    return 2 * number
+
+
+def _negate(number):
+    return -number
+
+
+class _Unpicklable(object):
+
+    def __reduce__(self):
+        raise ValueError("Cannot be pickled")
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_shared_pool(self):
+        pool = get_pool(2)
+        self.assertEqual(list(parallel_map(_double, range(10), 2,
+                                           chunk_size=3)),
+                         [2 * i for i in range(10)])
+        self.assertEqual(list(parallel_map(_negate, range(10), 2,
+                                           chunk_size=3)),
+                         [-i for i in range(10)])
+        # all the functions are applied by the same workers
+        self.assertIs(get_pool(2), pool)
+
+    def test_unpicklable(self):
+        self.assertTrue(is_picklable(_double))
+        self.assertFalse(is_picklable(lambda x: x))
+        self.assertFalse(is_picklable(_Unpicklable()))
+        self.assertEqual(list(parallel_map(lambda x: x + 1, range(3), 2)),
+                         [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,21 @@
 #!/usr/bin/env python3.5
 """Unit tests for readers"""
 
+import gzip
+import os
 import unittest
 import tempfile
 import numpy as np
+from PIL import Image
+from scipy.io import wavfile
 
+from neuralmonkey.readers.image_reader import image_reader
+from neuralmonkey.readers.numpy_reader import get_numpy_reader
+from neuralmonkey.readers.plain_text_reader import (MultiColumnReader,
+                                                    tsv_reader)
+from neuralmonkey.readers.speech_features_reader import (
+    FeatureStore, load_feature_store, save_feature_store,
+    speech_features_reader)
 from neuralmonkey.readers.string_vector_reader import get_string_vector_reader
 
 STRING_INTS = """
@@ -90,11 +101,238 @@ class TestStringVectorReader(unittest.TestCase):
         for comp in equals:
             self.assertTrue(comp)
 
+        # the total number of the numbers in a chunk is right
+        wrong_line = _make_file("1 2 3\n4 5\n6 7 8 9\n")
+        with self.assertRaisesRegex(ValueError,
+                                    r"columns \(2\) on line 2,"):
+            r = get_string_vector_reader(np.int32, columns=3)
+            list(r([wrong_line.name]))
+        wrong_line.close()
+
+    def test_chunks(self):
+        r = get_string_vector_reader(np.int32, chunk_size=2)
+        ints = list(r([self.tmpfile_ints.name]))
+        self.assertEqual(len(ints), len(LIST_INTS))
+        for read, expected in zip(ints, LIST_INTS):
+            self.assertTrue(np.array_equal(read, expected))
+
+        # the lines are numbered across the chunks
+        wrong_line = _make_file(STRING_INTS_FINE + "1 2\n")
+        with self.assertRaisesRegex(ValueError,
+                                    r"columns \(2\) on line 5,"):
+            r = get_string_vector_reader(np.int32, columns=3, chunk_size=2)
+            list(r([wrong_line.name]))
+        wrong_line.close()
+
+    def test_gzip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "floats.txt.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f_data:
+                f_data.write(STRING_FLOATS)
+
+            floats = list(get_string_vector_reader(np.float32)([path]))
+            self.assertEqual(len(floats), len(LIST_FLOATS))
+            for read, expected in zip(floats, LIST_FLOATS):
+                self.assertTrue(np.array_equal(read, expected))
+
     def tearDown(self):
         self.tmpfile_ints.close()
         self.tmpfile_floats.close()
         self.tmpfile_ints_fine.close()
 
 
+class TestMultiColumnReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpfile = _make_file("a b\tx\t1\nc\ty z\t0\nd\n")
+
+    def test_columns(self):
+        reader = MultiColumnReader()
+        for column in range(1, 4):
+            self.assertEqual(list(reader.column(column)([self.tmpfile.name])),
+                             list(tsv_reader(column)([self.tmpfile.name])))
+
+        rows = list(reader.rows([self.tmpfile.name]))
+        self.assertEqual(rows, [[["a", "b"], ["x"], ["1"]],
+                                [["c"], ["y", "z"], ["0"]],
+                                [["d"]]])
+        self.assertEqual(reader.select(rows[2], 2), [])
+
+    def tearDown(self):
+        self.tmpfile.close()
+
+
+class TestNumpyReader(unittest.TestCase):
+
+    def test_concatenation(self):
+        arrays = [np.arange(12).reshape([4, 3]),
+                  np.arange(12, 18).reshape([2, 3]),
+                  np.arange(18, 27).reshape([3, 3])]
+        expected = np.concatenate(arrays)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i, array in enumerate(arrays):
+                paths.append(os.path.join(tmp_dir, "{}.npy".format(i)))
+                np.save(paths[-1], array)
+
+            for mmap_mode in [None, "r"]:
+                data = get_numpy_reader(mmap_mode)(paths)
+                self.assertEqual(len(data), 9)
+                self.assertEqual(data.shape, (9, 3))
+                self.assertTrue(np.array_equal(data[5], expected[5]))
+                self.assertTrue(np.array_equal(data[-1], expected[-1]))
+
+                indices = np.array([8, 0, 4, 5, 3])
+                self.assertTrue(np.array_equal(data[indices],
+                                               expected[indices]))
+                self.assertTrue(np.array_equal(data[2:7], expected[2:7]))
+                self.assertTrue(np.array_equal(np.array(list(data)),
+                                               expected))
+                del data
+
+            single = get_numpy_reader("r")(paths[:1])
+            self.assertIsInstance(single, np.memmap)
+            del single
+
+
+class TestImageReader(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # pylint: enable=consider-using-with
+        self.list_file = os.path.join(self.tmp_dir.name, "images.txt")
+
+        random = np.random.RandomState(0)
+        with open(self.list_file, "w", encoding="utf-8") as f_list:
+            for i, (width, height) in enumerate(
+                    [(60, 40), (30, 70), (50, 50), (45, 20)]):
+                name = "image{}.{}".format(i, "png" if i % 2 else "jpg")
+                pixels = random.randint(0, 256, size=(height, width, 3))
+                Image.fromarray(pixels.astype(np.uint8)).save(
+                    os.path.join(self.tmp_dir.name, name))
+                print(name, file=f_list)
+
+    def test_threads_and_cache(self):
+        kwargs = {"prefix": self.tmp_dir.name, "pad_w": 32, "pad_h": 24,
+                  "rescale_w": True, "rescale_h": True,
+                  "keep_aspect_ratio": True}
+        images = list(image_reader(**kwargs)([self.list_file]))
+        self.assertEqual(images[0].shape, (24, 32, 3))
+        self.assertEqual(images[0].dtype, np.float32)
+
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        for _ in range(2):
+            reader = image_reader(num_threads=3, cache_dir=cache_dir,
+                                  **kwargs)
+            for _ in range(2):
+                read_images = list(reader([self.list_file]))
+                self.assertEqual(len(read_images), len(images))
+                for image, read_image in zip(images, read_images):
+                    self.assertTrue(np.array_equal(image, read_image))
+
+        uint8_images = list(image_reader(dtype="uint8", **kwargs)(
+            [self.list_file]))
+        self.assertEqual(uint8_images[0].dtype, np.uint8)
+
+    def test_shared_cache(self):
+        kwargs = {"prefix": self.tmp_dir.name, "pad_w": 32, "pad_h": 24,
+                  "rescale_w": True, "rescale_h": True}
+        with open(self.list_file, encoding="utf-8") as f_list:
+            names = f_list.read().split()
+
+        # two readers with the same parameters share the cache directory
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        readers = [image_reader(cache_dir=cache_dir, **kwargs)
+                   for _ in range(2)]
+        list_files = []
+        for i, reader_names in enumerate([names[:2], names[2:]]):
+            list_files.append(os.path.join(self.tmp_dir.name,
+                                           "part{}.txt".format(i)))
+            with open(list_files[-1], "w", encoding="utf-8") as f_list:
+                print("\n".join(reader_names), file=f_list)
+
+        for _ in range(2):
+            for reader, list_file in zip(readers, list_files):
+                expected = list(image_reader(**kwargs)([list_file]))
+                read_images = list(reader([list_file]))
+                for image, read_image in zip(expected, read_images):
+                    self.assertTrue(np.array_equal(image, read_image))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class TestSpeechFeaturesReader(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # pylint: enable=consider-using-with
+        self.list_file = os.path.join(self.tmp_dir.name, "audio.txt")
+
+        with open(self.list_file, "w", encoding="utf-8") as f_list:
+            for i, duration in enumerate([0.3, 0.5, 0.2]):
+                name = "audio{}.wav".format(i)
+                self._write_wav(name, duration)
+                print(name, file=f_list)
+
+    def _write_wav(self, name, duration, rate=16000):
+        random = np.random.RandomState(len(name))
+        samples = random.randint(-10000, 10000, size=int(duration * rate))
+        wavfile.write(os.path.join(self.tmp_dir.name, name), rate,
+                      samples.astype(np.int16))
+
+    def _assert_features_equal(self, features, expected):
+        self.assertEqual(len(features), len(expected))
+        for matrix, expected_matrix in zip(features, expected):
+            self.assertTrue(np.allclose(matrix, expected_matrix))
+
+    def test_feature_store(self):
+        features = [np.random.rand(length, 4).astype(np.float32)
+                    for length in [3, 0, 5]]
+        directory = os.path.join(self.tmp_dir.name, "store")
+        os.makedirs(directory)
+
+        self.assertEqual(save_feature_store(features, directory), 3)
+        store = load_feature_store(directory)
+        self.assertIsInstance(store, FeatureStore)
+        self._assert_features_equal(store, features)
+        self.assertEqual(store[1].shape, (0, 4))
+        self._assert_features_equal(store[-2:], features[-2:])
+        with self.assertRaises(IndexError):
+            store[3]  # pylint: disable=pointless-statement
+
+    def test_store_and_workers(self):
+        kwargs = {"prefix": self.tmp_dir.name, "feature_type": "mfcc"}
+        features = list(speech_features_reader(**kwargs)([self.list_file]))
+        self.assertEqual([matrix.shape[1] for matrix in features], [13] * 3)
+        self.assertEqual(features[0].dtype, np.float32)
+
+        parallel = speech_features_reader(num_workers=2, **kwargs)
+        self._assert_features_equal(list(parallel([self.list_file])),
+                                    features)
+
+        store_dir = os.path.join(self.tmp_dir.name, "stores")
+        for _ in range(2):
+            reader = speech_features_reader(num_workers=2,
+                                            store_dir=store_dir, **kwargs)
+            stored = reader([self.list_file])
+            self.assertIsInstance(stored, FeatureStore)
+            self._assert_features_equal(stored, features)
+            self.assertEqual(len(os.listdir(store_dir)), 1)
+
+        # a changed audio file invalidates the store
+        self._write_wav("audio1.wav", 0.4)
+        stored = reader([self.list_file])
+        self.assertEqual(len(os.listdir(store_dir)), 2)
+        self.assertLess(len(stored[1]), len(features[1]))
+        self._assert_features_equal(stored[::2], features[::2])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3.5
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from neuralmonkey.dataset import load_dataset_from_files
+from neuralmonkey.fingerprint import FingerprintError, fingerprint
+from neuralmonkey.series_cache import SeriesCache
+
+
+def _reverse(sentence):
+    return list(reversed(sentence))
+
+
+def _lengths(sentence):
+    return {"length": len(sentence)}
+
+
+class _Slotted(object):
+    __slots__ = ["value"]
+
+    def __init__(self):
+        self.value = 1
+
+    def __call__(self, sentence):
+        return sentence
+
+
+def _source_lengths(dataset):
+    return [len(sentence) for sentence in dataset.get_series("source")]
+
+
+class TestSeriesCache(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # pylint: enable=consider-using-with
+        self.data_path = os.path.join(self.tmp_dir.name, "data.txt")
+        with open(self.data_path, "w", encoding="utf-8") as f_data:
+            for i in range(25):
+                print(" ".join(str(j) for j in range(i % 7)), file=f_data)
+        self.cache = SeriesCache(os.path.join(self.tmp_dir.name, "cache"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint(_reverse), fingerprint(_reverse))
+        self.assertNotEqual(fingerprint(_reverse), fingerprint(_lengths))
+        self.assertEqual(fingerprint({"b": 1, "a": [2, 3]}),
+                         fingerprint({"a": [2, 3], "b": 1}))
+
+    def test_fingerprint_arrays(self):
+        array = np.zeros(10000)
+        changed = array.copy()
+        changed[5000] = 1.
+        self.assertEqual(fingerprint(array), fingerprint(array.copy()))
+        self.assertNotEqual(fingerprint(array), fingerprint(changed))
+        self.assertNotEqual(fingerprint(array),
+                            fingerprint(array.astype(np.float32)))
+        self.assertNotEqual(fingerprint(array),
+                            fingerprint(array.reshape([100, 100])))
+
+    def test_no_fingerprint(self):
+        with self.assertRaises(FingerprintError):
+            fingerprint(_Slotted())
+        self.assertIsNone(self.cache.key([self.data_path], _Slotted()))
+
+    def test_in_memory(self):
+        def load():
+            return load_dataset_from_files(
+                s_source=self.data_path, cache=self.cache,
+                preprocessors=[("source", "reversed", _reverse),
+                               ("source", "lengths", _lengths)])
+
+        dataset = load()
+        self.assertEqual(len(self.cache.entries()), 2)
+
+        cached = load()
+        self.assertEqual(len(self.cache.entries()), 2)
+        for series_id in ["reversed", "lengths"]:
+            self.assertEqual(list(dataset.get_series(series_id)),
+                             list(cached.get_series(series_id)))
+
+    def test_lazy(self):
+        dataset = load_dataset_from_files(
+            s_source=self.data_path, lazy=True, cache=self.cache,
+            preprocessors=[("source", "reversed", _reverse)],
+            shuffle_buffer_size=5, shuffle_chunk_size=4)
+
+        for _ in range(2):
+            dataset.shuffle()
+            pairs = list(zip(dataset.get_series("source"),
+                             dataset.get_series("reversed")))
+            self.assertEqual(len(pairs), 25)
+            for source, target in pairs:
+                self.assertEqual(_reverse(source), target)
+        self.assertEqual(len(self.cache.entries()), 1)
+
+        view = dataset.from_offset(20)
+        self.assertEqual([_reverse(s) for s in view.get_series("source")],
+                         list(view.get_series("reversed")))
+
+    def test_invalidation_and_purge(self):
+        preprocessors = [("source", "reversed", _reverse)]
+        load_dataset_from_files(s_source=self.data_path, cache=self.cache,
+                                preprocessors=preprocessors)
+
+        with open(self.data_path, "a", encoding="utf-8") as f_data:
+            print("new line", file=f_data)
+
+        dataset = load_dataset_from_files(
+            s_source=self.data_path, cache=self.cache,
+            preprocessors=preprocessors)
+        self.assertEqual(list(dataset.get_series("reversed"))[-1],
+                         ["line", "new"])
+        self.assertEqual(len(self.cache.entries()), 2)
+
+        self.cache.purge([self.cache.entries()[0]["key"]])
+        self.assertEqual(len(self.cache.entries()), 1)
+        self.cache.purge()
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_length_filter(self):
+        # the limits change the examples which are preprocessed
+        for limits in [{"max_len_source": 3}, {"min_len_source": 2}, {},
+                       {"max_len_source": 3}]:
+            dataset = load_dataset_from_files(
+                s_source=self.data_path, cache=self.cache,
+                preprocessors=[("source", "reversed", _reverse)],
+                pre_lengths=_source_lengths, **limits)
+
+            source = list(dataset.get_series("source"))
+            self.assertEqual(len(dataset), sum(
+                limits.get("min_len_source", 0) <= i % 7
+                <= limits.get("max_len_source", 6) for i in range(25)))
+            self.assertEqual(list(dataset.get_series("reversed")),
+                             [_reverse(sentence) for sentence in source])
+            self.assertEqual(list(dataset.get_series("lengths")),
+                             _source_lengths(dataset))
+
+    def test_errors(self):
+        calls = []
+
+        def failing():
+            calls.append(True)
+            yield [1]
+            raise ValueError("preprocessing failed")
+
+        with self.assertRaisesRegex(ValueError, "preprocessing failed"):
+            self.cache.cached("failing", failing)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.entries(), [])
+
+        # the items which cannot be stored are computed again
+        unpicklable = [lambda: 0, lambda: 1]
+        series = self.cache.cached("unpicklable", lambda: iter(unpicklable))
+        self.assertEqual(list(series), unpicklable)
+        self.assertEqual(self.cache.entries(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
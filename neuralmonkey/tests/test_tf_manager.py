@@ -0,0 +1,38 @@
+#!/usr/bin/env python3.5
+
+import unittest
+
+from neuralmonkey.tf_manager import _prefetch_feed_dicts
+
+
+class _Stopped(BaseException):
+    pass
+
+
+def _batches(stop):
+    yield "first"
+    yield "second"
+    raise stop
+
+
+class TestPrefetching(unittest.TestCase):
+
+    def test_reading_error(self):
+        batches = _prefetch_feed_dicts(_batches(ValueError("reading")),
+                                       set(), False, 1)
+        self.assertEqual(next(batches), ("first", {}))
+        self.assertEqual(next(batches), ("second", {}))
+        with self.assertRaises(ValueError):
+            next(batches)
+
+    def test_dead_thread(self):
+        # the thread stops without putting the error to the queue
+        batches = _prefetch_feed_dicts(_batches(_Stopped()), set(), False, 1)
+        self.assertEqual(next(batches), ("first", {}))
+        self.assertEqual(next(batches), ("second", {}))
+        with self.assertRaises(RuntimeError):
+            next(batches)
+
+
+if __name__ == "__main__":
+    unittest.main()
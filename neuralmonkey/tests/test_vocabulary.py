@@ -1,8 +1,14 @@
 #!/usr/bin/env python3.5
 
+import os
+import tempfile
 import unittest
 
-from neuralmonkey.vocabulary import Vocabulary
+import numpy as np
+
+from neuralmonkey.dataset import Dataset
+from neuralmonkey.vocabulary import (Vocabulary, from_binary, from_dataset,
+                                     from_wordlist)
 
 CORPUS = [
     "the colorless ideas slept furiously",
@@ -31,10 +37,63 @@ class TestVocabulary(unittest.TestCase):
         self.assertFalse("jindrisek" in VOCABULARY)
 
     def test_padding(self):
-        pass
+        vectors, _ = VOCABULARY.sentences_to_tensor(TOKENIZED_CORPUS, 10,
+                                                    add_end_symbol=True)
+        self.assertEqual(vectors.shape, (10, len(TOKENIZED_CORPUS)))
+
+        for sentence, column in zip(TOKENIZED_CORPUS, vectors.T):
+            self.assertEqual(column[len(sentence)],
+                             VOCABULARY.get_word_index("</s>"))
+            self.assertTrue(all(column[len(sentence) + 1:] ==
+                                VOCABULARY.get_word_index("<pad>")))
 
     def test_weights(self):
-        pass
+        _, weights = VOCABULARY.sentences_to_tensor(TOKENIZED_CORPUS, 4,
+                                                    pad_to_max_len=False,
+                                                    add_start_symbol=True)
+        self.assertEqual(weights.shape, (5, len(TOKENIZED_CORPUS)))
+
+        for sentence, column in zip(TOKENIZED_CORPUS, weights.T):
+            length = min(len(sentence), 4) + 1
+            self.assertEqual(column.sum(), length)
+            self.assertTrue(all(column[:length] == 1))
+
+    def test_batch_major(self):
+        vectors, weights = VOCABULARY.sentences_to_tensor(
+            TOKENIZED_CORPUS, 4, pad_to_max_len=False, add_start_symbol=True)
+        batch_vectors, batch_weights = VOCABULARY.sentences_to_tensor(
+            TOKENIZED_CORPUS, 4, pad_to_max_len=False, add_start_symbol=True,
+            time_major=False)
+
+        self.assertTrue(np.array_equal(batch_vectors, vectors.T))
+        self.assertTrue(np.array_equal(batch_weights, weights.T))
+        self.assertTrue(batch_vectors.flags["C_CONTIGUOUS"])
+        self.assertTrue(batch_weights.flags["C_CONTIGUOUS"])
+        self.assertEqual(batch_vectors.dtype, np.int32)
+        self.assertEqual(batch_weights.dtype, np.float32)
+
+    def test_unknown_word_index(self):
+        vectors, _ = VOCABULARY.sentences_to_tensor(
+            [["jindrisek", "walrus"]], train_mode=True)
+        self.assertEqual(vectors[0, 0], VOCABULARY.get_word_index("<unk>"))
+        self.assertEqual(vectors[1, 0], VOCABULARY.get_word_index("walrus"))
+
+    def test_unk_sampling(self):
+        vocabulary = Vocabulary(unk_sample_prob=1.0)
+        vocabulary.correct_counts = True
+
+        for sentence in TOKENIZED_CORPUS:
+            vocabulary.add_tokenized_text(sentence)
+
+        vectors, _ = vocabulary.sentences_to_tensor(
+            [["colorless", "walrus"]], train_mode=True)
+        self.assertEqual(vectors[0, 0], vocabulary.get_word_index("<unk>"))
+        self.assertEqual(vectors[1, 0], vocabulary.get_word_index("walrus"))
+
+        vectors, _ = vocabulary.sentences_to_tensor(
+            [["colorless", "walrus"]], train_mode=False)
+        self.assertEqual(vectors[0, 0],
+                         vocabulary.get_word_index("colorless"))
 
     def test_there_and_back_self(self):
         vectors, _ = VOCABULARY.sentences_to_tensor(TOKENIZED_CORPUS, 20,
@@ -46,6 +105,16 @@ class TestVocabulary(unittest.TestCase):
                 zip(TOKENIZED_CORPUS, senteces_again):
             self.assertSequenceEqual(orig_sentence, reconstructed_sentence)
 
+    def test_vectors_to_indices(self):
+        vectors, _ = VOCABULARY.sentences_to_tensor(TOKENIZED_CORPUS, 3,
+                                                    add_end_symbol=True)
+        indices = VOCABULARY.vectors_to_indices(vectors)
+
+        for sentence, sentence_indices in zip(TOKENIZED_CORPUS, indices):
+            self.assertSequenceEqual(
+                [VOCABULARY.get_word_index(word) for word in sentence[:3]],
+                sentence_indices.tolist())
+
     def test_min_freq(self):
 
         vocabulary = Vocabulary()
@@ -59,6 +128,76 @@ class TestVocabulary(unittest.TestCase):
         self.assertTrue("walrus" in vocabulary)
         self.assertFalse("colorless" in vocabulary)
 
+    def test_from_dataset(self):
+        dataset = Dataset("dataset", {"text": TOKENIZED_CORPUS}, {})
+
+        expected = Vocabulary()
+        expected.correct_counts = True
+        for sentence in TOKENIZED_CORPUS:
+            expected.add_tokenized_text(sentence)
+        expected.truncate(12)
+
+        for num_workers in [1, 2]:
+            vocabulary = from_dataset([dataset], ["text"], 12,
+                                      num_workers=num_workers)
+            self.assertEqual(vocabulary.index_to_word,
+                             expected.index_to_word)
+            self.assertEqual(vocabulary.word_count, expected.word_count)
+
+        # the words seen once are deleted in the order they were added
+        self.assertEqual(expected.index_to_word[4:8],
+                         ["the", "slept", "working", "class"])
+
+    def test_binary_vocabulary(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "vocabulary.tsv")
+            VOCABULARY.save_wordlist(path, save_frequencies=True)
+            binary_path = path + ".vocab.bin"
+
+            # the binary copy is stored next to the wordlist
+            parsed = from_wordlist(path, contains_header=False,
+                                   contains_frequencies=False)
+            self.assertTrue(os.path.isfile(binary_path))
+
+            loaded = from_binary(binary_path)
+            self.assertEqual(loaded.index_to_word, parsed.index_to_word)
+            self.assertEqual(loaded.word_to_index, parsed.word_to_index)
+            self.assertEqual(loaded.word_count, parsed.word_count)
+
+            # the binary file is used only with the same wordlist options
+            self.assertIsNone(from_binary(binary_path, {}))
+
+            # a copy older than the wordlist is not used and is replaced
+            os.utime(binary_path, (0, 0))
+            from_wordlist(path, contains_header=False,
+                          contains_frequencies=False)
+            self.assertGreaterEqual(os.path.getmtime(binary_path),
+                                    os.path.getmtime(path))
+
+            # the binary copy of a changed wordlist is replaced even if the
+            # wordlist is older
+            stat = os.stat(binary_path)
+            with open(path, "a", encoding="utf-8") as f_wordlist:
+                f_wordlist.write("newword\n")
+            os.utime(path, (0, 0))
+            self.assertIn("newword", from_wordlist(
+                path, contains_header=False, contains_frequencies=False))
+            self.assertIn("newword", from_binary(binary_path))
+            self.assertNotEqual(os.stat(binary_path).st_size, stat.st_size)
+
+            # a corrupted binary copy is replaced by parsing the wordlist
+            with open(binary_path, "r+b") as f_binary:
+                f_binary.truncate(20)
+            self.assertIn("newword", from_wordlist(
+                path, contains_header=False, contains_frequencies=False))
+            self.assertIn("newword", from_binary(binary_path))
+
+            # with a cache directory, the copy is stored there
+            cache_dir = os.path.join(tmp_dir, "cache")
+            from_wordlist(path, contains_header=False,
+                          contains_frequencies=False, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
     def test_count_fail(self):
 
         vocabulary = Vocabulary()
@@ -6,10 +6,12 @@ variables.
 
 """
 # pylint: disable=unused-import
-from typing import Any, List, Union, Optional, Set
+from typing import Any, List, Union, Optional, Set, Iterable, Iterator, Tuple
 # pylint: enable=unused-import
 
 import os
+import queue
+import threading
 import time
 
 import numpy as np
@@ -26,8 +28,14 @@ from neuralmonkey.runners.base_runner import FeedDict
 # pylint: enable=unused-import
 from neuralmonkey.runners.base_runner import (ExecutionResult,
                                               reduce_execution_results)
+from neuralmonkey.model.model_part import ModelPart
 
+# Seconds after which the prefetching thread checks whether to stop waiting
+# for a free place in the queue
+_PREFETCH_TIMEOUT = 0.1
 
+
+# pylint: disable=too-many-instance-attributes
 class TensorFlowManager(object):
     """Inteface between computational graph, data and TF sessions.
 
@@ -45,7 +53,8 @@ class TensorFlowManager(object):
                  gpu_allow_growth: bool = True,
                  per_process_gpu_memory_fraction: float = 1.0,
                  report_gpu_memory_consumption: bool = False,
-                 enable_tf_debug: bool = False) -> None:
+                 enable_tf_debug: bool = False,
+                 num_prefetch_batches: int = 0) -> None:
         """Initialize a TensorflowManager.
 
         At this moment the graph must already exist. This method initializes
@@ -63,9 +72,19 @@ class TensorFlowManager(object):
             per_process_gpu_memory_fraction: Limit TF memory use.
             report_gpu_memory_consumption: Report overall GPU memory at every
                 logging
+            enable_tf_debug: Wrap the sessions in the TensorFlow debugger.
+            num_prefetch_batches: How many batches ahead should the feed
+                dictionaries be prepared in a background thread while the
+                sessions run. If 0, the feed dictionaries are prepared right
+                before running the sessions.
         """
         check_argument_types()
 
+        if num_prefetch_batches < 0:
+            raise ValueError("The number of prefetched batches must not be "
+                             "negative, was {}".format(num_prefetch_batches))
+        self.num_prefetch_batches = num_prefetch_batches
+
         session_cfg = tf.ConfigProto()
         session_cfg.inter_op_parallelism_threads = num_threads
         session_cfg.intra_op_parallelism_threads = num_threads
@@ -171,7 +190,8 @@ class TensorFlowManager(object):
     def _run_executables(self,
                          batch,
                          executables,
-                         train) -> None:
+                         train,
+                         batch_feed_dict: FeedDict = None) -> None:
         all_feedables = set()  # type: Set[Any]
         all_tensors_to_execute = {}
 
@@ -196,7 +216,10 @@ class TensorFlowManager(object):
             else:
                 tensor_list_lengths.append(0)
 
-        feed_dict = _feed_dicts(batch, all_feedables, train=train)
+        if batch_feed_dict is None:
+            feed_dict = _feed_dicts(batch, all_feedables, train=train)
+        else:
+            feed_dict = batch_feed_dict
 
         for fdict in feed_dicts:
             fdict.update(feed_dict)
@@ -210,7 +233,34 @@ class TensorFlowManager(object):
                 executable.collect_results(
                     [res[executable] for res in session_results])
 
-    # pylint: disable=too-many-locals
+    def prefetch(self,
+                 batches: Iterable[Dataset],
+                 coders: Set[ModelPart],
+                 train: bool = False) -> Iterator[Tuple[Dataset,
+                                                        Optional[FeedDict]]]:
+        """Prepare feed dictionaries for batches in a background thread.
+
+        The batches are read and the feed dictionaries of the coders are
+        created in a separate thread, at most ``num_prefetch_batches`` batches
+        ahead, so the Python preprocessing runs while the sessions execute
+        the graph.
+
+        Arguments:
+            batches: Iterable of batched datasets.
+            coders: Model parts whose feed dictionaries should be prepared.
+            train: Flag whether the feed dictionaries are for training.
+
+        Returns:
+            Generator of pairs of a batch and its feed dictionary. If
+            prefetching is disabled, the feed dictionary is None.
+        """
+        if self.num_prefetch_batches == 0:
+            return ((batch, None) for batch in batches)
+
+        return _prefetch_feed_dicts(batches, coders, train,
+                                    self.num_prefetch_batches)
+
+    # pylint: disable=too-many-locals,too-many-arguments
     def execute(self,
                 dataset: Dataset,
                 execution_scripts,
@@ -218,26 +268,65 @@ class TensorFlowManager(object):
                 compute_losses=True,
                 summaries=True,
                 batch_size=None,
-                log_progress: int = 0) -> List[ExecutionResult]:
+                log_progress: int = 0,
+                feed_dict: FeedDict = None) -> List[ExecutionResult]:
+        """Execute the scripts on the dataset.
+
+        Arguments:
+            dataset: The dataset to execute the scripts on.
+            execution_scripts: Runners or trainers to execute.
+            train: Flag whether the data is fed in the training mode.
+            compute_losses: Flag whether the runners should compute losses.
+            summaries: Flag whether to compute TensorBoard summaries.
+            batch_size: Size of the batches the dataset is split to. If None,
+                the whole dataset is executed at once.
+            log_progress: Log progress every this many seconds.
+            feed_dict: A feed dictionary prepared for the whole dataset (see
+                ``prefetch``). Can only be used if the dataset is not split
+                to batches.
+
+        Returns:
+            Execution results for each of the scripts.
+        """
+        dataset_length = len(dataset)
         if batch_size is None:
-            batch_size = len(dataset)
+            batch_size = dataset_length
         batched_dataset = dataset.batch_dataset(batch_size)
         last_log_time = time.process_time()
 
+        if feed_dict is not None:
+            if batch_size < dataset_length:
+                raise ValueError("A precomputed feed dictionary can be used "
+                                 "only when executing a single batch.")
+            batches = iter([(dataset, feed_dict)])  # type: Iterator
+        elif batch_size >= dataset_length:
+            # there is nothing to prepare while a single batch is executed
+            batches = ((batch, None) for batch in batched_dataset)
+        else:
+            coders = set.union(*[s.all_coders for s in execution_scripts])
+            batches = self.prefetch(batched_dataset, coders, train)
+
         batch_results = [
             [] for _ in execution_scripts]  # type: List[List[ExecutionResult]]
-        for batch_id, batch in enumerate(batched_dataset):
+        for batch_id, (batch, batch_feed_dict) in enumerate(batches):
             if (time.process_time() - last_log_time > log_progress
                     and log_progress > 0):
                 log("Processed {} examples.".format(batch_id * batch_size))
                 last_log_time = time.process_time()
+
+            # scripts sharing a computation (e.g. the beam search runners of
+            # different ranks) start a new one for every batch
+            for script in execution_scripts:
+                script.start_batch()
+
             executables = [s.get_executable(compute_losses=compute_losses,
                                             summaries=summaries,
                                             num_sessions=len(self.sessions))
                            for s in execution_scripts]
 
             while not all(ex.result is not None for ex in executables):
-                self._run_executables(batch, executables, train)
+                self._run_executables(batch, executables, train,
+                                      batch_feed_dict)
 
             for script_list, executable in zip(batch_results, executables):
                 script_list.append(executable.result)
@@ -305,3 +394,64 @@ def _feed_dicts(dataset, coders, train=False):
         res.update(coder.feed_dict(dataset, train=train))
 
     return res
+
+
+def _prefetch_feed_dicts(
+        batches: Iterable[Dataset],
+        coders: Set[ModelPart],
+        train: bool,
+        num_batches: int) -> Iterator[Tuple[Dataset, FeedDict]]:
+    """Read batches and prepare their feed dictionaries in a thread.
+
+    The worker thread puts the batches with their feed dictionaries to
+    a queue bounded by ``num_batches``. Exceptions raised while reading the
+    data are re-raised in the consuming thread, which also fails if the
+    worker thread dies without marking the end of the data. When the
+    consumer stops early (e.g. because of an exception in ``session.run``),
+    the worker stops reading the batches and releases them.
+    """
+    batch_queue = queue.Queue(maxsize=num_batches)  # type: queue.Queue
+    end_of_data = object()
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        """Put an item to the queue, give up if the consumer stopped."""
+        while not stopped.is_set():
+            try:
+                batch_queue.put(item, timeout=_PREFETCH_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker() -> None:
+        # pylint: disable=broad-except
+        try:
+            for batch in batches:
+                if not put((batch, _feed_dicts(batch, coders, train=train))):
+                    return
+        except Exception as exc:
+            put(exc)
+            return
+        put(end_of_data)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            try:
+                item = batch_queue.get(timeout=_PREFETCH_TIMEOUT)
+            except queue.Empty:
+                if not thread.is_alive() and batch_queue.empty():
+                    raise RuntimeError(
+                        "The thread prefetching the batches has died.")
+                continue
+            if item is end_of_data:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        thread.join()
+    finally:
+        stopped.set()
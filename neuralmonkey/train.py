@@ -44,6 +44,7 @@ def create_config() -> Configuration:
                         required=False, default=15)
     config.add_argument("train_start_offset", required=False, default=0)
     config.add_argument("runners_batch_size", required=False, default=None)
+    config.add_argument("batch_max_tokens", required=False, default=None)
     config.add_argument("postprocess")
     config.add_argument("name")
     config.add_argument("random_seed", required=False)
@@ -232,7 +233,8 @@ def _main() -> None:
         postprocess=cfg.model.postprocess,
         train_start_offset=cfg.model.train_start_offset,
         runners_batch_size=cfg.model.runners_batch_size,
-        initial_variables=cfg.model.initial_variables)
+        initial_variables=cfg.model.initial_variables,
+        batch_max_tokens=cfg.model.batch_max_tokens)
 
 
 def main() -> None:
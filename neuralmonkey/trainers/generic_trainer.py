@@ -114,6 +114,9 @@ class GenericTrainer(object):
         gradient_list = self.optimizer.compute_gradients(tensor, self.var_list)
         return gradient_list
 
+    def start_batch(self) -> None:
+        """Prepare the trainer for a new batch; nothing to do here."""
+
     def get_executable(
             self, compute_losses=True, summaries=True,
             num_sessions=1) -> Executable:
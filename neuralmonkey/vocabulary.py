@@ -5,13 +5,17 @@ can be used to obtain a Vocabulary instance.
 """
 # pylint: disable=too-many-lines
 
+import array
 import collections
+import hashlib
+import heapq
+import itertools
 import json
 import os
 import random
 
 # pylint: disable=unused-import
-from typing import List, Optional, Tuple, Dict
+from typing import Any, Iterable, List, Optional, Set, Tuple, Dict, Union
 # pylint: enable=unused-import
 
 import numpy as np
@@ -19,6 +23,8 @@ from typeguard import check_argument_types
 
 from neuralmonkey.logging import log, warn
 from neuralmonkey.dataset import Dataset, LazyDataset
+from neuralmonkey.parallel import parallel_map
+from neuralmonkey.readers.binary_reader import BinarySeries
 
 PAD_TOKEN = "<pad>"
 START_TOKEN = "<s>"
@@ -32,6 +38,14 @@ START_TOKEN_INDEX = 1
 END_TOKEN_INDEX = 2
 UNK_TOKEN_INDEX = 3
 
+# Number of sentences counted at once when creating a vocabulary
+COUNT_CHUNK_SIZE = 10000
+
+# Binary vocabulary files start with this signature
+BINARY_MAGIC = b"NMVOCAB1"
+# Suffix of the binary copies of wordlists
+BINARY_SUFFIX = ".vocab.bin"
+
 
 def _is_special_token(word: str) -> bool:
     """Check whether word is a special token (such as <pad> or <s>).
@@ -57,23 +71,78 @@ def from_file(*args, **kwargs) -> "Vocabulary":
 def from_wordlist(path: str,
                   encoding: str = "utf-8",
                   contains_header: bool = True,
-                  contains_frequencies: bool = True) -> "Vocabulary":
+                  contains_frequencies: bool = True,
+                  cache_dir: Optional[str] = None) -> "Vocabulary":
     """Load a vocabulary from a wordlist.
 
     The file can contain either list of words with no header.
     Or it can contain words and their counts separated
     by tab and a header on the first line.
 
+    The parsed wordlist is stored in the binary format (see
+    ``Vocabulary.save_binary``) next to it, with the ``.vocab.bin`` suffix,
+    or to the cache directory if one is given. When the binary copy is newer
+    than the wordlist and was made from a wordlist of the same size and
+    modification time with the same options, the vocabulary is loaded from
+    it instead of parsing the wordlist again.
+
     Arguments:
         path: The path to the wordlist file
         encoding: The encoding of the merge file (defaults to UTF-8)
         contains_header: if the file have a header on first line
         contains_frequencies: if the file contains frequencies in second column
+        cache_dir: The directory of the binary copies of the wordlists, e.g.
+            when the wordlist directory is read-only. If None (default),
+            the copy is stored next to the wordlist.
 
     Returns:
         The new Vocabulary instance.
     """
+    if cache_dir is None:
+        binary_path = path + BINARY_SUFFIX
+    else:
+        binary_path = os.path.join(cache_dir, "{}-{}{}".format(
+            os.path.basename(path),
+            hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest(),
+            BINARY_SUFFIX))
+
+    # the size and mtime of the wordlist are stored with the copy, so
+    # a wordlist replaced by an older file is not taken from the copy
+    stat = os.stat(path)
+    source = {"encoding": encoding,
+              "contains_header": contains_header,
+              "contains_frequencies": contains_frequencies,
+              "size": stat.st_size,
+              "mtime": stat.st_mtime_ns}
+
+    cached = _load_cached_wordlist(binary_path, source, stat.st_mtime)
+    if cached is not None:
+        return cached
+
+    vocabulary = _parse_wordlist(path, encoding, contains_header,
+                                 contains_frequencies)
+
+    log("Vocabulary from wordlist loaded, containing {} words"
+        .format(len(vocabulary)))
+    vocabulary.log_sample()
+
+    try:
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        vocabulary.save_binary(binary_path, source)
+    except (ValueError, OSError) as exc:
+        warn("Cannot store binary vocabulary {}: {}"
+             .format(binary_path, exc))
+
+    return vocabulary
+
+
+def _parse_wordlist(path: str, encoding: str, contains_header: bool,
+                    contains_frequencies: bool) -> "Vocabulary":
+    """Create a vocabulary from the lines of a wordlist."""
     vocabulary = Vocabulary()
+    empty_lines = []  # type: List[int]
+    tab_lines = []  # type: List[int]
 
     with open(path, encoding=encoding) as wordlist:
         line_number = 1
@@ -86,8 +155,7 @@ def from_wordlist(path: str,
             line = line.strip()
             # check if line is empty
             if not line:
-                warn("Vocabulary file {}:{}: line empty"
-                     .format(path, line_number))
+                empty_lines.append(line_number)
                 line_number += 1
                 continue
 
@@ -100,14 +168,97 @@ def from_wordlist(path: str,
                 vocabulary.add_word(info[0], int(info[1]))
             else:
                 if "\t" in line:
-                    warn("Vocabulary file {}:{}: line contains a tabulator"
-                         .format(path, line_number))
+                    tab_lines.append(line_number)
                 vocabulary.add_word(line)
             line_number += 1
 
-    log("Vocabulary from wordlist loaded, containing {} words"
-        .format(len(vocabulary)))
-    vocabulary.log_sample()
+    if empty_lines:
+        warn("Vocabulary file {}: {} lines empty: {}".format(
+            path, len(empty_lines), _format_line_numbers(empty_lines)))
+    if tab_lines:
+        warn("Vocabulary file {}: {} lines contain a tabulator: {}".format(
+            path, len(tab_lines), _format_line_numbers(tab_lines)))
+
+    return vocabulary
+
+
+def _load_cached_wordlist(binary_path: str, source: Dict[str, Any],
+                          wordlist_mtime: float) -> Optional["Vocabulary"]:
+    """Load the binary copy of a wordlist if it is usable.
+
+    Returns:
+        The vocabulary or None if there is no binary copy newer than the
+        wordlist with the same source, or the copy cannot be read.
+    """
+    if (not os.path.isfile(binary_path)
+            or os.path.getmtime(binary_path) < wordlist_mtime):
+        return None
+
+    try:
+        vocabulary = from_binary(binary_path, source)
+    except (ValueError, OSError) as exc:
+        warn("Cannot load binary vocabulary {}, parsing the wordlist: {}"
+             .format(binary_path, exc))
+        return None
+
+    if vocabulary is not None:
+        log("Vocabulary loaded from binary file {}, containing {} "
+            "words".format(binary_path, len(vocabulary)))
+    return vocabulary
+
+
+def _format_line_numbers(line_numbers: List[int], limit: int = 10) -> str:
+    formatted = ", ".join(str(number) for number in line_numbers[:limit])
+    if len(line_numbers) > limit:
+        formatted += ", ..."
+    return formatted
+
+
+def from_binary(path: str,
+                source: Dict[str, Any] = None) -> Optional["Vocabulary"]:
+    """Load a vocabulary stored by ``Vocabulary.save_binary``.
+
+    The file is read at once and the word indices and counts are created
+    in bulk.
+
+    Arguments:
+        path: The path to the binary file.
+        source: If not None, the vocabulary is loaded only if the file was
+            stored with the same description of its source.
+
+    Returns:
+        The new Vocabulary instance or None if the source does not match.
+    """
+    with open(path, "rb") as f_binary:
+        data = f_binary.read()
+
+    if not data.startswith(BINARY_MAGIC):
+        raise ValueError("File {} is not a binary vocabulary".format(path))
+
+    position = len(BINARY_MAGIC)
+    header_size = int(np.frombuffer(data, dtype="<u4", count=1,
+                                    offset=position)[0])
+    position += 4
+    header = json.loads(data[position:position + header_size].decode("utf-8"))
+    position += header_size
+
+    if source is not None and header.get("source") != source:
+        return None
+
+    size = header["size"]
+    counts = np.frombuffer(data, dtype="<i8", count=size, offset=position)
+    position += 8 * size
+    words = data[position:].decode("utf-8").split("\n")
+
+    if len(words) != size or words[:len(_SPECIAL_TOKENS)] != _SPECIAL_TOKENS:
+        raise ValueError("Binary vocabulary {} is corrupted".format(path))
+
+    vocabulary = Vocabulary()
+    vocabulary.index_to_word = words
+    vocabulary.word_to_index = dict(zip(words, range(size)))
+    vocabulary.word_count = dict(zip(words, counts.tolist()))
+    vocabulary.correct_counts = header["correct_counts"]
+
     return vocabulary
 
 
@@ -144,7 +295,8 @@ def from_nematus_json(path: str, max_size: int = None,
 def from_dataset(datasets: List[Dataset], series_ids: List[str], max_size: int,
                  save_file: str = None, overwrite: bool = False,
                  min_freq: Optional[int] = None,
-                 unk_sample_prob: float = 0.5) -> "Vocabulary":
+                 unk_sample_prob: float = 0.5,
+                 num_workers: int = 1) -> "Vocabulary":
     """Load a vocabulary from a dataset with an option to save it.
 
     Arguments:
@@ -158,15 +310,22 @@ def from_dataset(datasets: List[Dataset], series_ids: List[str], max_size: int,
         min_freq: Do not include words with frequency smaller than this.
         unk_sample_prob: The probability with which to sample unks out of
                          words with frequency 1. Defaults to 0.5.
+        num_workers: The number of processes counting the words. The series
+                     are streamed to them in chunks of sentences.
 
     Returns:
         The new Vocabulary instance.
     """
     check_argument_types()
 
+    if num_workers <= 0:
+        raise ValueError("Number of workers must be positive, was {}"
+                         .format(num_workers))
+
     vocabulary = Vocabulary(unk_sample_prob=unk_sample_prob)
     vocabulary.correct_counts = True
 
+    counts = _OrderedCounter()  # type: _OrderedCounter
     for dataset in datasets:
         if isinstance(dataset, LazyDataset):
             warn("Inferring vocabulary from lazy dataset!")
@@ -178,8 +337,11 @@ def from_dataset(datasets: List[Dataset], series_ids: List[str], max_size: int,
 
             series = dataset.get_series(series_id, allow_none=True)
             if series:
-                vocabulary.add_tokenized_text(
-                    [token for sent in series for token in sent])
+                _count_series(series, counts, num_workers)
+
+    # the words are added in the order they were first seen in the data
+    for word, count in counts.items():
+        vocabulary.add_word(word, count)
 
     vocabulary.truncate(max_size)
 
@@ -201,6 +363,58 @@ def from_dataset(datasets: List[Dataset], series_ids: List[str], max_size: int,
     return vocabulary
 
 
+class _OrderedCounter(collections.Counter, collections.OrderedDict):
+    """Counter remembering the order in which words were first seen."""
+
+    @classmethod
+    def fromkeys(cls, iterable, v=None):
+        """Raise an error, a counter cannot be created from keys only."""
+        raise NotImplementedError(
+            "_OrderedCounter.fromkeys() is undefined. Use "
+            "_OrderedCounter(iterable) instead.")
+
+
+def _count_tokens(sentences: List[List[str]]) -> List[Tuple[str, int]]:
+    """Count the tokens of a chunk of sentences in the order of appearance.
+
+    The counts are returned as a list, which keeps the order when it is
+    sent from a worker process.
+    """
+    counts = _OrderedCounter()  # type: _OrderedCounter
+    counts.update(itertools.chain.from_iterable(sentences))
+    return list(counts.items())
+
+
+def _count_series(series: Iterable[List[str]], counts: _OrderedCounter,
+                  num_workers: int,
+                  chunk_size: int = COUNT_CHUNK_SIZE) -> None:
+    """Add the token counts of a series to a counter.
+
+    The series is read in chunks of sentences, so it is never flattened to
+    a single list of tokens. The chunks can be counted in parallel in the
+    shared worker pool, the counts are merged in the order of the chunks, so
+    the counter keeps the order of the first appearance of the words.
+
+    Arguments:
+        series: The sentences as lists of tokens.
+        counts: The counter to update.
+        num_workers: The number of the counting processes.
+        chunk_size: The number of sentences in a chunk.
+    """
+    iterator = iter(series)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+
+    if num_workers == 1:
+        for chunk in chunks:
+            counts.update(itertools.chain.from_iterable(chunk))
+        return
+
+    # every chunk is counted by a single worker
+    for chunk_counts in parallel_map(_count_tokens, chunks, num_workers,
+                                     chunk_size=1):
+        counts.update(collections.OrderedDict(chunk_counts))
+
+
 def from_bpe(path: str, encoding: str = "utf-8") -> "Vocabulary":
     """Load a vocabulary from Byte-pair encoding merge list.
 
@@ -283,6 +497,18 @@ def initialize_vocabulary(directory: str, name: str,
                         save_file=file_name, overwrite=False)
 
 
+def _sentence_lengths(
+        vectors: Union[List[np.ndarray], np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get batch-major index vectors and the lengths of their sentences."""
+    matrix = np.asarray(vectors).T
+
+    is_end = matrix == END_TOKEN_INDEX
+    lengths = np.where(is_end.any(axis=1), is_end.argmax(axis=1),
+                       matrix.shape[1])
+    return matrix, lengths
+
+
 class Vocabulary(collections.Sized):
 
     def __init__(self, tokenized_text: List[str] = None,
@@ -295,6 +521,8 @@ class Vocabulary(collections.Sized):
         self.word_to_index = {}  # type: Dict[str, int]
         self.index_to_word = []  # type: List[str]
         self.word_count = {}  # type: Dict[str, int]
+        # array copy of index_to_word, created when first needed
+        self._word_array = None  # type: Optional[np.ndarray]
 
         # flag if the word count are in use
         self.correct_counts = False
@@ -339,6 +567,7 @@ class Vocabulary(collections.Sized):
             self.word_to_index[word] = len(self.index_to_word)
             self.index_to_word.append(word)
             self.word_count[word] = 0
+            self._word_array = None
         self.word_count[word] += occurences
 
     def add_tokenized_text(self, tokenized_text: List[str]) -> None:
@@ -403,36 +632,38 @@ class Vocabulary(collections.Sized):
             raise ValueError("The vocabulary does not have correct "
                              "word_counts to use for vocabulary truncate")
 
-        # sort by frequency
-        words_by_freq = sorted(list(self.word_count.keys()),
-                               key=lambda w: self.word_count[w])
-
-        # keep the least frequent words which are not special symbols
+        # delete the least frequent words which are not special symbols
         to_delete = len(self) - size
         if to_delete < 0:
             to_delete = 0
             warn("Actual vocabulary size ({}) is smaller than max_size ({})"
                  .format(len(self), size))
-        words_to_delete = []  # type: List[str]
-        for word in words_by_freq:
-            if len(words_to_delete) == to_delete:
-                break
-            if not _is_special_token(word):
-                words_to_delete.append(word)
-
-        # sort by index ... bigger indices needs to be removed first
-        # to keep the lists propertly shaped
-        delete_words_by_index = sorted(
-            [(w, self.word_to_index[w]) for w in words_to_delete],
-            key=lambda p: -p[1])
-
-        for word, index in delete_words_by_index:
+
+        # the selection is stable, of the words with the same frequency,
+        # the ones added first are deleted first
+        candidates = (word for word in self.index_to_word
+                      if not _is_special_token(word))
+        self._delete_words(set(heapq.nsmallest(
+            to_delete, candidates, key=self.word_count.get)))
+
+    def _delete_words(self, words: Set[str]) -> None:
+        """Delete words from the vocabulary and reindex the other words.
+
+        Arguments:
+            words: The words to delete.
+        """
+        if not words:
+            return
+
+        for word in words:
             del self.word_count[word]
-            del self.index_to_word[index]
+        self.index_to_word = [word for word in self.index_to_word
+                              if word not in words]
 
         self.word_to_index = {}
         for index, word in enumerate(self.index_to_word):
             self.word_to_index[word] = index
+        self._word_array = None
 
     def truncate_by_min_freq(self, min_freq: int) -> None:
         """Truncate the vocabulary only keeping words with a minimum frequency.
@@ -441,15 +672,17 @@ class Vocabulary(collections.Sized):
             min_freq: The minimum frequency of included words.
         """
         if min_freq > 1:
-            # count how many words there are with frequency < min_freq
-            # ignoring special tokens
-            infreq_word_count = sum([1 for w in self.word_count
-                                     if self.word_count[w] < min_freq
-                                     and not _is_special_token(w)])
+            if not self.correct_counts:
+                raise ValueError("The vocabulary does not have correct "
+                                 "word_counts to use for vocabulary truncate")
+
+            # the infrequent words ignoring special tokens
+            infrequent = set(word for word, count in self.word_count.items()
+                             if count < min_freq
+                             and not _is_special_token(word))
             log("Removing {} infrequent (<{}) words from vocabulary".format(
-                infreq_word_count, min_freq))
-            new_size = len(self) - infreq_word_count
-            self.truncate(new_size)
+                len(infrequent), min_freq))
+            self._delete_words(infrequent)
 
     def sentences_to_tensor(
             self,
@@ -458,7 +691,8 @@ class Vocabulary(collections.Sized):
             pad_to_max_len: bool = True,
             train_mode: bool = False,
             add_start_symbol: bool = False,
-            add_end_symbol: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+            add_end_symbol: bool = False,
+            time_major: bool = True) -> Tuple[np.ndarray, np.ndarray]:
         """Generate the tensor representation for the provided sentences.
 
         Arguments:
@@ -479,9 +713,13 @@ class Vocabulary(collections.Sized):
                 than `max_len`. If not, the end token is not added. Unlike
                 `add_start_symbol`, enabling this option **does not alter**
                 the maximum length.
+            time_major: If False, the tensors are batch-major, i.e. their
+                dimensions are swapped.
 
         Returns:
-            A tuple of a sentence tensor and a padding weight vector.
+            A tuple of a sentence tensor and a padding weight vector. Both
+            are C-contiguous, the sentence tensor is of type int32 and the
+            weights of type float32.
 
             The shape of the tensor representing the sentences is either
             `(batch_max_len, batch_size)` or `(batch_max_len+1, batch_size)`,
@@ -493,58 +731,225 @@ class Vocabulary(collections.Sized):
             The shape of the padding vector is the same as of the sentence
             vector.
         """
+        if max_len is not None:
+            sentences = [sent[:max_len] for sent in sentences]
+        lengths = np.array([len(sent) for sent in sentences], dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+
+        indices = self.get_word_indices(
+            [word for sent in sentences for word in sent])
+
+        return self.indices_to_tensor(
+            indices, starts, lengths, max_len, pad_to_max_len, train_mode,
+            add_start_symbol, add_end_symbol, time_major)
+
+    # pylint: disable=too-many-arguments
+    def indices_to_tensor(
+            self,
+            indices: np.ndarray,
+            starts: np.ndarray,
+            lengths: np.ndarray,
+            max_len: int = None,
+            pad_to_max_len: bool = True,
+            train_mode: bool = False,
+            add_start_symbol: bool = False,
+            add_end_symbol: bool = False,
+            time_major: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """Generate the tensor representation of already indexed sentences.
+
+        This is the same as ``sentences_to_tensor``, but the sentences are
+        given as vocabulary indices, e.g. from ``Dataset.get_indexed_series``,
+        so no words are looked up. The unknown tokens are sampled in the
+        train mode as well.
+
+        Arguments:
+            indices: Flat array of the vocabulary indices of the sentences.
+            starts: The positions of the sentences in the flat array.
+            lengths: The lengths of the sentences.
+            max_len: See ``sentences_to_tensor``.
+            pad_to_max_len: See ``sentences_to_tensor``.
+            train_mode: See ``sentences_to_tensor``.
+            add_start_symbol: See ``sentences_to_tensor``.
+            add_end_symbol: See ``sentences_to_tensor``.
+            time_major: See ``sentences_to_tensor``.
+
+        Returns:
+            A tuple of a sentence tensor and a padding weight vector, see
+            ``sentences_to_tensor``.
+        """
+        lengths = np.asarray(lengths)
+        starts = np.asarray(starts)
+
         if pad_to_max_len and max_len is not None:
             batch_max_len = max_len
         else:
-            batch_max_len = max(len(s) for s in sentences)
+            batch_max_len = int(lengths.max()) if lengths.size else 0
             if add_end_symbol:
                 batch_max_len += 1
             if max_len is not None:
                 batch_max_len = min(max_len, batch_max_len)
 
-        word_indices = np.full(
-            [batch_max_len, len(sentences)], self.get_word_index(PAD_TOKEN),
-            dtype=np.int32)
-        weights = np.zeros([batch_max_len, len(sentences)])
+        lengths = np.minimum(lengths, batch_max_len)
+
+        # The matrices are built batch-major (the rows are filled with the
+        # first tokens of the sentences) and transposed at the end if
+        # time-major matrices are requested.
+        positions = np.arange(batch_max_len, dtype=np.int64)
+        mask = positions[np.newaxis, :] < lengths[:, np.newaxis]
+
+        tokens = indices[(starts[:, np.newaxis] + positions)[mask]]
+        if train_mode and self.unk_sample_prob > 0:
+            tokens = self._sample_unks(tokens)
 
-        for i in range(batch_max_len):
-            for j, sent in enumerate(sentences):
-                if i < len(sent):
-                    w_idx = (self.get_unk_sampled_word_index(sent[i])
-                             if train_mode else self.get_word_index(sent[i]))
-                    word_indices[i, j] = w_idx
-                    weights[i, j] = 1
+        word_indices = np.full([len(lengths), batch_max_len],
+                               PAD_TOKEN_INDEX, dtype=np.int32)
+        word_indices[mask] = tokens
+        weights = mask.astype(np.float32)
 
-                elif i == len(sent) and add_end_symbol:
-                    word_indices[i, j] = self.get_word_index(END_TOKEN)
-                    weights[i, j] = 1
+        if add_end_symbol:
+            ended = np.nonzero(lengths < batch_max_len)[0]
+            word_indices[ended, lengths[ended]] = END_TOKEN_INDEX
+            weights[ended, lengths[ended]] = 1
 
         if add_start_symbol:
-            word_indices = np.insert(word_indices, 0,
-                                     self.get_word_index(START_TOKEN), axis=0)
-            weights = np.insert(weights, 0, 1, axis=0)
+            word_indices = np.hstack([
+                np.full([len(lengths), 1], START_TOKEN_INDEX,
+                        dtype=np.int32),
+                word_indices])
+            weights = np.hstack([np.ones([len(lengths), 1],
+                                         dtype=np.float32), weights])
+
+        if not time_major:
+            return word_indices, weights
+        return (np.ascontiguousarray(word_indices.T),
+                np.ascontiguousarray(weights.T))
+    # pylint: enable=too-many-arguments
+
+    def index_series(self, series: Iterable[List[str]]) -> Tuple[np.ndarray,
+                                                                 np.ndarray]:
+        """Convert a tokenized text series to vocabulary indices.
+
+        The indices are not sampled to the unknown token, so they can be
+        reused in every epoch (see ``indices_to_tensor``). The series stored
+        as a ``BinarySeries`` is converted by looking up every distinct token
+        only once.
+
+        Arguments:
+            series: The sentences as lists of tokens.
+
+        Returns:
+            A tuple of a flat int32 array of the indices of all the sentences
+            and an int64 array of the sentence start offsets, followed by the
+            total number of tokens.
+        """
+        if isinstance(series, BinarySeries):
+            table = self.get_word_indices(list(series.tokens))
+            return (table[np.asarray(series.token_ids)],
+                    np.asarray(series.offsets, dtype=np.int64))
+
+        offsets = array.array("q", [0])
+        indices = array.array("i")
+        lookup = self.word_to_index.get
+        for sentence in series:
+            indices.extend(lookup(word, UNK_TOKEN_INDEX)
+                           for word in sentence)
+            offsets.append(len(indices))
+
+        return (np.array(indices, dtype=np.int32),
+                np.array(offsets, dtype=np.int64))
+
+    def get_word_indices(self, words: List[str]) -> np.ndarray:
+        """Return indices of all the specified words.
 
-        return word_indices, weights
+        Arguments:
+            words: The words to look up.
+
+        Returns:
+            A vector of indices of the words. Words not present in the
+            vocabulary get the index of the unknown token.
+        """
+        lookup = self.word_to_index.get
+        return np.fromiter((lookup(word, UNK_TOKEN_INDEX) for word in words),
+                           dtype=np.int32, count=len(words))
+
+    def _sample_unks(self, indices: np.ndarray) -> np.ndarray:
+        """Replace indices of rare words by the unknown token at random.
+
+        This is the vectorized version of ``get_unk_sampled_word_index``,
+        using a single random draw for all the words. The counts are looked
+        up only once for every distinct index. The words missing in the
+        vocabulary are already indexed as the unknown token.
+
+        Arguments:
+            indices: Indices of the words in the vocabulary.
+
+        Returns:
+            A copy of the indices with some of the rare words replaced.
+        """
+        distinct, inverse = np.unique(indices, return_inverse=True)
+        counts = self.word_count.get
+        rare = np.array([counts(self.index_to_word[index], 0) <= 1
+                         for index in distinct], dtype=bool)[inverse]
+        sampled = np.logical_and(
+            rare, np.random.random(len(indices)) < self.unk_sample_prob)
+
+        if not np.any(sampled):
+            return indices
+
+        if not self.correct_counts:
+            raise ValueError("The vocabulary does not have correct "
+                             "word_counts to use with unknown sampling")
+
+        return np.where(sampled, UNK_TOKEN_INDEX, indices).astype(np.int32)
 
-    def vectors_to_sentences(self,
-                             vectors: List[np.ndarray]) -> List[List[str]]:
+    def vectors_to_sentences(
+            self,
+            vectors: Union[List[np.ndarray], np.ndarray]) -> List[List[str]]:
         """Convert vectors of indexes of vocabulary items to lists of words.
 
+        The sentences end before the first end token (or at the end of the
+        vectors if there is none).
+
         Arguments:
-            vectors: List of vectors of vocabulary indices.
+            vectors: Time-major vectors of vocabulary indices, i.e. a list
+                of vectors for every time step or a matrix of shape
+                ``(time, batch)``.
 
         Returns:
             List of lists of words.
         """
-        sentences = [[] for _ in
-                     range(vectors[0].shape[0])]  # type: List[List[str]]
+        matrix, lengths = _sentence_lengths(vectors)
+
+        mask = np.arange(matrix.shape[1]) < lengths[:, np.newaxis]
+        words = self._index_to_word_array()[matrix[mask]].tolist()
+        ends = np.cumsum(lengths).tolist()
+
+        return [words[end - length:end]
+                for end, length in zip(ends, lengths.tolist())]
+
+    @staticmethod
+    def vectors_to_indices(
+            vectors: Union[List[np.ndarray], np.ndarray]) -> List[np.ndarray]:
+        """Split vectors of indexes of vocabulary items to sentences.
+
+        The sentences end as in ``vectors_to_sentences``.
+
+        Arguments:
+            vectors: Time-major vectors of vocabulary indices.
 
-        for vec in vectors:
-            for sentence, word_i in zip(sentences, vec):
-                if not sentence or sentence[-1] != END_TOKEN:
-                    sentence.append(self.index_to_word[word_i])
+        Returns:
+            List of arrays of the vocabulary indices of the sentences.
+        """
+        matrix, lengths = _sentence_lengths(vectors)
+        return [row[:length] for row, length in zip(matrix, lengths)]
 
-        return [s[:-1] if s[-1] == END_TOKEN else s for s in sentences]
+    def _index_to_word_array(self) -> np.ndarray:
+        """Get the words of the vocabulary as an array indexed by ids."""
+        if self._word_array is None:
+            self._word_array = np.empty([len(self.index_to_word)],
+                                        dtype=object)
+            self._word_array[:] = self.index_to_word
+        return self._word_array
 
     def save_wordlist(self, path: str, overwrite: bool = False,
                       save_frequencies: bool = False,
@@ -590,6 +995,42 @@ class Vocabulary(collections.Sized):
 
                 output_file.write("\n")
 
+    def save_binary(self, path: str, source: Dict[str, Any] = None) -> None:
+        """Save the vocabulary in the binary format.
+
+        The file contains a small JSON header, the word counts as an int64
+        array and the words separated by newlines. It is loaded by
+        ``from_binary`` with a single read. The file is written to
+        a temporary file first, so it is never read incomplete.
+
+        Arguments:
+            path: The path to save the file to.
+            source: Description of the source of the vocabulary stored in
+                the header, e.g. the options of the parsed wordlist.
+        """
+        if any("\n" in word for word in self.index_to_word):
+            raise ValueError("Cannot store words containing newlines in "
+                             "a binary vocabulary")
+
+        header = json.dumps({"size": len(self),
+                             "correct_counts": self.correct_counts,
+                             "source": source}).encode("utf-8")
+        counts = np.array([self.word_count[word]
+                           for word in self.index_to_word], dtype="<i8")
+
+        tmp_path = "{}.tmp-{}".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f_binary:
+                f_binary.write(BINARY_MAGIC)
+                f_binary.write(np.array([len(header)], dtype="<u4").tobytes())
+                f_binary.write(header)
+                f_binary.write(counts.tobytes())
+                f_binary.write("\n".join(self.index_to_word).encode("utf-8"))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def log_sample(self, size: int = 5):
         """Log a sample of the vocabulary.
 
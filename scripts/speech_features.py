@@ -13,8 +13,8 @@ from typing import Union
 
 import numpy as np
 
-from neuralmonkey.processors.speech import SpeechFeaturesPreprocessor
-from neuralmonkey.readers.audio_reader import audio_reader
+from neuralmonkey.readers.speech_features_reader import (
+    speech_features_reader)
 
 
 def try_parse_number(str_value: str) -> Union[str, float, int]:
@@ -43,6 +43,9 @@ def main():
     parser.add_argument('-t', '--type',
                         default='mfcc',
                         help='the feature type (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes computing the features '
+                        '(default: %(default)s)')
     parser.add_argument('-o', '--option',
                         nargs=2, action='append', default=[],
                         metavar=('OPTION', 'VALUE'),
@@ -57,11 +60,11 @@ def main():
 
     feats_kwargs = {k: try_parse_number(v) for k, v in args.option}
 
-    read = audio_reader(prefix=prefix, audio_format=args.format)
-    process = SpeechFeaturesPreprocessor(
+    read = speech_features_reader(
+        prefix=prefix, audio_format=args.format, num_workers=args.jobs,
         feature_type=args.type, **feats_kwargs)
 
-    output = [process(audio) for audio in read([args.input])]
+    output = list(read([args.input]))
     
     np.save(args.output, output)
 